@@ -1,11 +1,27 @@
 """Application package for recognition backend."""
 
-from .recognizer import DigitRecognizer, RecognitionResult, DigitComponent
-from .storage import RecognitionStorage
+from .recognizer import DigitRecognizer, RecognitionResult, DigitComponent, PipelineDebug
+from .storage import RecognitionStorage, PipelineDebugStore
+from .cache import RecognitionCache, CachedRecognition
+from .executor import RecognitionExecutor, ExecutorSaturatedError
+from .reloader import ModelReloader, ModelReloadError
+from .admission import AdmissionController, AdmissionRejectedError, RateLimiter, RateLimitedError
 
 __all__ = [
     "DigitRecognizer",
     "RecognitionResult",
     "DigitComponent",
+    "PipelineDebug",
     "RecognitionStorage",
+    "PipelineDebugStore",
+    "RecognitionCache",
+    "CachedRecognition",
+    "RecognitionExecutor",
+    "ExecutorSaturatedError",
+    "ModelReloader",
+    "ModelReloadError",
+    "AdmissionController",
+    "AdmissionRejectedError",
+    "RateLimiter",
+    "RateLimitedError",
 ]
@@ -0,0 +1,225 @@
+"""Per-client rate limiting and prioritized admission of recognition work.
+
+Both run on the event loop thread only, so neither takes a lock.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Optional, Sequence, Tuple
+
+# Highest priority first: a free slot goes to the oldest interactive waiter,
+# then to preview frames, and only then to bulk work.
+LANES = ("interactive", "stream", "bulk")
+# Weight of the newest slot hold time in the running service-time estimate.
+_SERVICE_SMOOTHING = 0.2
+
+
+class RateLimitedError(Exception):
+    """Raised when a client has spent its token bucket."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Terlalu banyak permintaan dari perangkat ini. Coba lagi nanti.")
+        self.retry_after = retry_after
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a lane cannot start the work within its wait budget."""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__("Server sedang sibuk. Coba lagi nanti.")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token bucket per client key.
+
+    Each key holds up to ``burst`` tokens and regains ``rate`` per second; a
+    request spends ``cost`` tokens (capped at ``burst``, so a large batch
+    empties the bucket instead of never fitting). The least recently seen
+    keys are forgotten beyond ``max_keys``, which only ever refills them.
+    ``rate <= 0`` disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10_000):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_keys = max(1, int(max_keys))
+        self.limited = 0
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, key: str, cost: float = 1.0) -> None:
+        """Spend ``cost`` tokens of ``key``; raise RateLimitedError when short."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        cost = min(float(cost), self.burst)
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens < cost:
+            self._remember(key, tokens, now)
+            self.limited += 1
+            raise RateLimitedError(max(1, math.ceil((cost - tokens) / self.rate)))
+        self._remember(key, tokens - cost, now)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "tracked_keys": len(self._buckets),
+            "limited": self.limited,
+        }
+
+    def _remember(self, key: str, tokens: float, now: float) -> None:
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+
+@dataclass
+class _Lane:
+    name: str
+    max_queue: int
+    max_wait_s: float
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+    counts: Dict[str, int] = field(
+        default_factory=lambda: {"admitted": 0, "enqueued": 0, "rejected": 0, "timed_out": 0},
+    )
+
+
+class AdmissionController:
+    """Global cap on in-flight recognitions with priority lanes.
+
+    Work starts at once while fewer than ``max_in_flight`` jobs run;
+    otherwise it waits in its lane. A finished job hands its slot straight
+    to the oldest waiter of the highest-priority non-empty lane, so bulk
+    work only runs when no interactive request is waiting.
+
+    Overload is shed instead of queued: a lane rejects new work when its
+    queue is full or when the estimated wait (jobs ahead of it times the
+    running average hold time, over ``max_in_flight``) already exceeds the
+    lane's ``max_wait_s``, and a waiter still queued after ``max_wait_s``
+    gives up. Admitted requests therefore keep their latency while the
+    excess gets a fast 503 with ``Retry-After``.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queue: Dict[str, int],
+        max_wait_s: Dict[str, float],
+        lanes: Sequence[str] = LANES,
+    ):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._lanes = [_Lane(name, max(0, int(max_queue[name])), float(max_wait_s[name])) for name in lanes]
+        self._by_name = {lane.name: lane for lane in self._lanes}
+        self._in_flight = 0
+        self._service_s: Optional[float] = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def slot(self, lane: str) -> AsyncIterator[float]:
+        """Hold one in-flight slot of ``lane``; yields the seconds spent waiting."""
+        waited = await self.acquire(lane)
+        started = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            self._observe_service(time.perf_counter() - started)
+            self.release()
+
+    async def acquire(self, lane: str) -> float:
+        """Wait for an in-flight slot; raise AdmissionRejectedError when shed."""
+        entry = self._by_name[lane]
+        if self._in_flight < self.max_in_flight:
+            self._in_flight += 1
+            entry.counts["admitted"] += 1
+            return 0.0
+        estimate = self._estimated_wait(entry)
+        if len(entry.waiters) >= entry.max_queue or estimate > entry.max_wait_s:
+            entry.counts["rejected"] += 1
+            raise AdmissionRejectedError(lane, self._retry_after(estimate))
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry.waiters.append(waiter)
+        entry.counts["enqueued"] += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, entry.max_wait_s)
+        except BaseException as exc:
+            granted = waiter.done() and not waiter.cancelled()
+            if granted and isinstance(exc, asyncio.TimeoutError):
+                # The slot arrived as the wait ran out; use it.
+                entry.counts["admitted"] += 1
+                return time.perf_counter() - started
+            if granted:
+                self.release()
+            else:
+                waiter.cancel()
+                if waiter in entry.waiters:
+                    entry.waiters.remove(waiter)
+            if isinstance(exc, asyncio.TimeoutError):
+                entry.counts["timed_out"] += 1
+                raise AdmissionRejectedError(lane, self._retry_after(self._estimated_wait(entry))) from None
+            raise
+        entry.counts["admitted"] += 1
+        return time.perf_counter() - started
+
+    def release(self) -> None:
+        """Give a finished job's slot to the next waiter, or free it."""
+        for entry in self._lanes:
+            while entry.waiters:
+                waiter = entry.waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "service_ms": round(self._service_s * 1000.0, 3) if self._service_s is not None else None,
+            "lanes": {
+                entry.name: {
+                    "max_queue": entry.max_queue,
+                    "max_wait_ms": int(entry.max_wait_s * 1000),
+                    "queued": len(entry.waiters),
+                    **entry.counts,
+                }
+                for entry in self._lanes
+            },
+        }
+
+    def _estimated_wait(self, lane: _Lane) -> float:
+        if self._service_s is None:
+            return 0.0
+        ahead = 0
+        for entry in self._lanes:
+            ahead += len(entry.waiters)
+            if entry is lane:
+                break
+        return (ahead + 1) * self._service_s / self.max_in_flight
+
+    def _observe_service(self, seconds: float) -> None:
+        if self._service_s is None:
+            self._service_s = seconds
+        else:
+            self._service_s += _SERVICE_SMOOTHING * (seconds - self._service_s)
+
+    @staticmethod
+    def _retry_after(estimate: float) -> int:
+        return max(1, math.ceil(estimate))
@@ -0,0 +1,393 @@
+"""Throughput, latency and prediction-agreement benchmark for the pipeline.
+
+Run from ``backend/``::
+
+    python -m app.benchmark --baseline benchmarks/baseline.json
+
+The corpus is generated from a fixed seed, so every run sees the same
+images and the baseline can pin the predictions performance work must keep.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .recognizer import (
+    DigitRecognizer,
+    _decision_scores,
+    _encode_image,
+    _extract_hog,
+    _ingest_image,
+    _crop_stack,
+    _resize_and_center,
+    _robust_preprocessing,
+    _segment_digits,
+    _valid_segments,
+)
+
+DEFAULT_SEED = 20240611
+DEFAULT_SCALES = (1.0, 2.0, 4.0)
+DEFAULT_DIGIT_COUNTS = (1, 3, 6, 10)
+BASELINE_VERSION = 1
+_FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_COMPLEX)
+_PERCENTILES = (50, 95, 99)
+# Peak bytes one crop may allocate once the scratch buffers are warm: the
+# moments dict and the shift matrix, nothing that grows with the patch.
+CROP_ALLOCATION_LIMIT_BYTES = 4096
+
+_scaling_recognizer: Optional[DigitRecognizer] = None
+
+
+@dataclass
+class CorpusImage:
+    name: str
+    image_bytes: bytes
+    digits: str
+    scale: float
+
+
+def generate_corpus(
+    seed: int = DEFAULT_SEED,
+    scales: Sequence[float] = DEFAULT_SCALES,
+    digit_counts: Sequence[int] = DEFAULT_DIGIT_COUNTS,
+    per_cell: int = 2,
+) -> List[CorpusImage]:
+    """Render printed digit strings on noisy, unevenly lit paper."""
+    rng = np.random.default_rng(seed)
+    corpus: List[CorpusImage] = []
+    for scale in scales:
+        for count in digit_counts:
+            for index in range(per_cell):
+                digits = "".join(str(d) for d in rng.integers(0, 10, size=count))
+                image = _render_digits(digits, scale, rng)
+                success, buffer = cv2.imencode(".png", image)
+                if not success:
+                    raise RuntimeError("Gagal membuat gambar korpus benchmark")
+                name = f"s{scale:g}_n{count}_{index}"
+                corpus.append(CorpusImage(name, buffer.tobytes(), digits, float(scale)))
+    return corpus
+
+
+def _render_digits(digits: str, scale: float, rng: np.random.Generator) -> np.ndarray:
+    step = int(45 * scale)
+    height = int(70 * scale)
+    width = step * len(digits) + int(40 * scale)
+    paper = int(rng.integers(180, 240))
+    gradient = np.linspace(-20, 20, width)[None, :, None]
+    image = np.clip(paper + gradient + rng.normal(0, 6, (height, width, 3)), 0, 255).astype(np.uint8)
+    font = _FONTS[int(rng.integers(len(_FONTS)))]
+    thickness = max(2, int(round(scale * 2)))
+    x = int(20 * scale)
+    for digit in digits:
+        y = int(height * 0.72 + rng.integers(-4, 5) * scale)
+        ink = int(rng.integers(10, 60))
+        cv2.putText(image, digit, (x, y), font, scale * 1.3, (ink, ink, ink), thickness, cv2.LINE_AA)
+        x += step
+    return image
+
+
+def run_benchmark(
+    recognizer: DigitRecognizer,
+    corpus: Sequence[CorpusImage],
+    repeats: int = 3,
+    warmup: int = 1,
+) -> dict:
+    recognizer.ensure_ready()
+    for item in corpus[:warmup]:
+        recognizer.predict(item.image_bytes, detail="none")
+
+    latencies: List[float] = []
+    groups: Dict[str, List[float]] = {}
+    predictions: Dict[str, str] = {}
+    digits_seen = 0
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for item in corpus:
+            begin = time.perf_counter()
+            result = recognizer.predict(item.image_bytes, detail="none")
+            elapsed = (time.perf_counter() - begin) * 1000.0
+            latencies.append(elapsed)
+            groups.setdefault(f"scale={item.scale:g},digits={len(item.digits)}", []).append(elapsed)
+            predictions[item.name] = result.prediction
+            digits_seen += len(result.digits)
+    wall_s = time.perf_counter() - started
+
+    exact = sum(predictions[item.name] == item.digits for item in corpus)
+    return {
+        "images": len(corpus),
+        "repeats": repeats,
+        "scoring_backend": recognizer.scoring_backend,
+        "hog_backend": recognizer.hog_backend,
+        "artifact_id": recognizer.artifact_id,
+        "throughput": {
+            "images_per_s": round(len(latencies) / wall_s, 2) if wall_s else None,
+            "digits_per_s": round(digits_seen / wall_s, 2) if wall_s else None,
+        },
+        "latency_ms": _summarize(latencies),
+        "latency_ms_by_group": {key: _summarize(values) for key, values in sorted(groups.items())},
+        "stages_ms": _benchmark_stages(recognizer, corpus),
+        "exact_match": round(exact / len(corpus), 4) if corpus else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "predictions": predictions,
+    }
+
+
+def measure_scaling(
+    recognizer: DigitRecognizer,
+    corpus: Sequence[CorpusImage],
+    process_counts: Sequence[int],
+    repeats: int = 1,
+) -> List[dict]:
+    """Throughput of the same workload spread over N forked processes.
+
+    The model is loaded before forking, as ``app.serve`` does, and OpenCV
+    runs single-threaded in each process so the numbers reflect scaling
+    across cores rather than inside one request.
+    """
+    global _scaling_recognizer
+    recognizer.ensure_ready()
+    _scaling_recognizer = recognizer
+    payloads = [item.image_bytes for item in corpus] * repeats
+    context = multiprocessing.get_context("fork")
+    results: List[dict] = []
+    for count in process_counts:
+        with context.Pool(count, initializer=cv2.setNumThreads, initargs=(1,)) as pool:
+            pool.map(_predict_digits, payloads[:count], chunksize=1)
+            started = time.perf_counter()
+            pool.map(_predict_digits, payloads, chunksize=1)
+            wall_s = time.perf_counter() - started
+        results.append({"processes": count, "images_per_s": round(len(payloads) / wall_s, 2)})
+    base = results[0]["images_per_s"] / process_counts[0] if results else 0.0
+    for entry in results:
+        entry["speedup"] = round(entry["images_per_s"] / base, 2) if base else None
+        entry["efficiency"] = round(entry["images_per_s"] / (base * entry["processes"]), 2) if base else None
+    return results
+
+
+def _predict_digits(image_bytes: bytes) -> int:
+    return len(_scaling_recognizer.predict(image_bytes, detail="none").digits)
+
+
+def _benchmark_stages(recognizer: DigitRecognizer, corpus: Sequence[CorpusImage]) -> dict:
+    """Time each pipeline stage in isolation on every corpus image."""
+    samples: Dict[str, List[float]] = {}
+
+    def measure(stage: str, func: Callable[[], object]):
+        begin = time.perf_counter()
+        value = func()
+        samples.setdefault(stage, []).append((time.perf_counter() - begin) * 1000.0)
+        return value
+
+    for item in corpus:
+        ingested = measure("decode", lambda: _ingest_image(item.image_bytes))
+        preprocessed, _ = measure("preprocess", lambda: _robust_preprocessing(ingested["gray"]))
+        segments, _, crop_stack = measure("segment", lambda: _segment_digits(preprocessed))
+        measure("segment_reference", lambda: _segment_digits(preprocessed, ownership="reference"))
+        crops = [entry["crop"] for _, entry in _valid_segments(segments)]
+        if crops:
+            features = measure(
+                "hog_reference",
+                lambda: np.vstack([_extract_hog(crop, recognizer._hog_params) for crop in crops]),
+            )
+            if recognizer._hog_extractor is not None:
+                measure("hog_vectorized", lambda: recognizer._hog_extractor.extract(crop_stack))
+            measure(
+                "score",
+                lambda: _decision_scores(
+                    recognizer._scoring_model,
+                    recognizer._scoring_scaler.transform(features),
+                ),
+            )
+        measure("encode_png", lambda: _encode_image(preprocessed))
+    return {stage: _summarize(values) for stage, values in samples.items()}
+
+
+def check_segmentation_parity(corpus: Sequence[CorpusImage]) -> dict:
+    """Compare crops from the ownership map with the per-contour reference."""
+    mismatches: List[str] = []
+    for item in corpus:
+        ingested = _ingest_image(item.image_bytes)
+        preprocessed, _ = _robust_preprocessing(ingested["gray"])
+        fast, _, _ = _segment_digits(preprocessed)
+        reference, _, _ = _segment_digits(preprocessed, ownership="reference")
+        same = len(fast) == len(reference) and all(
+            a["bbox"] == b["bbox"] and np.array_equal(a["crop"], b["crop"])
+            for a, b in zip(fast, reference)
+        )
+        if not same:
+            mismatches.append(item.name)
+    return {"compared": len(corpus), "mismatches": mismatches}
+
+
+def check_crop_allocations(corpus: Sequence[CorpusImage]) -> dict:
+    """Peak memory each digit crop allocates while filling a crop stack.
+
+    Every contour patch of the corpus is cut once to size the per-thread
+    scratch, then again under tracemalloc; a temporary that scales with the
+    patch (a float copy, a fresh canvas) pushes the peak past the limit.
+    """
+    patches = []
+    for item in corpus:
+        preprocessed, _ = _robust_preprocessing(_ingest_image(item.image_bytes)["gray"])
+        segments, _, _ = _segment_digits(preprocessed)
+        patches.extend(preprocessed[y : y + h, x : x + w] for x, y, w, h in (entry["bbox"] for entry in segments))
+    stack = _crop_stack(len(patches))
+    for patch, row in zip(patches, stack):
+        _resize_and_center(patch, out=row)
+    peaks: List[int] = []
+    tracemalloc.start()
+    try:
+        for patch, row in zip(patches, stack):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            _resize_and_center(patch, out=row)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return {
+        "crops": len(peaks),
+        "max_bytes": max(peaks, default=0),
+        "limit_bytes": CROP_ALLOCATION_LIMIT_BYTES,
+        "over_limit": sum(peak > CROP_ALLOCATION_LIMIT_BYTES for peak in peaks),
+    }
+
+
+def _summarize(values: Sequence[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    data = np.asarray(values, dtype=np.float64)
+    summary = {"count": int(data.size), "mean": round(float(data.mean()), 3)}
+    for pct, value in zip(_PERCENTILES, np.percentile(data, _PERCENTILES)):
+        summary[f"p{pct}"] = round(float(value), 3)
+    return summary
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def compare_with_baseline(predictions: Dict[str, str], baseline: dict) -> dict:
+    expected = baseline.get("predictions", {})
+    shared = sorted(set(expected) & set(predictions))
+    mismatches = [
+        {"name": name, "baseline": expected[name], "current": predictions[name]}
+        for name in shared
+        if expected[name] != predictions[name]
+    ]
+    return {
+        "compared": len(shared),
+        "missing": sorted(set(expected) - set(predictions)),
+        "agreement": round(1.0 - len(mismatches) / len(shared), 4) if shared else None,
+        "mismatches": mismatches,
+    }
+
+
+def _corpus_config(args: argparse.Namespace) -> dict:
+    return {
+        "seed": args.seed,
+        "scales": list(args.scales),
+        "digit_counts": list(args.digit_counts),
+        "per_cell": args.per_cell,
+    }
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Path ke artifact .joblib (default: MODEL_PATH).")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--scales", type=float, nargs="+", default=list(DEFAULT_SCALES))
+    parser.add_argument("--digit-counts", type=int, nargs="+", default=list(DEFAULT_DIGIT_COUNTS))
+    parser.add_argument("--per-cell", type=int, default=2, help="Gambar per kombinasi skala/jumlah digit.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, help="File baseline prediksi untuk dicek.")
+    parser.add_argument("--update-baseline", action="store_true", help="Tulis ulang baseline dari run ini.")
+    parser.add_argument("--min-agreement", type=float, default=1.0)
+    parser.add_argument("--output", type=Path, help="Simpan laporan lengkap sebagai JSON.")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        nargs="+",
+        help="Ukur throughput dengan sejumlah proses worker, mis. --processes 1 2 4 8.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parse_args(argv)
+    config = _corpus_config(args)
+    corpus = generate_corpus(**config)
+    recognizer = DigitRecognizer(model_path=args.model)
+    report = run_benchmark(recognizer, corpus, repeats=args.repeats, warmup=args.warmup)
+    report["corpus"] = config
+    report["segmentation_parity"] = check_segmentation_parity(corpus)
+    report["crop_allocations"] = check_crop_allocations(corpus)
+    if args.processes:
+        report["scaling"] = measure_scaling(recognizer, corpus, args.processes, repeats=args.repeats)
+
+    status = 1 if report["segmentation_parity"]["mismatches"] or report["crop_allocations"]["over_limit"] else 0
+    if args.baseline is not None and args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        baseline = {
+            "version": BASELINE_VERSION,
+            "corpus": config,
+            "artifact_id": report["artifact_id"],
+            "predictions": report["predictions"],
+        }
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    elif args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("corpus") != config:
+            print("Konfigurasi korpus berbeda dari baseline; jalankan dengan parameter yang sama.", file=sys.stderr)
+            return 2
+        report["baseline"] = compare_with_baseline(report["predictions"], baseline)
+        agreement = report["baseline"]["agreement"]
+        if agreement is None or agreement < args.min_agreement or report["baseline"]["missing"]:
+            status = 1
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    _print_report(report)
+    return status
+
+
+def _print_report(report: dict) -> None:
+    latency = report["latency_ms"]
+    print(f"images: {report['images']} x {report['repeats']} repeats "
+          f"(scoring={report['scoring_backend']}, hog={report['hog_backend']})")
+    print(f"throughput: {report['throughput']['images_per_s']} images/s, "
+          f"{report['throughput']['digits_per_s']} digits/s")
+    print(f"latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+    for stage, summary in report["stages_ms"].items():
+        print(f"  {stage:<16} p50={summary['p50']} p95={summary['p95']} p99={summary['p99']}")
+    print(f"exact match vs generated labels: {report['exact_match']}")
+    parity = report["segmentation_parity"]
+    print(f"segmentation parity: {parity['compared'] - len(parity['mismatches'])}/{parity['compared']} identical")
+    allocations = report["crop_allocations"]
+    print(f"crop allocations: max {allocations['max_bytes']} B per crop over {allocations['crops']} crops "
+          f"(limit {allocations['limit_bytes']} B)")
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+    for entry in report.get("scaling", []):
+        print(f"  {entry['processes']:>3} processes: {entry['images_per_s']} images/s "
+              f"(speedup {entry['speedup']}x, efficiency {entry['efficiency']})")
+    baseline = report.get("baseline")
+    if baseline is not None:
+        print(f"baseline agreement: {baseline['agreement']} over {baseline['compared']} images")
+        for mismatch in baseline["mismatches"]:
+            print(f"  {mismatch['name']}: {mismatch['baseline']} -> {mismatch['current']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
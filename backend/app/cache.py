@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .recognizer import RecognitionResult
+from .responses import dump_json
+
+
+@dataclass
+class CachedRecognition:
+    result: RecognitionResult
+    recognition_id: str
+    image_url: Optional[str]
+
+    def to_dict(self) -> dict:
+        return {
+            "result": self.result.to_dict(),
+            "recognition_id": self.recognition_id,
+            "image_url": self.image_url,
+        }
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> "CachedRecognition":
+        return cls(
+            result=RecognitionResult.from_dict(payload["result"]),
+            recognition_id=payload["recognition_id"],
+            image_url=payload["image_url"],
+        )
+
+
+class RecognitionCache:
+    """Content-addressed LRU cache of recognition results with an optional disk tier."""
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[Path] = None):
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._entries: "OrderedDict[str, CachedRecognition]" = OrderedDict()
+        self._artifact_id: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.disk_dir is not None
+
+    @staticmethod
+    def make_key(
+        content_digest: str,
+        expected_digits: Optional[int],
+        artifact_id: str,
+        detail: str,
+        crop_box: Optional[Tuple[int, int, int, int]] = None,
+        image_encoding: Optional[str] = None,
+    ) -> str:
+        """Key of a result; ``content_digest`` is the upload's SHA-256 hex digest."""
+        digest = hashlib.sha256(content_digest.encode("ascii"))
+        digest.update(f"|{expected_digits}|{artifact_id}|{detail}".encode("utf-8"))
+        if crop_box is not None:
+            digest.update(f"|crop={','.join(str(v) for v in crop_box)}".encode("utf-8"))
+        if image_encoding is not None:
+            digest.update(f"|images={image_encoding}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def bind_artifact(self, artifact_id: Optional[str]) -> None:
+        """Drop every entry computed with a different model artifact."""
+        with self._lock:
+            if artifact_id == self._artifact_id:
+                return
+            if self._artifact_id is not None:
+                self.invalidations += 1
+            self._entries.clear()
+            self._artifact_id = artifact_id
+            if self.disk_dir is not None and self.disk_dir.exists():
+                for child in self.disk_dir.iterdir():
+                    if child.is_dir() and child.name != artifact_id:
+                        shutil.rmtree(child, ignore_errors=True)
+
+    def get(self, key: str) -> Optional[CachedRecognition]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CachedRecognition) -> None:
+        with self._lock:
+            # A model swap between lookup and put must not cache the new
+            # model's result under the old artifact (or vice versa).
+            if entry.result.artifact_id is not None and entry.result.artifact_id != self._artifact_id:
+                return
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_tier": str(self.disk_dir) if self.disk_dir else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _remember(self, key: str, entry: CachedRecognition) -> None:
+        if self.max_entries == 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        if self.disk_dir is None or self._artifact_id is None:
+            return None
+        return self.disk_dir / self._artifact_id / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[CachedRecognition]:
+        path = self._disk_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            with path.open("r", encoding="utf-8") as stream:
+                payload = json.load(stream)
+            _restore_images(payload["result"].get("pipeline"))
+            return CachedRecognition.from_dict(payload)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key: str, entry: CachedRecognition) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique per writer: two workers may cache the same key at once.
+        tmp_path = path.with_name(f".{path.stem}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            # Pipeline images are stored as base64, like in a JSON response.
+            with tmp_path.open("wb") as stream:
+                stream.write(dump_json(entry.to_dict()))
+            tmp_path.replace(path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+
+def _restore_images(pipeline: Optional[dict]) -> None:
+    """Turn the base64 pipeline images of a disk entry back into bytes."""
+    for key in ("stages", "digit_crops"):
+        for entry in (pipeline or {}).get(key) or []:
+            if isinstance(entry.get("image"), str):
+                entry["image"] = base64.b64decode(entry["image"])
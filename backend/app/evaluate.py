@@ -0,0 +1,426 @@
+"""Offline re-scoring of the recognition history against a model artifact.
+
+Run from ``backend/``::
+
+    python -m app.evaluate --model models/svm_v2.joblib --output evaluations/svm_v2.jsonl
+
+Records are streamed from the history log segments (sealed segments oldest
+first, then the active log) in fixed-size chunks. Each chunk is split into
+batches that forked worker processes decode, segment and classify with
+``DigitRecognizer.predict_batch``, so every digit of a batch is scored in
+one model call. One chunk is processed while the next is read, which keeps
+memory bounded by the chunk size whatever the size of the archive.
+
+After every chunk the output is flushed and a checkpoint records the log
+position and the running totals; rerunning the same command resumes from
+there. The report compares the new predictions with the stored ones.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+
+from .recognizer import CropBox, DigitRecognizer, RecognitionError
+
+CHECKPOINT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 512
+DEFAULT_BATCH_SIZE = 32
+_HISTORY_FILENAME = "recognitions_log.jsonl"
+# Logged file paths are relative to the server's working directory.
+_SERVER_UPLOAD_DIR = "uploads"
+_FINGERPRINT_BYTES = 4096
+
+_evaluation_recognizer: Optional[DigitRecognizer] = None
+
+# (path, expected_digits, crop_box) of one logged upload.
+Task = Tuple[Path, Optional[int], Optional[CropBox]]
+
+
+def history_segments(upload_dir: Path, history_filename: str = _HISTORY_FILENAME) -> List[Path]:
+    """Log segments in write order: sealed segments by timestamp, then the active log."""
+    active = upload_dir / history_filename
+    stem, suffix = active.stem, active.suffix
+    sealed = sorted(
+        path
+        for path in upload_dir.glob(f"{stem}.*{suffix}")
+        if path.name != active.name
+    )
+    return sealed + ([active] if active.exists() else [])
+
+
+def _fingerprint(path: Path, length: int) -> Optional[str]:
+    """Identify a segment by its first ``length`` bytes, which survive rotation renames.
+
+    Only bytes already read are fingerprinted, so later appends to the
+    active log never change it; a segment shorter than ``length`` does not
+    match.
+    """
+    with path.open("rb") as stream:
+        head = stream.read(length)
+    return hashlib.sha256(head).hexdigest()[:16] if head and len(head) == length else None
+
+
+def _iter_records(
+    segments: Sequence[Path],
+    start_segment: int = 0,
+    start_offset: int = 0,
+) -> Iterator[Tuple[int, int, Optional[dict]]]:
+    """Yield ``(segment_index, end_offset, record)`` per complete log line.
+
+    Unparseable lines yield ``None`` so they are counted but still advance
+    the checkpoint; a trailing line without newline is still being written
+    and ends the stream.
+    """
+    for index in range(start_segment, len(segments)):
+        offset = start_offset if index == start_segment else 0
+        with segments[index].open("rb") as stream:
+            stream.seek(offset)
+            for line in stream:
+                if not line.endswith(b"\n"):
+                    return
+                offset += len(line)
+                stripped = line.strip()
+                if not stripped:
+                    continue
+                try:
+                    record = json.loads(stripped)
+                except ValueError:
+                    record = None
+                yield index, offset, record if isinstance(record, dict) else None
+
+
+def _upload_path(file_path: str, upload_dir: Path) -> Path:
+    """Resolve a logged path inside ``upload_dir``.
+
+    Logs written on Windows carry backslash separators; older records point
+    at files stored flat in the folder, newer ones into ``objects/``.
+    """
+    parts = PurePosixPath(file_path.replace("\\", "/")).parts
+    if _SERVER_UPLOAD_DIR in parts:
+        parts = parts[parts.index(_SERVER_UPLOAD_DIR) + 1 :]
+    return upload_dir.joinpath(*parts) if parts else upload_dir / file_path
+
+
+def _logged_crop_box(metadata: dict) -> Optional[CropBox]:
+    """The region the server cropped to, or None when the upload was pre-cropped."""
+    if not metadata.get("crop_applied"):
+        return None
+    raw = metadata.get("crop_box")
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    if not isinstance(raw, dict):
+        return None
+    values = [raw.get(key) for key in ("x", "y", "width", "height")]
+    if any(not isinstance(value, int) for value in values):
+        return None
+    return tuple(values)
+
+
+def _task(record: dict, upload_dir: Path) -> Optional[Task]:
+    file_path = record.get("file_path")
+    if not file_path:
+        return None
+    metadata = record.get("metadata") or {}
+    expected = metadata.get("expected_digits")
+    return (
+        _upload_path(file_path, upload_dir),
+        expected if isinstance(expected, int) else None,
+        _logged_crop_box(metadata),
+    )
+
+
+def _init_worker() -> None:
+    # Parallelism comes from the processes; one OpenCV thread each.
+    cv2.setNumThreads(1)
+
+
+def _evaluate_batch(tasks: List[Optional[Task]]) -> List[dict]:
+    """Recognize one batch of logged uploads in a worker process."""
+    outcomes: List[Optional[dict]] = [None] * len(tasks)
+    items = []
+    positions = []
+    for position, task in enumerate(tasks):
+        if task is None:
+            outcomes[position] = {"status": "no_file"}
+            continue
+        path, expected, crop_box = task
+        try:
+            contents = path.read_bytes()
+        except OSError:
+            outcomes[position] = {"status": "missing"}
+            continue
+        items.append((contents, expected, crop_box))
+        positions.append(position)
+    results = _evaluation_recognizer.predict_batch(items, detail="none", parallel=False) if items else []
+    for position, result in zip(positions, results):
+        if isinstance(result, RecognitionError):
+            outcomes[position] = {"status": "error", "error": str(result)}
+            continue
+        outcomes[position] = {
+            "status": "ok",
+            "prediction": result.prediction,
+            "accuracy": result.accuracy,
+            "digits": [digit.to_dict() for digit in result.digits],
+        }
+    return outcomes
+
+
+def _new_totals() -> Dict[str, int]:
+    return {
+        "records": 0,
+        "invalid": 0,
+        "no_file": 0,
+        "missing": 0,
+        "errors": 0,
+        "evaluated": 0,
+        "digits": 0,
+        "compared": 0,
+        "disagreements": 0,
+    }
+
+
+def _output_row(record: dict, task: Optional[Task], outcome: dict, model_version: Optional[str]) -> dict:
+    row = {
+        "id": record.get("id"),
+        "file_path": str(task[0]) if task is not None else None,
+        "logged_at": record.get("logged_at"),
+        "stored_prediction": record.get("prediction"),
+        "stored_model_version": record.get("model_version"),
+        "model_version": model_version,
+        **outcome,
+    }
+    if outcome["status"] == "ok" and record.get("prediction") is not None:
+        row["agrees"] = outcome["prediction"] == record["prediction"]
+    return row
+
+
+def _update_totals(totals: Dict[str, int], row: dict) -> None:
+    totals["records"] += 1
+    status = row["status"]
+    if status == "ok":
+        totals["evaluated"] += 1
+        totals["digits"] += len(row["digits"])
+    elif status == "error":
+        totals["errors"] += 1
+    else:
+        totals[status] += 1
+    if "agrees" in row:
+        totals["compared"] += 1
+        totals["disagreements"] += not row["agrees"]
+
+
+def _write_checkpoint(path: Path, state: dict) -> None:
+    # Written beside the target and renamed, so a crash never leaves half a file.
+    temporary = path.with_name(f".{path.name}.tmp")
+    temporary.write_text(json.dumps(state, indent=2) + "\n", encoding="utf-8")
+    os.replace(temporary, path)
+
+
+def _resume_position(state: dict, segments: Sequence[Path]) -> Tuple[int, int]:
+    """Find the checkpointed segment again, even if it was rotated since."""
+    fingerprint = state.get("fingerprint")
+    if fingerprint is None:
+        return 0, 0
+    # Checkpoints written before the length was stored hashed a fixed prefix.
+    length = state.get("fingerprint_bytes", _FINGERPRINT_BYTES)
+    for index, segment in enumerate(segments):
+        if _fingerprint(segment, length) == fingerprint:
+            return index, state["offset"]
+    raise RecognitionError(
+        f"Segmen log {state.get('segment')} dari checkpoint tidak ditemukan lagi (sudah di-prune?); "
+        "jalankan ulang dengan --restart.",
+    )
+
+
+def _chunks(
+    records: Iterator[Tuple[int, int, Optional[dict]]],
+    chunk_size: int,
+    limit: Optional[int],
+) -> Iterator[List[Tuple[int, int, Optional[dict]]]]:
+    chunk: List[Tuple[int, int, Optional[dict]]] = []
+    for count, entry in enumerate(records):
+        if limit is not None and count >= limit:
+            break
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_evaluation(recognizer: DigitRecognizer, args: argparse.Namespace) -> dict:
+    global _evaluation_recognizer
+    loaded = recognizer.ensure_ready()
+    _evaluation_recognizer = recognizer
+    upload_dir = Path(args.upload_dir)
+    segments = history_segments(upload_dir)
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = Path(args.checkpoint or f"{output_path}.checkpoint.json")
+
+    state = None
+    if checkpoint_path.exists() and not args.restart:
+        state = json.loads(checkpoint_path.read_text(encoding="utf-8"))
+        if state.get("artifact_id") != loaded.artifact_id:
+            raise RecognitionError(
+                f"Checkpoint dibuat dengan artifact {state.get('artifact_id')}, bukan {loaded.artifact_id}; "
+                "pakai --output lain atau --restart.",
+            )
+    if state is None:
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "artifact_id": loaded.artifact_id,
+            "model_version": loaded.version,
+            "upload_dir": str(upload_dir),
+            "segment": None,
+            "fingerprint": None,
+            "fingerprint_bytes": 0,
+            "offset": 0,
+            "output_bytes": 0,
+            "elapsed_s": 0.0,
+            "totals": _new_totals(),
+        }
+    start_segment, start_offset = _resume_position(state, segments)
+    totals = state["totals"]
+    resumed_from = totals["records"]
+    evaluated_before = totals["evaluated"]
+    if resumed_from and not output_path.exists():
+        raise RecognitionError(f"Checkpoint ada tetapi {output_path} hilang; jalankan ulang dengan --restart.")
+    previous_elapsed = state["elapsed_s"]
+    started = time.perf_counter()
+
+    def _commit(chunk, tasks, job, output) -> None:
+        outcomes = (outcome for batch in job.get() for outcome in batch)
+        records = (record for _, _, record in chunk if record is not None)
+        totals["invalid"] += sum(1 for _, _, record in chunk if record is None)
+        lines = []
+        for record, task, outcome in zip(records, tasks, outcomes):
+            row = _output_row(record, task, outcome, loaded.version)
+            _update_totals(totals, row)
+            lines.append((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+        output.write(b"".join(lines))
+        output.flush()
+        os.fsync(output.fileno())
+        segment_index, offset, _ = chunk[-1]
+        if state["segment"] != segments[segment_index].name:
+            state["segment"] = segments[segment_index].name
+            state["fingerprint_bytes"] = min(offset, _FINGERPRINT_BYTES)
+            state["fingerprint"] = _fingerprint(segments[segment_index], state["fingerprint_bytes"])
+        state["offset"] = offset
+        state["output_bytes"] = output.tell()
+        state["elapsed_s"] = round(previous_elapsed + time.perf_counter() - started, 3)
+        _write_checkpoint(checkpoint_path, state)
+        if args.progress:
+            print(f"{totals['records']} records, {totals['evaluated']} evaluated", file=sys.stderr)
+
+    context = multiprocessing.get_context("fork")
+    with output_path.open("r+b" if resumed_from else "wb") as output, context.Pool(
+        args.workers,
+        initializer=_init_worker,
+    ) as pool:
+        # Rows written after the last checkpoint are produced again on resume.
+        output.truncate(state["output_bytes"])
+        output.seek(state["output_bytes"])
+        pending = None
+        records = _iter_records(segments, start_segment, start_offset)
+        for chunk in _chunks(records, args.chunk_size, args.limit):
+            tasks = [_task(record, upload_dir) for _, _, record in chunk if record is not None]
+            batches = [tasks[index : index + args.batch_size] for index in range(0, len(tasks), args.batch_size)]
+            job = pool.map_async(_evaluate_batch, batches, chunksize=1)
+            # Write the previous chunk while the workers start on this one.
+            if pending is not None:
+                _commit(*pending, output)
+            pending = (chunk, tasks, job)
+        if pending is not None:
+            _commit(*pending, output)
+
+    run_s = time.perf_counter() - started
+    evaluated = totals["evaluated"] - evaluated_before
+    compared = totals["compared"]
+    return {
+        "artifact_id": loaded.artifact_id,
+        "model_version": loaded.version,
+        "output": str(output_path),
+        "checkpoint": str(checkpoint_path),
+        "resumed_from": resumed_from,
+        "totals": dict(totals),
+        "disagreement_rate": round(totals["disagreements"] / compared, 4) if compared else None,
+        "throughput": {
+            "images": evaluated,
+            "seconds": round(run_s, 3),
+            "images_per_s": round(evaluated / run_s, 2) if run_s > 0 else None,
+        },
+    }
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Path ke artifact .joblib (default: MODEL_PATH).")
+    parser.add_argument("--upload-dir", default="uploads", help="Folder upload berisi log riwayat.")
+    parser.add_argument("--output", type=Path, required=True, help="File JSONL hasil per record.")
+    parser.add_argument("--checkpoint", type=Path, help="File checkpoint (default: <output>.checkpoint.json).")
+    parser.add_argument("--restart", action="store_true", help="Abaikan checkpoint dan mulai dari awal.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Jumlah proses decode.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Record per checkpoint.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Gambar per panggilan model.")
+    parser.add_argument("--limit", type=int, help="Berhenti setelah sejumlah record (untuk uji coba).")
+    parser.add_argument(
+        "--max-disagreement",
+        type=float,
+        help="Keluar dengan status 1 bila disagreement rate melebihi nilai ini.",
+    )
+    parser.add_argument("--progress", action="store_true", help="Cetak progres setiap chunk ke stderr.")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers harus minimal 1")
+    if args.chunk_size < 1 or args.batch_size < 1:
+        parser.error("--chunk-size dan --batch-size harus minimal 1")
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parse_args(argv)
+    recognizer = DigitRecognizer(model_path=args.model)
+    try:
+        report = run_evaluation(recognizer, args)
+    except RecognitionError as exc:
+        print(str(exc), file=sys.stderr)
+        return 2
+    _print_report(report)
+    rate = report["disagreement_rate"]
+    if args.max_disagreement is not None and rate is not None and rate > args.max_disagreement:
+        return 1
+    return 0
+
+
+def _print_report(report: dict) -> None:
+    totals = report["totals"]
+    throughput = report["throughput"]
+    print(f"artifact: {report['artifact_id']} (version {report['model_version']})")
+    if report["resumed_from"]:
+        print(f"resumed after {report['resumed_from']} records")
+    print(f"records: {totals['records']} (evaluated {totals['evaluated']}, missing files {totals['missing']}, "
+          f"no file {totals['no_file']}, errors {totals['errors']}, invalid lines {totals['invalid']})")
+    print(f"throughput: {throughput['images_per_s']} images/s "
+          f"({throughput['images']} images in {throughput['seconds']} s this run)")
+    rate = report["disagreement_rate"]
+    shown = f"{rate:.2%}" if rate is not None else "n/a"
+    print(f"disagreement vs stored prediction: {shown} ({totals['disagreements']}/{totals['compared']})")
+    print(f"output: {report['output']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
+from .recognizer import CropBox, DigitRecognizer, ImageEncoding, RecognitionError, RecognitionResult
+from .warmup import run_warmup
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .streaming import StreamSession
+
+_EXECUTOR_MODES = ("thread", "process")
+
+_worker_recognizer: Optional[DigitRecognizer] = None
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when the recognition queue is full and a request must be shed."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Antrian pengenalan penuh. Coba lagi nanti.")
+        self.retry_after = retry_after
+
+
+def _init_process_worker(model_path: str, mmap_dir: Optional[str]) -> None:
+    global _worker_recognizer
+    _worker_recognizer = DigitRecognizer(model_path=model_path, eager=True, mmap_dir=mmap_dir)
+    try:
+        run_warmup(_worker_recognizer)
+    except Exception as exc:  # pragma: no cover - diagnostic only
+        print(f"[WARN] Warm-up worker gagal: {exc}")
+
+
+def _call_in_process(
+    method: str,
+    payload,
+    submitted_at: float,
+    options: dict,
+):
+    started_at = time.time()
+    result = getattr(_worker_recognizer, method)(payload, **options)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _call_in_thread(
+    recognizer: DigitRecognizer,
+    method: str,
+    payload,
+    submitted_at: float,
+    options: dict,
+):
+    started_at = time.time()
+    result = getattr(recognizer, method)(payload, **options)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+class RecognitionExecutor:
+    """Bounded worker pool that keeps CPU-bound recognition off the event loop."""
+
+    def __init__(
+        self,
+        recognizer: DigitRecognizer,
+        mode: str = "thread",
+        max_workers: Optional[int] = None,
+        max_queue_depth: int = 32,
+        retry_after: int = 1,
+    ):
+        if mode not in _EXECUTOR_MODES:
+            raise ValueError(f"Mode executor tidak dikenal: {mode}")
+        self.recognizer = recognizer
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue_depth = max(0, int(max_queue_depth))
+        self.retry_after = max(1, int(retry_after))
+        self._pool: Optional[Executor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        self._pool = self._create_pool()
+
+    def reload_workers(self) -> None:
+        """Point process workers at the recognizer's current artifact.
+
+        A fresh pool takes new jobs at once; the old one finishes the jobs
+        it already holds and exits. Thread workers share the recognizer and
+        need nothing.
+        """
+        if self.mode != "process" or self._pool is None:
+            return
+        old_pool, self._pool = self._pool, self._create_pool()
+        old_pool.shutdown(wait=False)
+
+    def _create_pool(self) -> Executor:
+        if self.mode == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_process_worker,
+                initargs=(
+                    str(self.recognizer.model_path),
+                    str(self.recognizer.mmap_dir) if self.recognizer.mmap_dir else None,
+                ),
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="recognition",
+        )
+
+    def shutdown(self) -> None:
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=True)
+        self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+        }
+
+    async def predict(
+        self,
+        image_bytes: bytes,
+        expected_digits: Optional[int] = None,
+        detail: str = "full",
+        retain_debug: bool = False,
+        crop_box: Optional[CropBox] = None,
+        image_encoding: Optional[ImageEncoding] = None,
+    ) -> Tuple[RecognitionResult, dict]:
+        options = {
+            "expected_digits": expected_digits,
+            "detail": detail,
+            "retain_debug": retain_debug,
+            "crop_box": crop_box,
+            "image_encoding": image_encoding,
+        }
+        return await self._submit("predict", image_bytes, options)
+
+    async def predict_batch(
+        self,
+        items: List[Tuple],
+        detail: str = "full",
+    ) -> Tuple[List[Union[RecognitionResult, RecognitionError]], dict]:
+        return await self._submit("predict_batch", items, {"detail": detail})
+
+    async def process_frame(self, session: "StreamSession", frame: bytes, sequence: int) -> Tuple[str, Optional[dict]]:
+        """Run one preview frame of ``session`` under the same queue bound.
+
+        A session keeps its state in this process, so in process mode the
+        frame runs on the event loop's default threads instead of the pool;
+        it still counts against ``max_queue_depth`` either way.
+        """
+        self._acquire_slot()
+        try:
+            self.start()
+            pool = self._pool if self.mode == "thread" else None
+            return await asyncio.get_running_loop().run_in_executor(pool, session.process, frame, sequence)
+        finally:
+            self._release_slot()
+
+    async def _submit(self, method: str, payload, options: dict):
+        self._acquire_slot()
+        try:
+            self.start()
+            loop = asyncio.get_running_loop()
+            submitted_at = time.time()
+            if self.mode == "process":
+                future = loop.run_in_executor(
+                    self._pool,
+                    _call_in_process,
+                    method,
+                    payload,
+                    submitted_at,
+                    options,
+                )
+            else:
+                future = loop.run_in_executor(
+                    self._pool,
+                    _call_in_thread,
+                    self.recognizer,
+                    method,
+                    payload,
+                    submitted_at,
+                    options,
+                )
+            result, queue_wait, execute = await future
+        finally:
+            self._release_slot()
+        timings = {
+            "queue_wait_ms": int(max(0.0, queue_wait) * 1000),
+            "execute_ms": int(max(0.0, execute) * 1000),
+        }
+        return result, timings
+
+    def _acquire_slot(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue_depth:
+                raise ExecutorSaturatedError(self.retry_after)
+            self._in_flight += 1
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+_PARITY_PROBES = 256
+_PARITY_SEED = 1234
+# Probes saved with a compiled model; a load re-scores them before serving.
+_STORED_PROBES = 8
+_STORED_TOLERANCE = 1e-6
+
+
+class IdentityScaler:
+    """Stand-in scaler for models whose scaling is folded into the weights."""
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        return features
+
+
+class CompiledLinearModel:
+    """Linear decision function with the StandardScaler folded into the weights.
+
+    ``decision_function`` computes ``X @ W.T + b`` into a per-thread buffer,
+    then applies the one-vs-one to one-vs-rest transform that ``SVC`` uses
+    when the weights describe pairwise classifiers.
+
+    ``reference`` holds probe features and the scores sklearn gave them
+    when the model was compiled; see ``matches_reference``.
+    """
+
+    def __init__(
+        self,
+        weights: np.ndarray,
+        bias: np.ndarray,
+        classes: np.ndarray,
+        ovo_classes: Optional[int] = None,
+        reference: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ):
+        self.weights_t = np.ascontiguousarray(weights.T, dtype=np.float64)
+        self.bias = np.ascontiguousarray(bias, dtype=np.float64)
+        self.classes_ = classes
+        self.ovo_classes = ovo_classes
+        self.reference = reference
+        self._local = threading.local()
+
+    @property
+    def n_features(self) -> int:
+        return self.weights_t.shape[0]
+
+    def decision_function(self, features: np.ndarray) -> np.ndarray:
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        scores = self._buffer(features.shape[0])
+        np.matmul(features, self.weights_t, out=scores)
+        scores += self.bias
+        if self.ovo_classes is not None:
+            return _ovr_from_ovo(scores, self.ovo_classes)
+        if scores.shape[1] == 1:
+            return scores[:, 0].copy()
+        return scores.copy()
+
+    def matches_reference(self) -> bool:
+        """Whether the weights still give the sklearn scores recorded at compile time."""
+        if self.reference is None:
+            return False
+        probes, expected = self.reference
+        actual = self.decision_function(probes)
+        return actual.shape == expected.shape and bool(
+            np.allclose(actual, expected, rtol=_STORED_TOLERANCE, atol=_STORED_TOLERANCE),
+        )
+
+    def _buffer(self, rows: int) -> np.ndarray:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < rows:
+            capacity = max(rows, 16 if buffer is None else buffer.shape[0] * 2)
+            buffer = np.empty((capacity, self.bias.shape[0]), dtype=np.float64)
+            self._local.buffer = buffer
+        return buffer[:rows]
+
+
+def compile_linear_model(model, scaler) -> Tuple[Optional[CompiledLinearModel], str]:
+    """Fold ``scaler`` into a linear ``model``; returns ``(None, reason)`` when unsupported."""
+    weights, bias, ovo_classes = _extract_linear_weights(model)
+    if weights is None:
+        return None, "model tidak linear"
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    n_features = weights.shape[1]
+    mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+    if mean.shape != (n_features,) or scale.shape != (n_features,):
+        return None, "dimensi scaler tidak cocok"
+    folded = weights / scale
+    folded_bias = bias - folded @ mean
+    compiled = CompiledLinearModel(folded, folded_bias, model.classes_, ovo_classes)
+    rng = np.random.default_rng(_PARITY_SEED)
+    # Rounded to float32 so the probes saved with the model are exact.
+    probes = (mean + scale * rng.standard_normal((_PARITY_PROBES, n_features))).astype(np.float32).astype(np.float64)
+    expected = np.asarray(model.decision_function(scaler.transform(probes)), dtype=np.float64)
+    if not _labels_match(expected, compiled.decision_function(probes)):
+        return None, "parity check gagal"
+    compiled.reference = (probes[:_STORED_PROBES], expected[:_STORED_PROBES])
+    return compiled, "ok"
+
+
+def save_compiled(compiled: CompiledLinearModel, path: Path, artifact_id: str, extra: dict) -> bool:
+    """Persist ``compiled`` as a plain ``.npz`` that loads without sklearn.
+
+    The file records ``artifact_id`` (the SHA-256 of the artifact it was
+    compiled from) and the reference probes, which ``load_compiled`` checks.
+    """
+    classes = np.asarray(compiled.classes_)
+    if classes.dtype == object or compiled.reference is None:
+        return False
+    probes, expected = compiled.reference
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("wb") as stream:
+            np.savez(
+                stream,
+                weights_t=compiled.weights_t,
+                bias=compiled.bias,
+                classes=classes,
+                ovo_classes=np.int64(compiled.ovo_classes or 0),
+                probe_features=probes.astype(np.float32),
+                probe_scores=expected,
+                artifact_id=np.frombuffer(artifact_id.encode("ascii"), dtype=np.uint8),
+                extra=np.frombuffer(json.dumps(extra).encode("utf-8"), dtype=np.uint8),
+            )
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return True
+
+
+def load_compiled(path: Path, artifact_id: str) -> Optional[Tuple[CompiledLinearModel, dict]]:
+    """Load a model written by ``save_compiled`` for ``artifact_id``.
+
+    None when the file is missing or unreadable, was compiled from another
+    artifact, or its weights no longer reproduce the reference scores.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if data["artifact_id"].tobytes().decode("ascii") != artifact_id:
+                return None
+            ovo_classes = int(data["ovo_classes"])
+            compiled = CompiledLinearModel(
+                data["weights_t"].T,
+                data["bias"],
+                data["classes"],
+                ovo_classes or None,
+                reference=(data["probe_features"].astype(np.float64), data["probe_scores"]),
+            )
+            extra = json.loads(data["extra"].tobytes().decode("utf-8"))
+    except (OSError, KeyError, ValueError):
+        return None
+    if not compiled.matches_reference():
+        return None
+    return compiled, extra
+
+
+def _extract_linear_weights(model):
+    coef = getattr(model, "coef_", None) if _has_linear_decision(model) else None
+    intercept = getattr(model, "intercept_", None)
+    classes = getattr(model, "classes_", None)
+    if coef is None or intercept is None or classes is None or hasattr(coef, "toarray"):
+        return None, None, None
+    weights = np.atleast_2d(np.asarray(coef, dtype=np.float64))
+    bias = np.atleast_1d(np.asarray(intercept, dtype=np.float64))
+    ovo_classes = None
+    if _is_kernel_svc(model) and len(classes) > 2:
+        if getattr(model, "decision_function_shape", "ovr") != "ovr":
+            return None, None, None
+        ovo_classes = len(classes)
+    return weights, bias, ovo_classes
+
+
+def _has_linear_decision(model) -> bool:
+    # Imported here so serving from a saved compiled model never loads sklearn.
+    from sklearn.linear_model._base import LinearClassifierMixin
+
+    if _is_kernel_svc(model):
+        return getattr(model, "kernel", None) == "linear"
+    return isinstance(model, LinearClassifierMixin)
+
+
+def _is_kernel_svc(model) -> bool:
+    from sklearn.svm._base import BaseSVC
+
+    return isinstance(model, BaseSVC)
+
+
+def _ovr_from_ovo(pairwise: np.ndarray, n_classes: int) -> np.ndarray:
+    # Mirrors sklearn.utils.multiclass._ovr_decision_function.
+    predictions = pairwise < 0
+    confidences = -pairwise
+    votes = np.zeros((pairwise.shape[0], n_classes))
+    sum_of_confidences = np.zeros((pairwise.shape[0], n_classes))
+    k = 0
+    for i in range(n_classes):
+        for j in range(i + 1, n_classes):
+            sum_of_confidences[:, i] -= confidences[:, k]
+            sum_of_confidences[:, j] += confidences[:, k]
+            votes[~predictions[:, k], i] += 1
+            votes[predictions[:, k], j] += 1
+            k += 1
+    return votes + sum_of_confidences / (3 * (np.abs(sum_of_confidences) + 1))
+
+
+def _labels_match(expected: np.ndarray, actual: np.ndarray) -> bool:
+    if expected.shape != actual.shape:
+        return False
+    if expected.ndim == 1:
+        return bool(np.array_equal(expected > 0, actual > 0))
+    return bool(np.array_equal(np.argmax(expected, axis=1), np.argmax(actual, axis=1)))
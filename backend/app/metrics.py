@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DIGIT_COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 12, 16, 24)
+MEMORY_BUCKETS_BYTES = tuple(2**power for power in range(16, 31, 2))
+PAYLOAD_BUCKETS_BYTES = tuple(2**power for power in range(8, 25, 2))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """Add the elapsed milliseconds of the block to ``timings[stage]``."""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000.0
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process counters, histograms and gauges in Prometheus text format."""
+
+    def __init__(self, namespace: str = "multidigit"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._histogram_buckets: Dict[str, Sequence[float]] = {}
+        self._gauges: Dict[str, Callable[[], Dict[LabelKey, float]]] = {}
+
+    def counter(self, name: str, description: str) -> None:
+        with self._lock:
+            self._help[name] = ("counter", description)
+            self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        with self._lock:
+            self._help[name] = ("histogram", description)
+            self._histograms.setdefault(name, {})
+            self._histogram_buckets[name] = buckets
+
+    def gauge(self, name: str, description: str, collect: Callable[[], Dict[LabelKey, float]]) -> None:
+        """Register a gauge whose labelled values are read at scrape time."""
+        with self._lock:
+            self._help[name] = ("gauge", description)
+            self._gauges[name] = collect
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._histogram_buckets[name])
+            histogram.observe(value)
+
+    def observe_stages(self, name: str, timings: Dict[str, float], skip: Sequence[str] = ()) -> None:
+        for stage, value in timings.items():
+            if stage not in skip:
+                self.observe(name, value, stage=stage)
+
+    def render(self) -> str:
+        with self._lock:
+            gauges = list(self._gauges.items())
+        # Gauge callbacks may take other locks, so read them before our own.
+        snapshots = {name: collect() for name, collect in gauges}
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, description) in self._help.items():
+                full_name = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {full_name} {description}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                if kind == "counter":
+                    for key, value in self._counters[name].items():
+                        lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+                elif kind == "histogram":
+                    for key, histogram in self._histograms[name].items():
+                        lines.extend(_render_histogram(full_name, key, histogram))
+                else:
+                    for key, value in snapshots.get(name, {}).items():
+                        lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def gauge_values(values: Dict[str, float], label: str) -> Dict[LabelKey, float]:
+    """Turn ``{"a": 1}`` into gauge series labelled ``label="a"``."""
+    return {((label, str(key)),): float(value) for key, value in values.items()}
+
+
+def _render_histogram(full_name: str, key: LabelKey, histogram: _Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        bucket_key = key + (("le", _format_value(bound)),)
+        lines.append(f"{full_name}_bucket{_format_labels(bucket_key)} {cumulative}")
+    inf_key = key + (("le", "+Inf"),)
+    lines.append(f"{full_name}_bucket{_format_labels(inf_key)} {histogram.count}")
+    lines.append(f"{full_name}_sum{_format_labels(key)} {_format_value(histogram.total)}")
+    lines.append(f"{full_name}_count{_format_labels(key)} {histogram.count}")
+    return lines
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        f'{name}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in key
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -1,15 +1,51 @@
 from __future__ import annotations
+import hashlib
+import io
 import os
 import time
-from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
-from typing import List, Optional, Tuple
-import base64
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import math
+import struct
+import threading
 
 import cv2
-import joblib
 import numpy as np
-from skimage.feature import hog
+
+from .hog import FixedHogExtractor
+from .linear_scoring import IdentityScaler, compile_linear_model, load_compiled, save_compiled
+from .metrics import timed
+
+DETAIL_LEVELS = ("none", "summary", "stages", "full")
+# ``(x, y, width, height)`` region of interest in upload pixels.
+CropBox = Tuple[int, int, int, int]
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+
+@dataclass(frozen=True)
+class ImageEncoding:
+    """Format, longest side and lossy quality of rendered pipeline images."""
+
+    format: str = "png"
+    max_side: Optional[int] = None
+    quality: int = 80
+
+    def __post_init__(self):
+        if self.format not in IMAGE_FORMATS:
+            raise ValueError(f"Format gambar tidak dikenal: {self.format}")
+        if self.max_side is not None and self.max_side < 16:
+            raise ValueError("max_side minimal 16 piksel")
+        if not 1 <= self.quality <= 100:
+            raise ValueError("quality harus di antara 1 dan 100")
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format}"
+
+    def cache_token(self) -> str:
+        return f"{self.format}:{self.max_side}:{self.quality if self.format != 'png' else ''}"
 
 
 @dataclass
@@ -29,6 +65,11 @@ class RecognitionResult:
     processing_time_ms: int
     digits: List[DigitComponent]
     pipeline: Optional[dict] = None
+    debug: Optional["PipelineDebug"] = field(default=None, repr=False, compare=False)
+    stage_timings: Dict[str, float] = field(default_factory=dict, repr=False, compare=False)
+    peak_memory_bytes: int = field(default=0, repr=False, compare=False)
+    artifact_id: Optional[str] = None
+    model_version: Optional[str] = None
 
     def to_dict(self) -> dict:
         payload = {
@@ -36,152 +77,925 @@ class RecognitionResult:
             "accuracy": self.accuracy,
             "processing_time_ms": self.processing_time_ms,
             "digits": [digit.to_dict() for digit in self.digits],
+            "artifact_id": self.artifact_id,
+            "model_version": self.model_version,
         }
         if self.pipeline is not None:
             payload["pipeline"] = self.pipeline
         return payload
 
+    @classmethod
+    def from_dict(cls, payload: dict) -> "RecognitionResult":
+        return cls(
+            prediction=payload["prediction"],
+            accuracy=payload["accuracy"],
+            processing_time_ms=payload["processing_time_ms"],
+            digits=[
+                DigitComponent(
+                    label=digit["label"],
+                    confidence=digit["confidence"],
+                    bbox=tuple(digit["bbox"]),
+                )
+                for digit in payload.get("digits", [])
+            ],
+            pipeline=payload.get("pipeline"),
+            artifact_id=payload.get("artifact_id"),
+            model_version=payload.get("model_version"),
+        )
+
 
 class RecognitionError(Exception):
     """Raised when the recognition pipeline cannot infer a prediction."""
 
 
 class DigitRecognizer:
-    def __init__(self, model_path: Optional[str] = None, eager: bool = True):
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        eager: bool = True,
+        mmap_dir: Optional[str] = None,
+        retry_confidence: Optional[float] = None,
+        retry_budget_ms: Optional[float] = None,
+        prepare_workers: Optional[int] = None,
+    ):
         default_path = Path(__file__).parent.parent / "models" / "svm_digit_classifier.joblib"
         self.model_path = Path(model_path or os.getenv("MODEL_PATH", default_path))
-        self._model = None
-        self._scaler = None
-        self._hog_params: Optional[dict] = None
-        self._loaded_at: Optional[float] = None
+        mmap_dir = mmap_dir or os.getenv("MODEL_MMAP_DIR")
+        self.mmap_dir = Path(mmap_dir) if mmap_dir else None
+        # Confidence every digit must reach before segmentation retries stop;
+        # 0 keeps the first segmentation (plus the projection-split fallback).
+        if retry_confidence is None:
+            retry_confidence = float(os.getenv("SEGMENT_RETRY_CONFIDENCE", DEFAULT_RETRY_CONFIDENCE))
+        if retry_budget_ms is None:
+            retry_budget_ms = float(os.getenv("SEGMENT_RETRY_BUDGET_MS", DEFAULT_RETRY_BUDGET_MS))
+        self.retry_confidence = float(retry_confidence)
+        self.retry_budget_ms = max(0.0, float(retry_budget_ms))
+        # Threads that decode and preprocess the images of a batch.
+        if prepare_workers is None:
+            prepare_workers = int(os.getenv("BATCH_PREPARE_WORKERS", "0")) or os.cpu_count() or 1
+        self.prepare_workers = max(1, int(prepare_workers))
+        self._prepare_pool: Optional[ThreadPoolExecutor] = None
+        self._prepare_pool_pid: Optional[int] = None
+        self._prepare_pool_lock = threading.Lock()
+        self._loaded: Optional[LoadedModel] = None
+        self._load_listeners: List[Callable[[LoadedModel], None]] = []
         if eager:
             self.ensure_ready()
 
     @property
     def is_ready(self) -> bool:
-        return self._model is not None and self._scaler is not None
+        return self._loaded is not None
 
     @property
     def last_loaded_at(self) -> Optional[str]:
-        if self._loaded_at is None:
+        if self._loaded is None:
             return None
-        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._loaded_at))
-
-    def ensure_ready(self) -> None:
-        if self.is_ready:
-            return
-        if not self.model_path.exists():
-            raise FileNotFoundError(
-                f"Model artifact tidak ditemukan di {self.model_path}. "
-                "Set variabel lingkungan MODEL_PATH ke file .joblib yang benar.",
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._loaded.loaded_at))
+
+    @property
+    def scoring_backend(self) -> Optional[str]:
+        """Which scoring path serves predictions once the model is loaded."""
+        return None if self._loaded is None else self._loaded.scoring_backend
+
+    @property
+    def hog_backend(self) -> Optional[str]:
+        if self._loaded is None:
+            return None
+        return "vectorized" if self._loaded.hog_extractor is not None else "skimage"
+
+    @property
+    def artifact_id(self) -> Optional[str]:
+        """SHA-256 of the loaded model artifact, or None before loading."""
+        return None if self._loaded is None else self._loaded.artifact_id
+
+    @property
+    def model_version(self) -> Optional[str]:
+        return None if self._loaded is None else self._loaded.version
+
+    @property
+    def loaded_model(self) -> Optional[LoadedModel]:
+        return self._loaded
+
+    @property
+    def memory_sharing(self) -> Optional[str]:
+        """How the model arrays are held: ``mmap``, ``fork`` (inherited) or ``private``."""
+        if self._loaded is None:
+            return None
+        if self._loaded.mmap_path is not None:
+            return "mmap"
+        return "fork" if self._loaded.loaded_pid != os.getpid() else "private"
+
+    @property
+    def _scoring_model(self):
+        return None if self._loaded is None else self._loaded.scoring_model
+
+    @property
+    def _scoring_scaler(self):
+        return None if self._loaded is None else self._loaded.scoring_scaler
+
+    @property
+    def _hog_params(self) -> Optional[dict]:
+        return None if self._loaded is None else self._loaded.hog_params
+
+    @property
+    def _hog_extractor(self) -> Optional[FixedHogExtractor]:
+        return None if self._loaded is None else self._loaded.hog_extractor
+
+    def add_load_listener(self, listener: Callable[[LoadedModel], None]) -> None:
+        """Call ``listener(loaded)`` before each model this recognizer starts serving.
+
+        Covers the first load in ``ensure_ready`` and every ``swap_model``;
+        a model that is already serving is reported right away.
+        """
+        self._load_listeners.append(listener)
+        if self._loaded is not None:
+            listener(self._loaded)
+
+    def ensure_ready(self) -> LoadedModel:
+        loaded = self._loaded
+        if loaded is None:
+            loaded = load_model(self.model_path, self.mmap_dir)
+            self._notify_load(loaded)
+            self._loaded = loaded
+        return loaded
+
+    def swap_model(self, loaded: LoadedModel, model_path: Optional[Path] = None) -> Optional[LoadedModel]:
+        """Serve ``loaded`` from now on; requests already running keep their model."""
+        previous = self._loaded
+        if model_path is not None:
+            self.model_path = Path(model_path)
+        self._notify_load(loaded)
+        self._loaded = loaded
+        return previous
+
+    def _notify_load(self, loaded: LoadedModel) -> None:
+        for listener in self._load_listeners:
+            listener(loaded)
+
+    def _prepare_executor(self) -> ThreadPoolExecutor:
+        """The long-lived batch preparation pool, recreated in a forked child."""
+        with self._prepare_pool_lock:
+            if self._prepare_pool is None or self._prepare_pool_pid != os.getpid():
+                self._prepare_pool = ThreadPoolExecutor(
+                    max_workers=self.prepare_workers,
+                    thread_name_prefix="batch-prepare",
+                )
+                self._prepare_pool_pid = os.getpid()
+            return self._prepare_pool
+
+    def predict_crops(self, crops: List[np.ndarray]) -> List[DigitComponent]:
+        """Classify pre-segmented digit crops in a single batched model call."""
+        loaded = self.ensure_ready()
+        predictions = _classify_crops(
+            list(crops),
+            model=loaded.scoring_model,
+            scaler=loaded.scoring_scaler,
+            hog_params=loaded.hog_params,
+            hog_extractor=loaded.hog_extractor,
+        )
+        components: List[DigitComponent] = []
+        for crop, (label_value, confidence) in zip(crops, predictions):
+            height, width = crop.shape[:2]
+            components.append(
+                DigitComponent(
+                    label=str(label_value),
+                    confidence=round(confidence * 100.0, 2),
+                    bbox=(0, 0, int(width), int(height)),
+                ),
             )
-        artifact = joblib.load(self.model_path)
-        self._model = artifact.get("model")
-        self._scaler = artifact.get("scaler")
-        self._hog_params = artifact.get("hog_params")
-        if self._model is None or self._scaler is None:
-            raise RuntimeError(
-                "File model tidak valid. Harus berisi key 'model' dan 'scaler'.",
+        return components
+
+    def predict(
+        self,
+        image_bytes: bytes,
+        expected_digits: Optional[int] = None,
+        detail: str = "full",
+        retain_debug: bool = False,
+        crop_box: Optional[CropBox] = None,
+        image_encoding: Optional[ImageEncoding] = None,
+    ) -> RecognitionResult:
+        """Recognize the digits of one upload.
+
+        With ``crop_box`` only that region is decoded and processed; digit
+        boxes are still reported in full-frame coordinates.
+        ``image_encoding`` sets how the stage and digit images of the
+        pipeline payload are encoded (PNG at full size by default).
+        """
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f"Detail pipeline tidak dikenal: {detail}")
+        # One snapshot per request, so a concurrent swap never mixes models.
+        loaded = self.ensure_ready()
+        timings: Dict[str, float] = {}
+        with timed(timings, "decode"):
+            ingested = _ingest_image(
+                image_bytes,
+                expected_digits,
+                keep_color=retain_debug or detail in ("stages", "full"),
+                crop_box=crop_box,
             )
-        self._loaded_at = time.time()
-
-    def predict(self, image_bytes: bytes, expected_digits: Optional[int] = None) -> RecognitionResult:
-        self.ensure_ready()
-        np_buffer = np.frombuffer(image_bytes, dtype=np.uint8)
-        image = cv2.imdecode(np_buffer, cv2.IMREAD_COLOR)
-        if image is None:
-            raise RecognitionError("Berkas gambar tidak dapat dibaca.")
 
         start = time.perf_counter()
+        # The retry budget covers segmentation and classification, not decode.
+        deadline = start + self.retry_budget_ms / 1000.0
         pipeline_output = _run_prediction_pipeline(
-            image=image,
+            ingested=ingested,
             expected_digits=expected_digits,
-            model=self._model,
-            scaler=self._scaler,
-            hog_params=self._hog_params,
+            model=loaded.scoring_model,
+            scaler=loaded.scoring_scaler,
+            hog_params=loaded.hog_params,
+            hog_extractor=loaded.hog_extractor,
+            timings=timings,
+            retry_confidence=self.retry_confidence,
+            deadline=deadline,
         )
-        segments = pipeline_output["segments"]
-        records = pipeline_output["records"]
-        if not segments or not records:
-            raise RecognitionError("Digit tidak terdeteksi pada gambar.")
-
-        digit_components: List[DigitComponent] = []
-        digit_payload: List[dict] = []
-        prediction_chars: List[str] = []
-        raw_confidences: List[float] = []
-
-        for record in records:
-            label_str = str(record["label"])
-            confidence_pct = round(float(record["confidence"]) * 100.0, 2)
-            digit_components.append(
-                DigitComponent(
-                    label=label_str,
-                    confidence=confidence_pct,
-                    bbox=record["bbox"],
-                ),
-            )
-            prediction_chars.append(label_str)
-            raw_confidences.append(float(record["confidence"]))
-            digit_payload.append({
-                "index": record["index"],
-                "label": label_str,
-                "confidence": confidence_pct,
-                "image": _encode_png(_prepare_digit_debug_image(record["crop"])),
-            })
-
-        prediction = "".join(prediction_chars)
-        accuracy = round(float(np.mean(raw_confidences) * 100.0), 2) if raw_confidences else 0.0
         processing_time_ms = int((time.perf_counter() - start) * 1000)
-        preprocessed = pipeline_output["preprocessed"]
-        mask = pipeline_output["mask"]
-        best_overlay = _draw_overlay(preprocessed, segments)
-
-        pipeline_steps = [
-            {
-                "key": "original",
-                "title": "1. Foto Asli",
-                "description": "Input yang diterima dari kamera atau galeri.",
-                "image": _encode_png(pipeline_output["raw_bgr"]),
-            },
-            {
-                "key": "preprocess",
-                "title": "2. Preprocessing",
-                "description": "Normalisasi kontras, CLAHE, dan balancing warna untuk menonjolkan digit.",
-                "image": _encode_png(preprocessed),
-            },
-            {
-                "key": "mask",
-                "title": "3. Masking",
-                "description": "Threshold adaptif untuk memisahkan digit dari latar belakang.",
-                "image": _encode_png(cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)),
-            },
-            {
-                "key": "segments",
-                "title": "4. Segmentasi",
-                "description": "Bounding box setiap digit serta urutan pembacaannya.",
-                "image": _encode_png(best_overlay),
-            },
-        ]
+        return _build_result(
+            pipeline_output,
+            processing_time_ms,
+            detail,
+            retain_debug,
+            timings,
+            loaded,
+            image_encoding,
+        )
+
+    def predict_batch(
+        self,
+        items: List[Tuple],
+        detail: str = "full",
+        parallel: bool = True,
+    ) -> List[Union[RecognitionResult, RecognitionError]]:
+        """Recognize many images, classifying every digit in one model call.
+
+        Each item is ``(image_bytes, expected_digits)`` or
+        ``(image_bytes, expected_digits, crop_box)``. Failures are returned
+        in place of the result so a single bad image does not fail the
+        whole batch. Images are decoded and preprocessed in parallel on the
+        recognizer's shared pool (``prepare_workers`` threads); pass
+        ``parallel=False`` where the caller already runs one batch per core.
+        """
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f"Detail pipeline tidak dikenal: {detail}")
+        loaded = self.ensure_ready()
+        if not items:
+            return []
+        keep_color = detail in ("stages", "full")
+
+        def _prepare(item: Tuple) -> Union[dict, RecognitionError]:
+            image_bytes, expected_digits = item[0], item[1]
+            crop_box = item[2] if len(item) > 2 else None
+            timings: Dict[str, float] = {}
+            start = time.perf_counter()
+            try:
+                with timed(timings, "decode"):
+                    ingested = _ingest_image(image_bytes, expected_digits, keep_color=keep_color, crop_box=crop_box)
+                output = _segment_image(ingested, timings=timings)
+            except RecognitionError as exc:
+                return exc
+            except Exception as exc:
+                return RecognitionError(f"Gagal memproses gambar: {exc}")
+            output["expected_digits"] = expected_digits
+            output["elapsed"] = time.perf_counter() - start
+            output["timings"] = timings
+            return output
+
+        if parallel and len(items) > 1:
+            prepared = list(self._prepare_executor().map(_prepare, items))
+        else:
+            prepared = [_prepare(item) for item in items]
+
+        stacks: List[np.ndarray] = []
+        for output in prepared:
+            if isinstance(output, dict):
+                output["valid"] = _valid_segments(output["segments"])
+                stacks.append(output["crop_stack"])
+        crops = np.concatenate(stacks) if stacks else _crop_stack(0)
+
+        # HOG and scoring run once for the whole batch; every item reports the
+        # shared durations under the same stage names.
+        batch_timings: Dict[str, float] = {}
+        classify_start = time.perf_counter()
+        predictions = _classify_crops(
+            crops,
+            model=loaded.scoring_model,
+            scaler=loaded.scoring_scaler,
+            hog_params=loaded.hog_params,
+            hog_extractor=loaded.hog_extractor,
+            timings=batch_timings,
+        )
+        classify_elapsed = time.perf_counter() - classify_start
+
+        def _classify(crops: Crops) -> List[Tuple[object, float]]:
+            return _classify_crops(
+                crops,
+                model=loaded.scoring_model,
+                scaler=loaded.scoring_scaler,
+                hog_params=loaded.hog_params,
+                hog_extractor=loaded.hog_extractor,
+            )
 
-        pipeline_payload = {
-            "stages": pipeline_steps,
-            "digit_crops": digit_payload,
-            "summary": {
-                "prediction": prediction,
-                "accuracy": round(accuracy, 2),
-                "processing_time_ms": processing_time_ms,
-                "digit_count": len(digit_components),
-                "contrast_std_dev": round(float(pipeline_output["std_dev"]), 2),
-            },
+        results: List[Union[RecognitionResult, RecognitionError]] = []
+        offset = 0
+        for output in prepared:
+            if not isinstance(output, dict):
+                results.append(output)
+                continue
+            count = len(output["valid"])
+            # Only images whose batched result is not accepted pay for retries.
+            # The budget starts here rather than at decode, so waiting for
+            # the rest of the batch never costs an image its retry tiers.
+            retry_start = time.perf_counter()
+            _resolve_segmentation(
+                output,
+                output["expected_digits"],
+                _classify,
+                self.retry_confidence,
+                retry_start + self.retry_budget_ms / 1000.0,
+                timings=output["timings"],
+                predictions=predictions[offset : offset + count],
+            )
+            offset += count
+            output["elapsed"] += time.perf_counter() - retry_start
+            processing_time_ms = int((output["elapsed"] + classify_elapsed) * 1000)
+            try:
+                timings = {**output["timings"], **batch_timings}
+                results.append(_build_result(output, processing_time_ms, detail, False, timings, loaded))
+            except RecognitionError as exc:
+                results.append(exc)
+        return results
+
+
+@dataclass
+class LoadedModel:
+    """Model artifact plus the scoring objects derived from it."""
+
+    model: object
+    scaler: object
+    scoring_model: object
+    scoring_scaler: object
+    scoring_backend: str
+    hog_params: dict
+    hog_extractor: Optional[FixedHogExtractor]
+    artifact_id: str
+    version: str
+    source_path: Path
+    loaded_at: float
+    loaded_pid: int
+    key: Tuple[str, str, int, int]
+    mmap_path: Optional[Path] = None
+    load_source: str = "joblib"
+    warmup: Optional[dict] = None
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "artifact_id": self.artifact_id,
+            "model_path": str(self.source_path),
+            "scoring_backend": self.scoring_backend,
+            "load_source": self.load_source,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at)),
+            "warmup": self.warmup,
         }
 
-        return RecognitionResult(
-            prediction=prediction,
-            accuracy=round(accuracy, 2),
-            processing_time_ms=processing_time_ms,
-            digits=digit_components,
-            pipeline=pipeline_payload,
+
+# Loaded models keyed by artifact path, mmap directory and file identity.
+# A parent that loads before forking hands every child the same pages.
+_LOADED_MODELS: Dict[Tuple[str, str, int, int], LoadedModel] = {}
+_LOAD_LOCK = threading.Lock()
+
+
+def load_model(
+    model_path: Path,
+    mmap_dir: Optional[Path] = None,
+    shared: bool = True,
+) -> LoadedModel:
+    """Load ``model_path`` once per process (and per fork tree).
+
+    With ``mmap_dir`` the artifact is re-dumped uncompressed under its
+    SHA-256 and its arrays are memory-mapped read-only, so processes that
+    did not inherit the load still share the page cache. ``shared=False``
+    loads a candidate without publishing it; see ``publish_model``.
+    """
+    model_path = Path(model_path)
+    if not model_path.exists():
+        raise FileNotFoundError(
+            f"Model artifact tidak ditemukan di {model_path}. "
+            "Set variabel lingkungan MODEL_PATH ke file .joblib yang benar.",
         )
+    key = _artifact_key(model_path, mmap_dir)
+    with _LOAD_LOCK:
+        loaded = _LOADED_MODELS.get(key)
+        if loaded is None and shared:
+            loaded = _LOADED_MODELS[key] = _load_artifact(model_path, mmap_dir, key)
+    if loaded is None:
+        loaded = _load_artifact(model_path, mmap_dir, key)
+    return loaded
+
+
+def publish_model(loaded: LoadedModel) -> None:
+    """Make ``loaded`` the shared load for its path, dropping older versions."""
+    with _LOAD_LOCK:
+        for stale in [key for key in _LOADED_MODELS if key[:2] == loaded.key[:2]]:
+            del _LOADED_MODELS[stale]
+        _LOADED_MODELS[loaded.key] = loaded
+
+
+def _artifact_key(model_path: Path, mmap_dir: Optional[Path]) -> Tuple[str, str, int, int]:
+    resolved = model_path.resolve()
+    stat = resolved.stat()
+    return str(resolved), str(mmap_dir or ""), stat.st_mtime_ns, stat.st_size
+
+
+def _load_artifact(
+    model_path: Path,
+    mmap_dir: Optional[Path],
+    key: Tuple[str, str, int, int],
+) -> LoadedModel:
+    artifact_bytes = model_path.read_bytes()
+    artifact_id = hashlib.sha256(artifact_bytes).hexdigest()
+    compiled_path = _compiled_path(model_path, artifact_id)
+    cached = load_compiled(compiled_path, artifact_id) if compiled_path is not None and compiled_path.exists() else None
+    if cached is not None:
+        # Parity with sklearn and skimage was checked when the file was
+        # written; load_compiled re-scores the probes saved with it, so this
+        # path never imports either of them.
+        compiled, extra = cached
+        hog_params = {
+            name: tuple(value) if isinstance(value, list) else value
+            for name, value in extra["hog_params"].items()
+        }
+        extractor = FixedHogExtractor.from_params(hog_params, _DIGIT_CANVAS_SIZE) if extra["hog_vectorized"] else None
+        return LoadedModel(
+            model=None,
+            scaler=None,
+            scoring_model=compiled,
+            scoring_scaler=IdentityScaler(),
+            scoring_backend="compiled-linear",
+            hog_params=hog_params,
+            hog_extractor=extractor,
+            artifact_id=artifact_id,
+            version=extra["version"],
+            source_path=model_path,
+            loaded_at=time.time(),
+            loaded_pid=os.getpid(),
+            key=key,
+            load_source="compiled-cache",
+        )
+
+    import joblib
+
+    mmap_path = None
+    if mmap_dir is not None:
+        mmap_path = _ensure_mmap_bundle(artifact_bytes, artifact_id, Path(mmap_dir))
+        artifact = joblib.load(mmap_path, mmap_mode="r")
+    else:
+        artifact = joblib.load(io.BytesIO(artifact_bytes))
+    model = artifact.get("model")
+    scaler = artifact.get("scaler")
+    hog_params = {**_DEFAULT_HOG_PARAMS, **(artifact.get("hog_params") or {})}
+    if model is None or scaler is None:
+        raise RuntimeError(
+            "File model tidak valid. Harus berisi key 'model' dan 'scaler'.",
+        )
+    version = str(artifact.get("version") or artifact_id[:12])
+    extractor = FixedHogExtractor.from_params(hog_params, _DIGIT_CANVAS_SIZE)
+    if extractor is not None and not extractor.matches_reference():
+        extractor = None
+    compiled, reason = compile_linear_model(model, scaler)
+    if compiled is not None:
+        scoring_model, scoring_scaler, scoring_backend = compiled, IdentityScaler(), "compiled-linear"
+        if compiled_path is not None:
+            extra = {"hog_params": hog_params, "hog_vectorized": extractor is not None, "version": version}
+            try:
+                save_compiled(compiled, compiled_path, artifact_id, extra)
+            except (OSError, TypeError) as exc:
+                print(f"[WARN] Gagal menyimpan model terkompilasi: {exc}")
+    else:
+        scoring_model, scoring_scaler, scoring_backend = model, scaler, f"sklearn ({reason})"
+    return LoadedModel(
+        model=model,
+        scaler=scaler,
+        scoring_model=scoring_model,
+        scoring_scaler=scoring_scaler,
+        scoring_backend=scoring_backend,
+        hog_params=hog_params,
+        hog_extractor=extractor,
+        artifact_id=artifact_id,
+        version=version,
+        source_path=model_path,
+        loaded_at=time.time(),
+        loaded_pid=os.getpid(),
+        mmap_path=mmap_path,
+        key=key,
+        load_source="mmap" if mmap_path is not None else "joblib",
+    )
+
+
+def _compiled_path(model_path: Path, artifact_id: str) -> Optional[Path]:
+    """Where the sklearn-free compiled model for ``artifact_id`` is cached.
+
+    ``MODEL_COMPILED_DIR`` overrides the default ``.compiled`` folder next
+    to the artifact; ``off`` disables the cache.
+    """
+    setting = os.getenv("MODEL_COMPILED_DIR", "")
+    if setting == "off":
+        return None
+    directory = Path(setting) if setting else model_path.parent / ".compiled"
+    return directory / f"{artifact_id}.npz"
+
+
+def validate_model(loaded: LoadedModel) -> dict:
+    """Classify rendered digits 0-9 with ``loaded`` before it serves traffic.
+
+    Also warms the scoring path (per-thread buffers, first-call overhead)
+    so the first real request after a swap is not the slow one.
+    """
+    crops: List[np.ndarray] = []
+    expected: List[str] = []
+    for font in _WARMUP_FONTS:
+        for digit in range(10):
+            canvas = np.zeros((48, 40), dtype=np.uint8)
+            cv2.putText(canvas, str(digit), (6, 40), font, 1.2, 255, 3, cv2.LINE_AA)
+            ys, xs = np.nonzero(canvas)
+            y0, x0 = max(0, ys.min() - _BBOX_PAD), max(0, xs.min() - _BBOX_PAD)
+            crops.append(_resize_and_center(canvas[y0 : ys.max() + 1 + _BBOX_PAD, x0 : xs.max() + 1 + _BBOX_PAD]))
+            expected.append(str(digit))
+    start = time.perf_counter()
+    predictions = _classify_crops(
+        crops,
+        model=loaded.scoring_model,
+        scaler=loaded.scoring_scaler,
+        hog_params=loaded.hog_params,
+        hog_extractor=loaded.hog_extractor,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    confidences = np.asarray([confidence for _, confidence in predictions], dtype=np.float64)
+    if len(predictions) != len(crops) or not np.all(np.isfinite(confidences)):
+        raise RuntimeError("Model menghasilkan skor tidak valid pada set warm-up.")
+    correct = sum(str(label) == digit for (label, _), digit in zip(predictions, expected))
+    return {
+        "samples": len(crops),
+        "accuracy": round(correct / len(crops), 4),
+        "elapsed_ms": round(elapsed_ms, 3),
+    }
+
+
+def _ensure_mmap_bundle(artifact_bytes: bytes, artifact_id: str, mmap_dir: Path) -> Path:
+    """Write an uncompressed copy of the artifact that joblib can memory-map."""
+    import joblib
+
+    bundle_path = mmap_dir / f"{artifact_id}.joblib"
+    if bundle_path.exists():
+        return bundle_path
+    mmap_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = mmap_dir / f".{artifact_id}.{os.getpid()}.tmp"
+    try:
+        joblib.dump(joblib.load(io.BytesIO(artifact_bytes)), tmp_path, compress=0)
+        os.replace(tmp_path, bundle_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return bundle_path
+
+
+def _ingest_image(
+    image_bytes: bytes,
+    expected_digits: Optional[int] = None,
+    keep_color: bool = False,
+    crop_box: Optional[CropBox] = None,
+) -> dict:
+    """Decode an upload into a grayscale frame at a capped working resolution.
+
+    Frames that need downscaling are decoded straight to grayscale, using
+    JPEG DCT scaling (``IMREAD_REDUCED_*``) when the header shows how large
+    they are. Frames already within the cap keep the color decode and BGR to
+    gray conversion so their predictions stay bit-identical. The color frame
+    is only kept when a debug payload needs it.
+
+    ``crop_box`` is an ``(x, y, width, height)`` region in upload pixels
+    (after EXIF orientation). The working scale and the DCT reduction are
+    chosen for the region alone, and the decoded frame is sliced before
+    color conversion, resizing and preprocessing; ``bbox_offset`` maps
+    results back to full-frame coordinates.
+    """
+    np_buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    header_size = _probe_dimensions(image_bytes)
+    reduction = 1
+    full_color = None
+    region_size = header_size
+    if header_size is not None and crop_box is not None:
+        region_size = _crop_region_size(crop_box, header_size)
+    header_scale = 1.0 if region_size is None else _working_scale(*region_size, expected_digits)
+    if header_scale < 1.0:
+        reduction = _reduction_factor(header_scale)
+        gray = cv2.imdecode(np_buffer, _GRAY_DECODE_FLAGS[reduction])
+    else:
+        full_color = cv2.imdecode(np_buffer, cv2.IMREAD_COLOR)
+        gray = None
+    frame = gray if gray is not None else full_color
+    if frame is None or frame.size == 0:
+        raise RecognitionError("Berkas gambar tidak dapat dibaca.")
+    decode_bytes = frame.nbytes
+
+    original_h, original_w = frame.shape[:2]
+    if reduction > 1:
+        header_h, header_w = header_size
+        # EXIF orientation may have rotated the decoded frame.
+        if (original_h > original_w) != (header_h > header_w):
+            header_h, header_w = header_w, header_h
+        original_h, original_w = header_h, header_w
+    # Decoded pixels per upload pixel; below 1 after a reduced decode.
+    factor_x = frame.shape[1] / original_w
+    factor_y = frame.shape[0] / original_h
+    window = (slice(None), slice(None))
+    region_x, region_y = 0.0, 0.0
+    region_w, region_h = float(original_w), float(original_h)
+    if crop_box is not None:
+        window, (region_x, region_y, region_w, region_h) = _crop_window(
+            crop_box,
+            (original_h, original_w),
+            (factor_x, factor_y),
+            frame.shape[:2],
+        )
+    if full_color is not None:
+        full_color = full_color[window]
+        gray = cv2.cvtColor(full_color, cv2.COLOR_BGR2GRAY)
+        decode_bytes += gray.nbytes
+    else:
+        gray = gray[window]
+
+    scale = _working_scale(region_h, region_w, expected_digits)
+    working_size = (
+        max(1, int(round(region_w * scale))),
+        max(1, int(round(region_h * scale))),
+    )
+    resized = _resize_to(gray, working_size)
+    if resized is not gray:
+        decode_bytes += resized.nbytes
+    gray = resized
+
+    color = None
+    if keep_color:
+        color = full_color
+        if color is None:
+            color = cv2.imdecode(np_buffer, _COLOR_DECODE_FLAGS[reduction])
+            if color is None:
+                raise RecognitionError("Berkas gambar tidak dapat dibaca.")
+            decode_bytes += color.nbytes
+            color = color[window]
+        color = _resize_to(color, working_size)
+    return {
+        "gray": gray,
+        "color": color,
+        "upload_bytes": len(image_bytes),
+        "decode_bytes": decode_bytes,
+        "bbox_scale": (working_size[0] / region_w, working_size[1] / region_h),
+        "bbox_offset": (region_x, region_y),
+        "original_size": (original_h, original_w),
+    }
+
+
+def _crop_region_size(crop_box: CropBox, header_size: Tuple[int, int]) -> Tuple[int, int]:
+    """``(height, width)`` of ``crop_box`` clipped to the header dimensions."""
+    x, y, width, height = crop_box
+    header_h, header_w = header_size
+    # The header may predate EXIF rotation, so clip against the longer side.
+    longest = max(header_h, header_w)
+    return (
+        max(1, min(y + height, longest) - min(y, longest)),
+        max(1, min(x + width, longest) - min(x, longest)),
+    )
+
+
+def _crop_window(
+    crop_box: CropBox,
+    original_size: Tuple[int, int],
+    factor: Tuple[float, float],
+    frame_size: Tuple[int, int],
+) -> Tuple[Tuple[slice, slice], Tuple[float, float, float, float]]:
+    """Slice of the decoded frame covering ``crop_box`` and the upload-pixel
+    ``(x, y, width, height)`` that slice spans."""
+    x, y, width, height = crop_box
+    original_h, original_w = original_size
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(original_w, x + width), min(original_h, y + height)
+    if x1 <= x0 or y1 <= y0:
+        raise RecognitionError("crop_box berada di luar gambar.")
+    factor_x, factor_y = factor
+    frame_h, frame_w = frame_size
+    dx0 = min(frame_w - 1, int(math.floor(x0 * factor_x)))
+    dy0 = min(frame_h - 1, int(math.floor(y0 * factor_y)))
+    dx1 = max(dx0 + 1, min(frame_w, int(math.ceil(x1 * factor_x))))
+    dy1 = max(dy0 + 1, min(frame_h, int(math.ceil(y1 * factor_y))))
+    region = (dx0 / factor_x, dy0 / factor_y, (dx1 - dx0) / factor_x, (dy1 - dy0) / factor_y)
+    return (slice(dy0, dy1), slice(dx0, dx1)), region
+
+
+def _resize_to(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    if (image.shape[1], image.shape[0]) == size:
+        return image
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def _working_scale(height: int, width: int, expected_digits: Optional[int] = None) -> float:
+    """Downscale factor bringing the estimated digit height to the size the
+    pipeline constants (background kernel, pads, minimum area) are tuned for.
+    """
+    if height <= 0 or width <= 0:
+        return 1.0
+    digit_height = float(min(height, width))
+    if expected_digits and expected_digits > 0:
+        digit_height = min(digit_height, max(height, width) / expected_digits * _DIGIT_ASPECT)
+    scale = min(
+        1.0,
+        math.sqrt(_MAX_WORKING_PIXELS / float(height * width)),
+        _MAX_WORKING_DIGIT_HEIGHT / digit_height,
+    )
+    return max(scale, min(1.0, _MIN_WORKING_DIGIT_HEIGHT / digit_height))
+
+
+def _reduction_factor(scale: float) -> int:
+    for factor in (8, 4, 2):
+        if scale * factor <= 1.0:
+            return factor
+    return 1
+
+
+def _probe_dimensions(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """Read ``(height, width)`` from a PNG or JPEG header without decoding."""
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n" and len(image_bytes) >= 24:
+        width, height = struct.unpack(">II", image_bytes[16:24])
+        return int(height), int(width)
+    if image_bytes[:2] != b"\xff\xd8":
+        return None
+    index = 2
+    size = len(image_bytes)
+    while index + 4 <= size:
+        if image_bytes[index] != 0xFF:
+            return None
+        marker = image_bytes[index + 1]
+        if marker == 0xFF:
+            index += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            index += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if index + 9 > size:
+                return None
+            height, width = struct.unpack(">HH", image_bytes[index + 5 : index + 9])
+            return (int(height), int(width)) if height and width else None
+        (length,) = struct.unpack(">H", image_bytes[index + 2 : index + 4])
+        index += 2 + length
+    return None
+
+
+def _build_result(
+    pipeline_output: dict,
+    processing_time_ms: int,
+    detail: str,
+    retain_debug: bool,
+    timings: Optional[Dict[str, float]] = None,
+    loaded: Optional[LoadedModel] = None,
+    image_encoding: Optional[ImageEncoding] = None,
+) -> RecognitionResult:
+    segments = pipeline_output["segments"]
+    records = pipeline_output["records"]
+    if not segments or not records:
+        raise RecognitionError("Digit tidak terdeteksi pada gambar.")
+
+    digit_components: List[DigitComponent] = []
+    prediction_chars: List[str] = []
+    raw_confidences: List[float] = []
+
+    for record in records:
+        label_str = str(record["label"])
+        confidence_pct = round(float(record["confidence"]) * 100.0, 2)
+        digit_components.append(
+            DigitComponent(
+                label=label_str,
+                confidence=confidence_pct,
+                bbox=record["bbox"],
+            ),
+        )
+        prediction_chars.append(label_str)
+        raw_confidences.append(float(record["confidence"]))
+
+    prediction = "".join(prediction_chars)
+    accuracy = round(float(np.mean(raw_confidences) * 100.0), 2) if raw_confidences else 0.0
+
+    debug = PipelineDebug(
+        raw_bgr=pipeline_output["raw_bgr"],
+        preprocessed=pipeline_output["preprocessed"],
+        mask=pipeline_output["mask"],
+        segments=segments,
+        records=records,
+        summary={
+            "prediction": prediction,
+            "accuracy": round(accuracy, 2),
+            "processing_time_ms": processing_time_ms,
+            "digit_count": len(digit_components),
+            "contrast_std_dev": round(float(pipeline_output["std_dev"]), 2),
+            "model_version": loaded.version if loaded is not None else None,
+            "segmentation": pipeline_output.get("segmentation"),
+        },
+    )
+
+    timings = {} if timings is None else timings
+    with timed(timings, "encode"):
+        pipeline = debug.render(detail, image_encoding)
+    stage_ms = {stage: round(value, 3) for stage, value in timings.items()}
+    peak_memory_bytes = int(pipeline_output.get("peak_memory_bytes", 0))
+    debug.summary["stage_ms"] = stage_ms
+    debug.summary["peak_memory_bytes"] = peak_memory_bytes
+    if pipeline is not None:
+        pipeline["summary"]["stage_ms"] = stage_ms
+        pipeline["summary"]["peak_memory_bytes"] = peak_memory_bytes
+
+    return RecognitionResult(
+        prediction=prediction,
+        accuracy=round(accuracy, 2),
+        processing_time_ms=processing_time_ms,
+        digits=digit_components,
+        pipeline=pipeline,
+        debug=debug if retain_debug else None,
+        stage_timings=timings,
+        peak_memory_bytes=peak_memory_bytes,
+        artifact_id=loaded.artifact_id if loaded is not None else None,
+        model_version=loaded.version if loaded is not None else None,
+    )
+
+
+@dataclass
+class PipelineDebug:
+    """Intermediate pipeline images, encoded only when a payload is rendered."""
+
+    raw_bgr: Optional[np.ndarray]
+    preprocessed: np.ndarray
+    mask: np.ndarray
+    segments: List[dict]
+    records: List[dict]
+    summary: dict
+
+    def render(self, detail: str = "full", encoding: Optional[ImageEncoding] = None) -> Optional[dict]:
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f"Detail pipeline tidak dikenal: {detail}")
+        if detail == "none":
+            return None
+        stages: List[dict] = []
+        digit_crops: List[dict] = []
+        if detail in ("stages", "full"):
+            stages = [
+                {
+                    "key": key,
+                    "title": title,
+                    "description": description,
+                    "image": _encode_image(build(), encoding),
+                }
+                for key, title, description, build in self._stage_builders()
+            ]
+        if detail == "full":
+            digit_crops = [
+                {
+                    "index": record["index"],
+                    "label": str(record["label"]),
+                    "confidence": round(float(record["confidence"]) * 100.0, 2),
+                    "image": _encode_image(_prepare_digit_debug_image(record["crop"]), encoding),
+                }
+                for record in self.records
+            ]
+        return {
+            "stages": stages,
+            "digit_crops": digit_crops,
+            "summary": dict(self.summary),
+        }
+
+    def _stage_builders(self) -> List[Tuple[str, str, str, Callable[[], np.ndarray]]]:
+        return [
+            (
+                "original",
+                "1. Foto Asli",
+                "Input yang diterima dari kamera atau galeri.",
+                lambda: self.raw_bgr if self.raw_bgr is not None else self.preprocessed,
+            ),
+            (
+                "preprocess",
+                "2. Preprocessing",
+                "Normalisasi kontras, CLAHE, dan balancing warna untuk menonjolkan digit.",
+                lambda: self.preprocessed,
+            ),
+            (
+                "mask",
+                "3. Masking",
+                "Threshold adaptif untuk memisahkan digit dari latar belakang.",
+                lambda: cv2.cvtColor(self.mask, cv2.COLOR_GRAY2BGR),
+            ),
+            (
+                "segments",
+                "4. Segmentasi",
+                "Bounding box setiap digit serta urutan pembacaannya.",
+                lambda: _draw_overlay(self.preprocessed, self.segments),
+            ),
+        ]
 
 _DIGIT_CANVAS_SIZE = 28
 _TARGET_DIGIT_EXTENT = 20
@@ -189,6 +1003,37 @@ _MIN_SEGMENT_AREA = 80
 _PROJECTION_PAD = 2
 _BBOX_PAD = 2
 _OWNERSHIP_MARGIN = 3
+_OWNERSHIP_TILE = 48
+_MAX_WORKING_PIXELS = 2_000_000
+_MIN_WORKING_DIGIT_HEIGHT = 48
+_MAX_WORKING_DIGIT_HEIGHT = 128
+_DIGIT_ASPECT = 1.5
+# Segmentation retries: a result is accepted once every digit reaches
+# ``retry_confidence``; cheaper tiers run first.
+_RETRY_TIERS = (("projection",), ("split_wide", "merge_stacked"))
+_RETRY_MIN_GAIN = 0.05
+# Only contours at least this fraction of the tallest one can hold touching digits.
+_WIDE_SEGMENT_MIN_HEIGHT = 0.75
+_STACKED_OVERLAP = 0.5
+DEFAULT_RETRY_CONFIDENCE = 0.6
+DEFAULT_RETRY_BUDGET_MS = 30.0
+_GRAY_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+_COLOR_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+_DEFAULT_IMAGE_ENCODING = ImageEncoding()
+_CROP_SCRATCH = threading.local()
+_WARMUP_FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_JPEG_STANDALONE_MARKERS = frozenset({0x01, *range(0xD0, 0xD9)})
 _DEFAULT_HOG_PARAMS = {
     "pixels_per_cell": (4, 4),
     "cells_per_block": (2, 2),
@@ -202,11 +1047,45 @@ def _ensure_foreground_white(img: np.ndarray) -> np.ndarray:
     return cv2.bitwise_not(img) if np.mean(img) > 127 else img
 
 
-def _normalize_uint8(img: np.ndarray) -> np.ndarray:
-    img = img.astype(np.float32)
-    if img.max() > img.min():
-        img = (img - img.min()) / (img.max() - img.min()) * 255.0
-    return img.astype(np.uint8)
+def _normalize_uint8(img: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Stretch ``img`` to 0-255 as uint8, into ``out`` when given.
+
+    With ``out`` the float32 work buffer is per-thread scratch, so nothing
+    is allocated; the arithmetic (and therefore every pixel) is the same.
+    """
+    if out is None:
+        work = img.astype(np.float32)
+    else:
+        work = _scratch("normalize", img.shape, np.float32)
+        np.copyto(work, img, casting="unsafe")
+    low, high = work.min(), work.max()
+    if high > low:
+        np.subtract(work, low, out=work)
+        np.divide(work, high - low, out=work)
+        np.multiply(work, 255.0, out=work)
+    if out is None:
+        return work.astype(np.uint8)
+    np.copyto(out, work, casting="unsafe")
+    return out
+
+
+def _scratch(name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+    """Contiguous per-thread work buffer of ``shape``, reused across calls.
+
+    Buffers only grow (doubling), so a worker settles on a fixed set after
+    its first requests. The next call with the same ``name`` on this thread
+    overwrites the contents, so nothing returned from here may outlive the
+    function that asked for it.
+    """
+    buffers = getattr(_CROP_SCRATCH, "buffers", None)
+    if buffers is None:
+        buffers = _CROP_SCRATCH.buffers = {}
+    count = math.prod(shape)
+    buffer = buffers.get(name)
+    if buffer is None or buffer.size < count:
+        capacity = max(count, 1024 if buffer is None else buffer.size * 2)
+        buffer = buffers[name] = np.empty(capacity, dtype=dtype)
+    return buffer[:count].reshape(shape)
 
 
 def _remove_background_variation(gray: np.ndarray) -> np.ndarray:
@@ -215,7 +1094,10 @@ def _remove_background_variation(gray: np.ndarray) -> np.ndarray:
     return cv2.subtract(bg, gray)
 
 
-def _robust_preprocessing(image: np.ndarray) -> Tuple[np.ndarray, float]:
+def _robust_preprocessing(
+    image: np.ndarray,
+    timings: Optional[Dict[str, float]] = None,
+) -> Tuple[np.ndarray, float]:
     if image is None:
         raise ValueError("Input image kosong")
     if image.ndim == 3:
@@ -224,7 +1106,8 @@ def _robust_preprocessing(image: np.ndarray) -> Tuple[np.ndarray, float]:
         gray = image.copy()
 
     blurred = cv2.GaussianBlur(gray, (3, 3), 0)
-    normalized = _remove_background_variation(blurred)
+    with timed(timings, "background"):
+        normalized = _remove_background_variation(blurred)
     clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
     enhanced = clahe.apply(normalized)
     std_dev = float(np.std(enhanced))
@@ -232,12 +1115,19 @@ def _robust_preprocessing(image: np.ndarray) -> Tuple[np.ndarray, float]:
     return enhanced, std_dev
 
 
+def _fit_canvas(img: np.ndarray) -> np.ndarray:
+    if img.shape != (_DIGIT_CANVAS_SIZE, _DIGIT_CANVAS_SIZE):
+        img = cv2.resize(img, (_DIGIT_CANVAS_SIZE, _DIGIT_CANVAS_SIZE), interpolation=cv2.INTER_AREA)
+    return img
+
+
 def _extract_hog(
     img: np.ndarray,
     hog_params: Optional[dict] = None,
 ) -> np.ndarray:
-    if img.shape != (_DIGIT_CANVAS_SIZE, _DIGIT_CANVAS_SIZE):
-        img = cv2.resize(img, (_DIGIT_CANVAS_SIZE, _DIGIT_CANVAS_SIZE), interpolation=cv2.INTER_AREA)
+    from skimage.feature import hog
+
+    img = _fit_canvas(img)
     params = {**_DEFAULT_HOG_PARAMS}
     if hog_params:
         params.update(hog_params)
@@ -248,38 +1138,71 @@ def _resize_and_center(
     img: np.ndarray,
     size: int = _DIGIT_CANVAS_SIZE,
     target_extent: int = _TARGET_DIGIT_EXTENT,
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
+    """Scale a digit patch to ``target_extent`` and centre its mass on a ``size`` square.
+
+    The result is written to ``out`` (a ``(size, size)`` uint8 slot, usually
+    a row of the crop stack a segmentation pass fills) when given. The
+    normalized patch and the canvas are per-thread scratch and the resize and
+    shift write straight into them, so a crop allocates nothing else.
+    """
+    if out is None:
+        out = np.empty((size, size), dtype=np.uint8)
     if img is None or img.size == 0:
-        return np.zeros((size, size), dtype=np.uint8)
+        out.fill(0)
+        return out
     if img.ndim == 3:
         img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    img = _normalize_uint8(img)
-    img = _ensure_foreground_white(img)
-
     h, w = img.shape[:2]
-    if h == 0 or w == 0:
-        return np.zeros((size, size), dtype=np.uint8)
+    img = _normalize_uint8(img, out=_scratch("normalized", (h, w)))
+    # _ensure_foreground_white's mean > 127, compared exactly on the pixel sum.
+    if cv2.sumElems(img)[0] > 127 * img.size:
+        cv2.bitwise_not(img, dst=img)
+
     scale = target_extent / max(h, w)
     new_w = max(1, int(round(w * scale)))
     new_h = max(1, int(round(h * scale)))
     interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
-    digit = cv2.resize(img, (new_w, new_h), interpolation=interp)
-
-    canvas = np.zeros((size, size), dtype=np.uint8)
+    canvas = _scratch("canvas", (size, size))
+    canvas.fill(0)
     y_off = (size - new_h) // 2
     x_off = (size - new_w) // 2
-    canvas[y_off : y_off + new_h, x_off : x_off + new_w] = digit
+    cv2.resize(img, (new_w, new_h), dst=canvas[y_off : y_off + new_h, x_off : x_off + new_w], interpolation=interp)
 
+    shift_x = shift_y = 0
     moments = cv2.moments(canvas)
     if abs(moments.get("m00", 0.0)) > 1e-6:
         cx = moments["m10"] / moments["m00"]
         cy = moments["m01"] / moments["m00"]
-        shift_x = int(np.clip(size / 2 - cx, -size, size))
-        shift_y = int(np.clip(size / 2 - cy, -size, size))
+        shift_x = int(min(max(size / 2 - cx, -size), size))
+        shift_y = int(min(max(size / 2 - cy, -size), size))
+    if shift_x or shift_y:
         shift_mat = np.float32([[1, 0, shift_x], [0, 1, shift_y]])
-        canvas = cv2.warpAffine(canvas, shift_mat, (size, size), borderValue=0)
+        cv2.warpAffine(canvas, shift_mat, (size, size), dst=out, borderValue=0)
+    else:
+        np.copyto(out, canvas)
+    return out
+
+
+# Digit crops to classify: a list of crops or an ``(N, 28, 28)`` crop stack.
+Crops = Union[List[np.ndarray], np.ndarray]
+
 
-    return canvas
+def _crop_stack(count: int) -> np.ndarray:
+    """Output rows for the crops of one segmentation pass."""
+    return np.empty((count, _DIGIT_CANVAS_SIZE, _DIGIT_CANVAS_SIZE), dtype=np.uint8)
+
+
+def _stack_crops(crops: Crops) -> np.ndarray:
+    """``crops`` as one ``(N, 28, 28)`` uint8 array for batched HOG.
+
+    A crop stack from segmentation is used as is; a list of crops is
+    copied into a new stack.
+    """
+    if isinstance(crops, np.ndarray):
+        return crops
+    return np.stack([_fit_canvas(crop) for crop in crops])
 
 
 def _build_clean_mask(img_clean: np.ndarray) -> np.ndarray:
@@ -321,6 +1244,65 @@ def _build_ownership_mask(
     return np.where(ownership, 255, 0).astype(np.uint8)
 
 
+def _build_ownership_map(
+    shape: Tuple[int, int],
+    boxes: List[Tuple[int, int, int, int]],
+    centroids: List[Tuple[float, float]],
+    margin_px: int = _OWNERSHIP_MARGIN,
+) -> np.ndarray:
+    """Label each pixel inside a box with the centroid that owns it, else -1.
+
+    A pixel belongs to centroid ``i`` when its squared distance to ``i`` is
+    at most the distance to every other centroid minus ``margin_px**2``,
+    the same rule (and float32 arithmetic) as ``_build_ownership_mask``,
+    which stays as the reference. Boxes are cut into tiles and the
+    tile-to-centroid distance bounds are computed for all pairs at once;
+    each tile then only ranks the centroids that can be nearest there or
+    within the margin of the nearest, which cannot change the outcome.
+    """
+    labels = np.full(shape, -1, dtype=np.int32)
+    tiles = [
+        (tx, ty, min(tx + _OWNERSHIP_TILE, x1), min(ty + _OWNERSHIP_TILE, y1))
+        for x0, y0, x1, y1 in boxes
+        for ty in range(y0, y1, _OWNERSHIP_TILE)
+        for tx in range(x0, x1, _OWNERSHIP_TILE)
+    ]
+    if not tiles:
+        return labels
+    tile_arr = np.asarray(tiles, dtype=np.float64)
+    cent32 = np.asarray(centroids, dtype=np.float32)
+    cent = cent32.astype(np.float64)
+    margin_sq = np.float32(margin_px * margin_px)
+
+    # (tiles, centroids) squared distances to the closest and farthest pixel.
+    cx, cy = cent[None, :, 0], cent[None, :, 1]
+    left, top = tile_arr[:, 0, None], tile_arr[:, 1, None]
+    right, bottom = tile_arr[:, 2, None] - 1, tile_arr[:, 3, None] - 1
+    near_x = np.clip(cx, left, right) - cx
+    near_y = np.clip(cy, top, bottom) - cy
+    far_x = np.maximum(np.abs(cx - left), np.abs(cx - right))
+    far_y = np.maximum(np.abs(cy - top), np.abs(cy - bottom))
+    nearest_bound = near_x * near_x + near_y * near_y
+    bound = (far_x * far_x + far_y * far_y).min(axis=1, keepdims=True)
+    # The slack covers float32 rounding, so pruning never flips a pixel.
+    relevant = nearest_bound <= bound + float(margin_sq) + 8.0 + bound * 1e-5
+
+    for (x0, y0, x1, y1), mask in zip(tiles, relevant):
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 1:
+            labels[y0:y1, x0:x1] = candidates[0]
+            continue
+        dx = np.arange(x0, x1, dtype=np.float32)[None, :] - cent32[candidates, 0][:, None]
+        dy = np.arange(y0, y1, dtype=np.float32)[None, :] - cent32[candidates, 1][:, None]
+        dist = (dx * dx)[:, None, :] + (dy * dy)[:, :, None]
+        order = np.argmin(dist, axis=0)
+        nearest = np.take_along_axis(dist, order[None], axis=0)[0]
+        np.put_along_axis(dist, order[None], np.inf, axis=0)
+        runner_up = dist.min(axis=0)
+        labels[y0:y1, x0:x1] = np.where(nearest <= runner_up - margin_sq, candidates[order], -1)
+    return labels
+
+
 def _split_with_projection(
     mask: np.ndarray,
     img_clean: np.ndarray,
@@ -343,6 +1325,7 @@ def _split_with_projection(
     for i in range(1, len(cut_points)):
         cut_points[i] = int(np.clip(cut_points[i], cut_points[i - 1] + 1e-3, w))
 
+    crops = _crop_stack(expected_digits)
     digits: List[dict] = []
     for i in range(expected_digits):
         x0 = max(0, cut_points[i] - _PROJECTION_PAD)
@@ -369,7 +1352,7 @@ def _split_with_projection(
             y_min = max(0, y_min - _BBOX_PAD)
             y_max = min(h, y_max + _BBOX_PAD)
         digit_patch = img_clean[y_min:y_max, x_min:x_max]
-        crop = _resize_and_center(digit_patch)
+        crop = _resize_and_center(digit_patch, out=crops[len(digits)])
         digits.append({
             "bbox": (x_min, y_min, x_max - x_min, y_max - y_min),
             "crop": crop,
@@ -387,57 +1370,347 @@ def _ensure_bgr(image: np.ndarray) -> np.ndarray:
     return image
 
 
-def _run_prediction_pipeline(
-    image: np.ndarray,
-    expected_digits: Optional[int],
-    model,
-    scaler,
-    hog_params: Optional[dict],
+def _segment_image(
+    ingested: dict,
+    timings: Optional[Dict[str, float]] = None,
+    boxes: Optional[List[Tuple[int, int, int, int]]] = None,
 ) -> dict:
-    raw_bgr = _ensure_bgr(image)
-    preprocessed, std_dev = _robust_preprocessing(raw_bgr)
-    segments, mask = _segment_digits(preprocessed, expected_digits, min_area=_MIN_SEGMENT_AREA)
-    records: List[dict] = []
-
-    for idx, entry in enumerate(segments):
-        crop = entry.get("crop")
-        bbox = entry.get("bbox")
-        if crop is None or bbox is None:
-            continue
-        features = _extract_hog(crop, hog_params=hog_params)
-        scaled = scaler.transform(features.reshape(1, -1))
-        scores = _decision_scores(model, scaled)
-        if scores is not None:
-            probs = _softmax(scores)
-            pred_idx = int(np.argmax(probs))
-            label_value = _resolve_label(model, pred_idx, len(probs))
-            confidence = float(probs[pred_idx])
+    """Preprocess and segment one ingested frame.
+
+    ``boxes`` (working-resolution ``(x, y, w, h)``) skips contour
+    segmentation and cuts the crops at those positions, which is how a
+    stream reuses the segmentation of an earlier frame.
+    """
+    with timed(timings, "preprocess"):
+        preprocessed, std_dev = _robust_preprocessing(ingested["gray"], timings=timings)
+    with timed(timings, "segment"):
+        if boxes is None:
+            segments, mask, crop_stack = _segment_digits(
+                preprocessed,
+                min_area=_MIN_SEGMENT_AREA,
+                timings=timings,
+            )
         else:
-            label_value = int(model.predict(scaled)[0])
-            confidence = 0.75
+            segments, mask, crop_stack = _crop_segments(preprocessed, boxes)
+    color = ingested.get("color")
+    # Blur, background and CLAHE buffers are alive together during preprocessing.
+    working_bytes = ingested["gray"].nbytes + 3 * preprocessed.nbytes + mask.nbytes
+    if color is not None:
+        working_bytes += color.nbytes
+    return {
+        "raw_bgr": _ensure_bgr(color) if color is not None else None,
+        "peak_memory_bytes": ingested["upload_bytes"] + max(ingested["decode_bytes"], working_bytes),
+        "bbox_scale": ingested["bbox_scale"],
+        "bbox_offset": ingested["bbox_offset"],
+        "original_size": ingested["original_size"],
+        "preprocessed": preprocessed,
+        "mask": mask,
+        "std_dev": std_dev,
+        "segments": segments,
+        "crop_stack": crop_stack,
+    }
+
+
+def _valid_segments(segments: List[dict]) -> List[Tuple[int, dict]]:
+    return [
+        (idx, entry)
+        for idx, entry in enumerate(segments)
+        if entry.get("crop") is not None and entry.get("bbox") is not None
+    ]
+
+
+def _build_records(
+    valid: List[Tuple[int, dict]],
+    predictions: List[Tuple[object, float]],
+    bbox_scale: Tuple[float, float] = (1.0, 1.0),
+    bbox_offset: Tuple[float, float] = (0.0, 0.0),
+) -> List[dict]:
+    records: List[dict] = []
+    for (idx, entry), (label_value, confidence) in zip(valid, predictions):
         records.append({
             "index": idx,
-            "bbox": (int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])),
-            "crop": crop,
+            "bbox": _to_original_bbox(entry["bbox"], bbox_scale, bbox_offset),
+            "crop": entry["crop"],
             "label": label_value,
             "confidence": confidence,
         })
+    return records
+
+
+def _to_original_bbox(
+    bbox,
+    bbox_scale: Tuple[float, float],
+    bbox_offset: Tuple[float, float] = (0.0, 0.0),
+) -> Tuple[int, int, int, int]:
+    """Map a working-resolution ``(x, y, w, h)`` back to upload coordinates."""
+    x, y, w, h = (int(v) for v in bbox)
+    scale_x, scale_y = bbox_scale
+    offset_x, offset_y = bbox_offset
+    if scale_x == 1.0 and scale_y == 1.0 and float(offset_x).is_integer() and float(offset_y).is_integer():
+        return x + int(offset_x), y + int(offset_y), w, h
+    x0 = int(math.floor(x / scale_x + offset_x))
+    y0 = int(math.floor(y / scale_y + offset_y))
+    x1 = int(math.ceil((x + w) / scale_x + offset_x))
+    y1 = int(math.ceil((y + h) / scale_y + offset_y))
+    return x0, y0, x1 - x0, y1 - y0
 
-    return {
-        "raw_bgr": raw_bgr,
-        "preprocessed": preprocessed,
-        "mask": mask,
-        "std_dev": std_dev,
-        "segments": segments,
-        "records": records,
+
+def _run_prediction_pipeline(
+    ingested: dict,
+    expected_digits: Optional[int],
+    model,
+    scaler,
+    hog_params: Optional[dict],
+    hog_extractor: Optional[FixedHogExtractor] = None,
+    timings: Optional[Dict[str, float]] = None,
+    retry_confidence: float = 0.0,
+    deadline: Optional[float] = None,
+) -> dict:
+    output = _segment_image(ingested, timings=timings)
+
+    def _classify(crops: Crops) -> List[Tuple[object, float]]:
+        return _classify_crops(
+            crops,
+            model=model,
+            scaler=scaler,
+            hog_params=hog_params,
+            hog_extractor=hog_extractor,
+            timings=timings,
+        )
+
+    _resolve_segmentation(output, expected_digits, _classify, retry_confidence, deadline, timings)
+    return output
+
+
+@dataclass
+class _Candidate:
+    strategy: str
+    valid: List[Tuple[int, dict]]
+    predictions: List[Tuple[object, float]]
+    count_ok: bool
+    score: float
+    min_confidence: float
+
+    def summary(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "digit_count": len(self.valid),
+            "confidence": round(self.score * 100.0, 2),
+        }
+
+
+def _resolve_segmentation(
+    output: dict,
+    expected_digits: Optional[int],
+    classify: Callable[[Crops], List[Tuple[object, float]]],
+    retry_confidence: float,
+    deadline: Optional[float],
+    timings: Optional[Dict[str, float]] = None,
+    predictions: Optional[List[Tuple[object, float]]] = None,
+) -> None:
+    """Classify segmentation candidates, cheapest first, and keep the best.
+
+    The contour segmentation is always scored (``predictions`` may carry
+    its classification from a batched call). It is accepted when the digit
+    count matches ``expected_digits`` and every digit reaches
+    ``retry_confidence``; otherwise the tiers of ``_RETRY_TIERS`` run in
+    order, each classified in one batched call, until a candidate is
+    accepted, the tiers run out or ``deadline`` (a ``perf_counter`` value,
+    checked before each tier) passes. A candidate with the right digit
+    count always beats one without, which keeps the projection split as
+    the fallback for count mismatches; otherwise a retry must improve the
+    mean confidence by ``_RETRY_MIN_GAIN`` to replace the incumbent.
+    """
+    valid = _valid_segments(output["segments"])
+    # Every segmented entry is valid, so row i of the stack is valid[i].
+    crop_stack = output.pop("crop_stack")
+    if predictions is None:
+        predictions = classify(crop_stack)
+    best = _score_candidate("contour", valid, predictions, expected_digits)
+    attempts = [best]
+    seen = {_segment_boxes(valid)}
+    budget_exhausted = False
+    for level, tier in enumerate(_RETRY_TIERS):
+        if _accepts(best, retry_confidence):
+            break
+        # The budget never skips the projection split of a count mismatch.
+        over_budget = deadline is not None and time.perf_counter() >= deadline
+        if over_budget and (level > 0 or best.count_ok):
+            budget_exhausted = True
+            break
+        generated: List[Tuple[str, List[Tuple[int, dict]]]] = []
+        for strategy in tier:
+            segments = _RETRY_BUILDERS[strategy](output, expected_digits, timings)
+            candidate_valid = _valid_segments(segments)
+            boxes = _segment_boxes(candidate_valid)
+            if candidate_valid and boxes not in seen:
+                seen.add(boxes)
+                generated.append((strategy, candidate_valid))
+        if not generated:
+            continue
+        with timed(timings, "retry"):
+            tier_predictions = classify([entry["crop"] for _, strategy_valid in generated for _, entry in strategy_valid])
+        offset = 0
+        for strategy, candidate_valid in generated:
+            count = len(candidate_valid)
+            candidate = _score_candidate(
+                strategy,
+                candidate_valid,
+                tier_predictions[offset : offset + count],
+                expected_digits,
+            )
+            offset += count
+            attempts.append(candidate)
+            if _improves(candidate, best):
+                best = candidate
+
+    output["segments"] = [entry for _, entry in best.valid]
+    output["records"] = _build_records(best.valid, best.predictions, output["bbox_scale"], output["bbox_offset"])
+    output["segmentation"] = {
+        "strategy": best.strategy,
+        "attempts": len(attempts),
+        "accepted": _accepts(best, retry_confidence),
+        "budget_exhausted": budget_exhausted,
+        "candidates": [candidate.summary() for candidate in attempts],
     }
 
 
+def _score_candidate(
+    strategy: str,
+    valid: List[Tuple[int, dict]],
+    predictions: List[Tuple[object, float]],
+    expected_digits: Optional[int],
+) -> _Candidate:
+    confidences = [float(confidence) for _, confidence in predictions]
+    count_ok = bool(valid) and (not expected_digits or len(valid) == expected_digits)
+    return _Candidate(
+        strategy=strategy,
+        valid=valid,
+        predictions=predictions,
+        count_ok=count_ok,
+        score=float(np.mean(confidences)) if confidences else 0.0,
+        min_confidence=min(confidences) if confidences else 0.0,
+    )
+
+
+def _accepts(candidate: _Candidate, retry_confidence: float) -> bool:
+    return candidate.count_ok and candidate.min_confidence >= retry_confidence
+
+
+def _improves(candidate: _Candidate, incumbent: _Candidate) -> bool:
+    if candidate.count_ok != incumbent.count_ok:
+        return candidate.count_ok
+    return candidate.score > incumbent.score + _RETRY_MIN_GAIN
+
+
+def _segment_boxes(valid: List[Tuple[int, dict]]) -> Tuple[Tuple[int, int, int, int], ...]:
+    return tuple(tuple(int(v) for v in entry["bbox"]) for _, entry in valid)
+
+
+def _retry_projection(
+    output: dict,
+    expected_digits: Optional[int],
+    timings: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    if not expected_digits or expected_digits <= 0:
+        return []
+    with timed(timings, "projection_split"):
+        return _split_with_projection(output["mask"], output["preprocessed"], expected_digits, _MIN_SEGMENT_AREA // 2)
+
+
+def _retry_split_wide(
+    output: dict,
+    expected_digits: Optional[int],
+    timings: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    """Cut contours wide enough to hold touching digits by column projection."""
+    mask = output["mask"]
+    img_clean = output["preprocessed"]
+    digits: List[dict] = []
+    split_any = False
+    tallest = max((entry["bbox"][3] for entry in output["segments"]), default=0)
+    widths = [entry["bbox"][2] for entry in output["segments"] if entry["bbox"][3] >= tallest * _WIDE_SEGMENT_MIN_HEIGHT]
+    with timed(timings, "retry"):
+        for entry in output["segments"]:
+            x, y, w, h = entry["bbox"]
+            # Neighbouring digits give the typical width; a lone contour falls
+            # back to the usual digit aspect ratio.
+            digit_width = float(np.median(widths)) if len(widths) > 1 else h / _DIGIT_ASPECT
+            parts = int(round(w / max(digit_width, 1.0)))
+            if parts < 2 or h < tallest * _WIDE_SEGMENT_MIN_HEIGHT:
+                digits.append(entry)
+                continue
+            pieces = _split_with_projection(
+                mask[y : y + h, x : x + w],
+                img_clean[y : y + h, x : x + w],
+                parts,
+                _MIN_SEGMENT_AREA // 2,
+            )
+            if not pieces:
+                digits.append(entry)
+                continue
+            split_any = True
+            for piece in pieces:
+                px, py, pw, ph = piece["bbox"]
+                digits.append({"bbox": (x + px, y + py, pw, ph), "crop": piece["crop"]})
+    if not split_any:
+        return []
+    digits.sort(key=lambda item: item["bbox"][0])
+    return digits
+
+
+def _retry_merge_stacked(
+    output: dict,
+    expected_digits: Optional[int],
+    timings: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    """Merge fragments stacked in one column, as left by broken strokes."""
+    mask = output["mask"]
+    img_clean = output["preprocessed"]
+    groups: List[List[int]] = []
+    with timed(timings, "retry"):
+        for x, y, w, h in sorted(entry["bbox"] for entry in output["segments"]):
+            if groups:
+                gx0, gy0, gx1, gy1 = groups[-1]
+                overlap = min(gx1, x + w) - max(gx0, x)
+                if overlap >= _STACKED_OVERLAP * min(w, gx1 - gx0):
+                    groups[-1] = [gx0, min(gy0, y), max(gx1, x + w), max(gy1, y + h)]
+                    continue
+            groups.append([x, y, x + w, y + h])
+        if len(groups) == len(output["segments"]):
+            return []
+        crops = _crop_stack(len(groups))
+        digits: List[dict] = []
+        for x0, y0, x1, y1 in groups:
+            # The mask is 0/255, so AND-ing with it keeps or clears each pixel.
+            patch = np.bitwise_and(img_clean[y0:y1, x0:x1], mask[y0:y1, x0:x1], out=_scratch("masked", (y1 - y0, x1 - x0)))
+            crop = _resize_and_center(patch, out=crops[len(digits)])
+            digits.append({"bbox": (x0, y0, x1 - x0, y1 - y0), "crop": crop})
+    return digits
+
+
+_RETRY_BUILDERS: Dict[str, Callable[[dict, Optional[int], Optional[Dict[str, float]]], List[dict]]] = {
+    "projection": _retry_projection,
+    "split_wide": _retry_split_wide,
+    "merge_stacked": _retry_merge_stacked,
+}
+
+
 def _segment_digits(
     img_clean: np.ndarray,
-    expected_digits: Optional[int],
     min_area: int = _MIN_SEGMENT_AREA,
-) -> Tuple[List[dict], np.ndarray]:
+    timings: Optional[Dict[str, float]] = None,
+    ownership: str = "map",
+) -> Tuple[List[dict], np.ndarray, np.ndarray]:
+    """Split the cleaned frame into digit crops ordered left to right.
+
+    Returns the segments, the clean mask and the crop stack, whose row i
+    is the crop of segment i.
+
+    ``ownership="reference"`` masks each crop with the per-contour
+    ``_build_ownership_mask`` instead of slicing the shared ownership map;
+    both give identical crops and the benchmark checks that they do.
+    """
     clean_mask = _build_clean_mask(img_clean)
     contours, _ = cv2.findContours(clean_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     img_h, img_w = img_clean.shape[:2]
@@ -460,43 +1733,81 @@ def _segment_digits(
         })
 
     contour_infos.sort(key=lambda info: info["bbox"][0])
+    boxes = [
+        (max(0, x - _BBOX_PAD), max(0, y - _BBOX_PAD), min(img_w, x + w + _BBOX_PAD), min(img_h, y + h + _BBOX_PAD))
+        for x, y, w, h in (info["bbox"] for info in contour_infos)
+    ]
+    ownership_map = None
+    if len(contour_infos) > 1 and _OWNERSHIP_MARGIN > 0 and ownership == "map":
+        with timed(timings, "ownership"):
+            ownership_map = _build_ownership_map(
+                (img_h, img_w),
+                boxes,
+                [info["centroid"] for info in contour_infos],
+            )
+    crops = _crop_stack(len(contour_infos))
     digits: List[dict] = []
-    for info in contour_infos:
+    for index, (info, (x0, y0, x1, y1)) in enumerate(zip(contour_infos, boxes)):
         contour = info["contour"]
-        x, y, w, h = info["bbox"]
-        x0 = max(0, x - _BBOX_PAD)
-        y0 = max(0, y - _BBOX_PAD)
-        x1 = min(img_w, x + w + _BBOX_PAD)
-        y1 = min(img_h, y + h + _BBOX_PAD)
         digit_patch = img_clean[y0:y1, x0:x1]
         if digit_patch.size == 0:
             continue
-        contour_mask = np.zeros_like(digit_patch, dtype=np.uint8)
+        contour_mask = _scratch("contour_mask", digit_patch.shape)
+        contour_mask.fill(0)
         cv2.drawContours(contour_mask, [contour], -1, 255, thickness=cv2.FILLED, offset=(-x0, -y0))
-        if contour_mask.max() == 0:
+        if not cv2.countNonZero(contour_mask):
             continue
-        others = [c["centroid"] for c in contour_infos if c is not info]
-        if others and _OWNERSHIP_MARGIN > 0:
-            ownership = _build_ownership_mask(x0, y0, x1, y1, info["centroid"], others)
-            contour_mask = cv2.bitwise_and(contour_mask, ownership)
-            if contour_mask.max() == 0:
+        if len(contour_infos) > 1 and _OWNERSHIP_MARGIN > 0:
+            if ownership_map is not None:
+                owned = np.equal(ownership_map[y0:y1, x0:x1], index, out=_scratch("owned", digit_patch.shape, np.bool_))
+                np.multiply(contour_mask, owned, out=contour_mask)
+            else:
+                others = [c["centroid"] for c in contour_infos if c is not info]
+                with timed(timings, "ownership"):
+                    owned = _build_ownership_mask(x0, y0, x1, y1, info["centroid"], others)
+                cv2.bitwise_and(contour_mask, owned, dst=contour_mask)
+            if not cv2.countNonZero(contour_mask):
                 cv2.drawContours(contour_mask, [contour], -1, 255, thickness=cv2.FILLED, offset=(-x0, -y0))
-        digit_patch = cv2.bitwise_and(digit_patch, digit_patch, mask=contour_mask)
-        if digit_patch.max() == 0:
-            digit_patch = img_clean[y0:y1, x0:x1]
-        crop = _resize_and_center(digit_patch)
+        # The contour mask is 0/255, so AND-ing with it keeps or clears each pixel.
+        masked = np.bitwise_and(digit_patch, contour_mask, out=_scratch("masked", digit_patch.shape))
+        if not cv2.countNonZero(masked):
+            masked = digit_patch
+        crop = _resize_and_center(masked, out=crops[len(digits)])
         digits.append({
             "bbox": (x0, y0, x1 - x0, y1 - y0),
             "crop": crop,
         })
 
-    if expected_digits and expected_digits > 0 and len(digits) != expected_digits:
-        projected = _split_with_projection(clean_mask, img_clean, expected_digits, min_area // 2)
-        if projected:
-            digits = projected
+    # Contours were sorted by x and padding keeps that order, so the
+    # segments are already left to right, in stack row order.
+    return digits, clean_mask, crops[: len(digits)]
+
+
+def _crop_segments(
+    img_clean: np.ndarray,
+    boxes: List[Tuple[int, int, int, int]],
+) -> Tuple[List[dict], np.ndarray, np.ndarray]:
+    """Cut digit crops at known boxes, masked by the Otsu foreground.
 
-    digits.sort(key=lambda item: item.get("bbox", (0, 0, 0, 0))[0])
-    return digits, clean_mask
+    Returns the segments, the clean mask and their crop stack, like
+    ``_segment_digits``.
+    """
+    clean_mask = _build_clean_mask(img_clean)
+    img_h, img_w = img_clean.shape[:2]
+    crops = _crop_stack(len(boxes))
+    digits: List[dict] = []
+    for x, y, w, h in boxes:
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(img_w, int(x + w)), min(img_h, int(y + h))
+        if x1 <= x0 or y1 <= y0:
+            continue
+        patch = img_clean[y0:y1, x0:x1]
+        masked = np.bitwise_and(patch, clean_mask[y0:y1, x0:x1], out=_scratch("masked", patch.shape))
+        digits.append({
+            "bbox": (x0, y0, x1 - x0, y1 - y0),
+            "crop": _resize_and_center(masked if cv2.countNonZero(masked) else patch, out=crops[len(digits)]),
+        })
+    return digits, clean_mask, crops[: len(digits)]
 
 
 def _draw_overlay(img_clean: np.ndarray, digits: List[dict]) -> np.ndarray:
@@ -529,35 +1840,75 @@ def _prepare_digit_debug_image(crop: np.ndarray, scale: int = 4) -> np.ndarray:
     return cv2.resize(img, (width * scale, height * scale), interpolation=cv2.INTER_NEAREST)
 
 
-def _encode_png(image: np.ndarray) -> str:
+def _encode_image(image: np.ndarray, encoding: Optional[ImageEncoding] = None) -> bytes:
+    """``image`` encoded as ``encoding`` (PNG at full size by default)."""
+    encoding = encoding or _DEFAULT_IMAGE_ENCODING
     display = image
     if display.dtype != np.uint8:
         display = _normalize_uint8(display)
-    success, buffer = cv2.imencode(".png", display)
+    longest = max(display.shape[:2])
+    if encoding.max_side is not None and longest > encoding.max_side:
+        scale = encoding.max_side / float(longest)
+        size = (max(1, int(round(display.shape[1] * scale))), max(1, int(round(display.shape[0] * scale))))
+        display = cv2.resize(display, size, interpolation=cv2.INTER_AREA)
+    params: List[int] = []
+    if encoding.format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, encoding.quality]
+    elif encoding.format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, encoding.quality]
+    success, buffer = cv2.imencode(IMAGE_FORMATS[encoding.format], display, params)
     if not success:
         raise RuntimeError("Gagal melakukan encoding pipeline debug image")
-    return base64.b64encode(buffer.tobytes()).decode("ascii")
+    return buffer.tobytes()
 
 
-def _decision_scores(model, sample: np.ndarray) -> Optional[np.ndarray]:
+def _classify_crops(
+    crops: Crops,
+    model,
+    scaler,
+    hog_params: Optional[dict],
+    hog_extractor: Optional[FixedHogExtractor] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[Tuple[object, float]]:
+    if len(crops) == 0:
+        return []
+    with timed(timings, "hog"):
+        if hog_extractor is not None:
+            features = hog_extractor.extract(_stack_crops(crops))
+        else:
+            features = np.vstack([_extract_hog(crop, hog_params=hog_params) for crop in crops])
+    with timed(timings, "score"):
+        scaled = scaler.transform(features)
+        scores = _decision_scores(model, scaled)
+    if scores is None:
+        labels = model.predict(scaled)
+        return [(int(label), 0.75) for label in labels]
+    probs = _softmax(scores)
+    pred_indices = np.argmax(probs, axis=1)
+    confidences = probs[np.arange(probs.shape[0]), pred_indices]
+    return [
+        (_resolve_label(model, int(pred_idx), probs.shape[1]), float(confidence))
+        for pred_idx, confidence in zip(pred_indices, confidences)
+    ]
+
+
+def _decision_scores(model, samples: np.ndarray) -> Optional[np.ndarray]:
     if not hasattr(model, "decision_function"):
         return None
-    scores = model.decision_function(sample)
+    scores = model.decision_function(samples)
     scores = np.asarray(scores, dtype=np.float64)
-    if scores.ndim == 0:
-        scores = scores.reshape(1)
-    if scores.ndim > 1:
-        scores = scores.ravel()
+    if scores.ndim < 2:
+        # Binary estimators yield one score per sample.
+        scores = scores.reshape(samples.shape[0], -1)
     return scores
 
 
 def _softmax(scores: np.ndarray) -> np.ndarray:
-    shifted = scores - np.max(scores)
+    shifted = scores - np.max(scores, axis=-1, keepdims=True)
     exp_scores = np.exp(shifted)
-    denom = exp_scores.sum()
-    if denom <= 0:
-        return np.full_like(exp_scores, 1.0 / exp_scores.size)
-    return exp_scores / denom
+    denom = exp_scores.sum(axis=-1, keepdims=True)
+    uniform = np.full_like(exp_scores, 1.0 / exp_scores.shape[-1])
+    return np.divide(exp_scores, denom, out=uniform, where=denom > 0)
 
 
 def _resolve_label(model, index: int, score_count: int):
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from .recognizer import DigitRecognizer, LoadedModel, load_model, publish_model, validate_model
+
+
+class ModelReloadError(Exception):
+    """Raised when a candidate artifact cannot be loaded or fails warm-up."""
+
+
+class ModelReloader:
+    """Loads, validates and swaps model artifacts while traffic keeps flowing.
+
+    The candidate is loaded and warmed in the calling thread; predictions
+    keep using the current model until the single attribute swap. With
+    ``watch_interval`` a daemon thread polls the artifact path (following
+    symlinks) and reloads when it changes, which reaches every worker
+    process of ``app.serve`` without an admin call per worker.
+    """
+
+    def __init__(
+        self,
+        recognizer: DigitRecognizer,
+        min_warmup_accuracy: float = 0.0,
+        watch_interval: float = 0.0,
+        on_swap: Optional[Callable[[LoadedModel, Optional[LoadedModel]], None]] = None,
+        history_size: int = 5,
+    ):
+        self.recognizer = recognizer
+        self.min_warmup_accuracy = float(min_warmup_accuracy)
+        self.watch_interval = max(0.0, float(watch_interval))
+        self.on_swap = on_swap
+        self.history_size = max(1, int(history_size))
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error: Optional[str] = None
+        self._previous: List[dict] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._signature = None
+
+    def reload(self, model_path: Optional[Path] = None) -> dict:
+        """Load ``model_path`` (default: the current path) and swap it in if it validates."""
+        with self._lock:
+            path = Path(model_path) if model_path is not None else self.recognizer.model_path
+            current = self.recognizer.loaded_model
+            try:
+                candidate = load_model(path, self.recognizer.mmap_dir, shared=False)
+                if current is not None and candidate.artifact_id == current.artifact_id:
+                    self._signature = _path_signature(path)
+                    return {"status": "unchanged", "current": current.describe()}
+                candidate.warmup = validate_model(candidate)
+            except Exception as exc:
+                self.failed_reloads += 1
+                self.last_error = f"{path}: {exc}"
+                raise ModelReloadError(self.last_error) from exc
+            if candidate.warmup["accuracy"] < self.min_warmup_accuracy:
+                self.failed_reloads += 1
+                self.last_error = (
+                    f"{path}: akurasi warm-up {candidate.warmup['accuracy']} "
+                    f"di bawah {self.min_warmup_accuracy}"
+                )
+                raise ModelReloadError(self.last_error)
+
+            publish_model(candidate)
+            previous = self.recognizer.swap_model(candidate, path)
+            self._signature = _path_signature(path)
+            self.reloads += 1
+            self.last_error = None
+            if previous is not None and previous is not candidate:
+                self._previous.insert(0, {**previous.describe(), "replaced_at": _now()})
+                del self._previous[self.history_size :]
+            if self.on_swap is not None:
+                self.on_swap(candidate, previous)
+            return {
+                "status": "reloaded",
+                "current": candidate.describe(),
+                "previous": previous.describe() if previous is not None else None,
+            }
+
+    def start(self) -> None:
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return
+        self._signature = _path_signature(self.recognizer.model_path)
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def shutdown(self) -> None:
+        if self._watcher is None:
+            return
+        self._stop.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def stats(self) -> dict:
+        current = self.recognizer.loaded_model
+        return {
+            "current": current.describe() if current is not None else None,
+            "previous": list(self._previous),
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_error": self.last_error,
+            "watch_interval": self.watch_interval,
+        }
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.watch_interval):
+            signature = _path_signature(self.recognizer.model_path)
+            if signature is None or signature == self._signature:
+                continue
+            # Wait one more interval so a file still being copied is not loaded.
+            if self._stop.wait(self.watch_interval) or signature != _path_signature(self.recognizer.model_path):
+                continue
+            try:
+                result = self.reload()
+                print(f"Model reloaded: {result['current']['version']} ({result['status']})")
+            except ModelReloadError as exc:
+                # Do not retry the same broken file on every poll.
+                self._signature = signature
+                print(f"[ERROR] Gagal memuat ulang model: {exc}")
+
+
+def _path_signature(path: Path):
+    try:
+        resolved = Path(path).resolve()
+        stat = resolved.stat()
+    except OSError:
+        return None
+    return str(resolved), stat.st_mtime_ns, stat.st_size
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
@@ -0,0 +1,168 @@
+"""Content negotiation and serialization of recognition responses.
+
+JSON stays the default. Pipeline images rendered by the recognizer are
+raw encoded bytes; only JSON turns them into base64 strings, while the
+binary formats send the bytes as they are, which drops the base64
+overhead and the decode step on the client:
+
+- ``multipart/mixed``: the first part is the JSON payload, in which every
+  ``image`` is replaced by ``{"part": <name>}``; each image follows as its
+  own part with that ``Content-ID``.
+- ``application/msgpack`` (needs the ``msgpack`` package): the same
+  payload with every ``image`` as a binary value.
+
+In both, each image entry also carries its ``content_type``.
+"""
+from __future__ import annotations
+
+import base64
+import importlib.util
+import json
+import time
+from typing import Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+JSON = "json"
+MULTIPART = "multipart"
+MSGPACK = "msgpack"
+RESPONSE_FORMATS = (JSON, MULTIPART, MSGPACK)
+MSGPACK_AVAILABLE = importlib.util.find_spec("msgpack") is not None
+
+_MEDIA_TYPES = {
+    "application/json": JSON,
+    "multipart/mixed": MULTIPART,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+
+
+def negotiate_format(accept: Optional[str]) -> Optional[str]:
+    """Response format for an ``Accept`` header; None when none is acceptable.
+
+    The highest ``q`` wins and ties keep the header order; a missing header,
+    ``*/*`` or ``application/*`` give JSON.
+    """
+    if not accept or not accept.strip():
+        return JSON
+    candidates: List[Tuple[float, int, str]] = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, _, params = item.strip().partition(";")
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+        if media_type in ("*/*", "application/*"):
+            candidates.append((quality, position, JSON))
+        elif media_type == "multipart/*":
+            candidates.append((quality, position, MULTIPART))
+        elif media_type in _MEDIA_TYPES and (_MEDIA_TYPES[media_type] != MSGPACK or MSGPACK_AVAILABLE):
+            candidates.append((quality, position, _MEDIA_TYPES[media_type]))
+    if not candidates:
+        return None
+    return max(candidates, key=lambda entry: (entry[0], -entry[1]))[2]
+
+
+def serialize_payload(
+    payload: dict,
+    response_format: str,
+    image_type: str,
+    pipeline_key: Optional[str] = "pipeline",
+) -> Tuple[bytes, str, float]:
+    """Encode ``payload`` as ``response_format``.
+
+    ``image_type`` is the content type of the pipeline images, found
+    under ``payload[pipeline_key]`` (or in ``payload`` itself when
+    ``pipeline_key`` is None). Returns the body, its media type and the
+    serialization milliseconds.
+    """
+    started = time.perf_counter()
+    if response_format == MULTIPART:
+        body, media_type = _serialize_multipart(payload, image_type, pipeline_key)
+    elif response_format == MSGPACK:
+        import msgpack
+
+        document = _replace_images(payload, image_type, pipeline_key, lambda image, _name: image)
+        body = msgpack.packb(document, use_bin_type=True)
+        media_type = "application/msgpack"
+    else:
+        body = dump_json(payload)
+        media_type = "application/json"
+    return body, media_type, (time.perf_counter() - started) * 1000.0
+
+
+def dump_json(payload: dict) -> bytes:
+    """Compact JSON of ``payload`` with pipeline images as base64 strings."""
+    return json.dumps(
+        payload,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_base64_image,
+    ).encode("utf-8")
+
+
+def _base64_image(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _serialize_multipart(payload: dict, image_type: str, pipeline_key: Optional[str]) -> Tuple[bytes, str]:
+    parts: List[Tuple[str, bytes]] = []
+
+    def _detach(image: bytes, name: str) -> dict:
+        parts.append((name, image))
+        return {"part": name}
+
+    document = _replace_images(payload, image_type, pipeline_key, _detach)
+    boundary = uuid4().hex
+    document_bytes = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    chunks = [_part_header(boundary, "application/json; charset=utf-8", "result", len(document_bytes)), document_bytes]
+    for name, data in parts:
+        chunks.append(_part_header(boundary, image_type, name, len(data)))
+        chunks.append(data)
+    chunks.append(f"\r\n--{boundary}--\r\n".encode("ascii"))
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
+
+
+def _part_header(boundary: str, content_type: str, name: str, length: int) -> bytes:
+    # The delimiter's leading CRLF ends the previous part; the first one is harmless preamble.
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-ID: <{name}>\r\n"
+        f"Content-Disposition: inline; name=\"{name}\"\r\n"
+        f"Content-Length: {length}\r\n\r\n"
+    ).encode("ascii")
+
+
+def _replace_images(payload: dict, image_type: str, pipeline_key: Optional[str], replace) -> dict:
+    """Copy ``payload`` with every pipeline image passed through ``replace``."""
+    pipeline = payload.get(pipeline_key) if pipeline_key is not None else payload
+    if not pipeline:
+        return payload
+    copied = dict(pipeline)
+    for key, name, index in _image_slots(pipeline):
+        if copied[key] is pipeline[key]:
+            copied[key] = list(pipeline[key])
+        entry = copied[key][index]
+        copied[key][index] = {**entry, "image": replace(entry["image"], name), "content_type": image_type}
+    return {**payload, pipeline_key: copied} if pipeline_key is not None else copied
+
+
+def _image_slots(pipeline: dict) -> Iterator[Tuple[str, str, int]]:
+    for index, stage in enumerate(pipeline.get("stages") or []):
+        if isinstance(stage.get("image"), bytes):
+            yield "stages", f"stage-{stage['key']}", index
+    for index, crop in enumerate(pipeline.get("digit_crops") or []):
+        if isinstance(crop.get("image"), bytes):
+            yield "digit_crops", f"digit-{crop['index']}", index
+
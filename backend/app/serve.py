@@ -0,0 +1,151 @@
+"""Pre-fork launcher that serves the API from several worker processes.
+
+Run from ``backend/``::
+
+    python -m app.serve --workers 4 --port 8000
+
+The parent loads the model artifact once, binds the listening socket and
+then forks the workers, so every worker inherits the loaded arrays as
+shared copy-on-write pages instead of running its own ``joblib.load``.
+With ``--mmap-dir`` the arrays are also memory-mapped from an uncompressed
+bundle, which keeps them shared for ``RECOGNITION_EXECUTOR=process`` pools
+and for workers started by other launchers.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, Optional, Sequence
+
+import uvicorn
+
+from .recognizer import DigitRecognizer
+from .warmup import run_warmup
+
+# Workers that die sooner than this after starting are restarted with a delay.
+_RESTART_BACKOFF_S = 1.0
+
+
+def _bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, args: argparse.Namespace) -> None:
+    config = uvicorn.Config(
+        args.app,
+        log_level=args.log_level,
+        backlog=args.backlog,
+        timeout_keep_alive=args.timeout_keep_alive,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn_worker(sock: socket.socket, args: argparse.Namespace) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _run_worker(sock, args)
+    except BaseException:  # pragma: no cover - diagnostic only
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def serve(args: argparse.Namespace) -> int:
+    # Workers import ``main`` themselves; the environment makes their
+    # recognizer resolve to the artifact loaded here.
+    if args.model:
+        os.environ["MODEL_PATH"] = args.model
+    if args.mmap_dir:
+        os.environ["MODEL_MMAP_DIR"] = args.mmap_dir
+    # One recognition thread per core in total, not per process.
+    os.environ.setdefault("RECOGNITION_WORKERS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+    os.environ.setdefault("BATCH_PREPARE_WORKERS", os.environ["RECOGNITION_WORKERS"])
+
+    recognizer = DigitRecognizer(model_path=args.model, mmap_dir=args.mmap_dir, eager=True)
+    # Warming here pays the lazy imports and first-call setup once for all workers.
+    warmup_ms = run_warmup(recognizer)
+    print(
+        f"Model loaded in parent {os.getpid()}: {recognizer.artifact_id} "
+        f"({recognizer.memory_sharing}, scoring={recognizer.scoring_backend}, "
+        f"warm-up {sum(warmup_ms.values()):.0f} ms)",
+    )
+    sock = _bind_socket(args.host, args.port, args.backlog)
+    if args.workers == 1:
+        _run_worker(sock, args)
+        return 0
+
+    workers: Dict[int, float] = {}
+    stopping = False
+
+    def _stop(signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    for _ in range(args.workers):
+        workers[_spawn_worker(sock, args)] = time.monotonic()
+    print(f"Serving on {args.host}:{args.port} with {args.workers} workers: {sorted(workers)}")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started_at = workers.pop(pid, None)
+        if started_at is None or stopping:
+            continue
+        print(f"[WARN] Worker {pid} berhenti (status {status}), menjalankan ulang.")
+        if time.monotonic() - started_at < _RESTART_BACKOFF_S:
+            time.sleep(_RESTART_BACKOFF_S)
+        if not stopping:
+            workers[_spawn_worker(sock, args)] = time.monotonic()
+    sock.close()
+    return 0
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Jumlah proses worker.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--app", default="main:app", help="Aplikasi ASGI yang dijalankan setiap worker.")
+    parser.add_argument("--model", help="Path ke artifact .joblib (default: MODEL_PATH).")
+    parser.add_argument("--mmap-dir", help="Folder bundle model yang di-memory-map (default: MODEL_MMAP_DIR).")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers harus minimal 1")
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    return serve(_parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,531 @@
 from __future__ import annotations
 
 import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+from .recognizer import PipelineDebug
+
+
+# Reads wait this long for queued records so callers see their own writes.
+_READ_FLUSH_TIMEOUT = 1.0
+# A failed group commit is retried after this long, with its records kept.
+_WRITE_RETRY_DELAY = 0.5
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    device_id TEXT,
+    capture_source TEXT,
+    logged_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_records_id ON records(id);
+CREATE INDEX IF NOT EXISTS idx_records_device ON records(device_id, seq);
+CREATE INDEX IF NOT EXISTS idx_records_source ON records(capture_source, seq);
+CREATE INDEX IF NOT EXISTS idx_records_logged_at ON records(logged_at);
+CREATE INDEX IF NOT EXISTS idx_records_segment ON records(segment);
+CREATE TABLE IF NOT EXISTS segments (
+    name TEXT PRIMARY KEY,
+    indexed_bytes INTEGER NOT NULL DEFAULT 0,
+    sealed INTEGER NOT NULL DEFAULT 0
+);
+"""
 
 
 class RecognitionStorage:
-    """Simple JSONL-backed storage for recognition metadata."""
+    """JSONL-backed storage for recognition metadata.
+
+    Records are appended to the active log segment and indexed by byte
+    offset in a SQLite sidecar, so history queries read only the lines
+    they return instead of scanning the whole log.
+    """
 
-    def __init__(self, base_upload_dir: Path, history_filename: str = "recognitions_log.jsonl"):
+    def __init__(
+        self,
+        base_upload_dir: Path,
+        history_filename: str = "recognitions_log.jsonl",
+        index_filename: str = "recognitions_index.sqlite3",
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        buffered: bool = False,
+        flush_interval: float = 0.2,
+        flush_max_records: int = 256,
+        max_pending_records: int = 10_000,
+        fsync: bool = False,
+    ):
         self.base_upload_dir = Path(base_upload_dir)
         self.base_upload_dir.mkdir(parents=True, exist_ok=True)
         self.history_path = self.base_upload_dir / history_filename
         if not self.history_path.exists():
             self.history_path.touch()
+        self.index_path = self.base_upload_dir / index_filename
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        self._conn.executescript(_INDEX_SCHEMA)
+        self.fsync = fsync
+        self.sync_index()
+        self._writer: Optional[_GroupCommitWriter] = None
+        if buffered:
+            self._writer = _GroupCommitWriter(
+                self._write_records,
+                flush_interval=flush_interval,
+                flush_max_records=flush_max_records,
+                max_pending_records=max_pending_records,
+            )
+
+    @property
+    def active_segment(self) -> str:
+        return self.history_path.name
 
     def append_record(self, record: Dict[str, Any]) -> None:
-        enriched = {
-            **record,
-            "logged_at": datetime.utcnow().isoformat(),
-        }
-        with self.history_path.open("a", encoding="utf-8") as stream:
-            stream.write(json.dumps(enriched, ensure_ascii=False) + "\n")
+        self.append_records([record])
+
+    def append_records(self, records: List[Dict[str, Any]]) -> None:
+        """Append records, handing them to the group-commit writer when buffered."""
+        if not records:
+            return
+        logged_at = datetime.utcnow().isoformat()
+        enriched = [{**record, "logged_at": logged_at} for record in records]
+        if self._writer is not None:
+            self._writer.submit(enriched)
+        else:
+            self._write_records(enriched)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every record appended so far has been written.
+
+        Returns False on timeout or when a write fails meanwhile; the
+        records stay queued and are retried.
+        """
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    def stats(self) -> dict:
+        if self._writer is None:
+            return {"buffered": False}
+        return {"buffered": True, "fsync": self.fsync, **self._writer.stats()}
 
     def latest_records(self, limit: int = 20) -> list[Dict[str, Any]]:
-        lines = []
-        with self.history_path.open("r", encoding="utf-8") as stream:
-            for line in stream:
-                line = line.strip()
-                if not line:
+        records, _ = self.query_records(limit=limit)
+        return list(reversed(records))
+
+    def query_records(
+        self,
+        limit: int = 20,
+        cursor: Optional[int] = None,
+        device_id: Optional[str] = None,
+        capture_source: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return the newest matching records first plus a cursor for the next page."""
+        self.flush(timeout=_READ_FLUSH_TIMEOUT)
+        clauses: List[str] = []
+        params: List[Any] = []
+        for column, value in (("device_id", device_id), ("capture_source", capture_source)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("logged_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("logged_at < ?")
+            params.append(until)
+        if cursor is not None:
+            clauses.append("seq < ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT seq, segment, offset, length FROM records {where} ORDER BY seq DESC LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+            next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+            return self._read_rows(rows[:limit]), next_cursor
+
+    def get_record(self, recognition_id: str) -> Optional[Dict[str, Any]]:
+        self.flush(timeout=_READ_FLUSH_TIMEOUT)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, segment, offset, length FROM records WHERE id = ? ORDER BY seq DESC LIMIT 1",
+                (recognition_id,),
+            ).fetchall()
+            records = self._read_rows(rows)
+        return records[0] if records else None
+
+    def sync_index(self) -> None:
+        """Index the log lines past the active segment's high-water mark.
+
+        ``indexed_bytes`` is the length of the log prefix whose lines are
+        all indexed. It only moves over whole lines, under the log's flock,
+        so lines a crashed writer appended but never indexed stay past it
+        and are picked up here, or by the next write.
+        """
+        with self._lock, self._locked_log() as stream:
+            size = os.fstat(stream.fileno()).st_size
+            with self._conn:
+                rows, indexed_bytes = self._unindexed_rows(size)
+                self._insert_rows(rows)
+                self._set_indexed_bytes(self.active_segment, indexed_bytes)
+
+    def rotate(self) -> Optional[Path]:
+        """Seal the active segment under a timestamped name and start a new one."""
+        with self._lock, self._locked_log() as stream:
+            if os.fstat(stream.fileno()).st_size == 0:
+                return None
+            return self._seal()
+
+    def prune(self, older_than: datetime) -> int:
+        """Delete sealed segments whose newest record predates ``older_than``."""
+        cutoff = older_than.isoformat()
+        removed = 0
+        with self._lock:
+            sealed = self._conn.execute(
+                "SELECT s.name, MAX(r.logged_at) FROM segments s "
+                "LEFT JOIN records r ON r.segment = s.name WHERE s.sealed = 1 GROUP BY s.name",
+            ).fetchall()
+            for name, newest in sealed:
+                if newest is not None and newest >= cutoff:
+                    continue
+                with self._conn:
+                    self._conn.execute("DELETE FROM records WHERE segment = ?", (name,))
+                    self._conn.execute("DELETE FROM segments WHERE name = ?", (name,))
+                (self.base_upload_dir / name).unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def close(self) -> bool:
+        """Write what is still queued and close; False when records were lost."""
+        written = True
+        if self._writer is not None:
+            written = self._writer.close()
+            self._writer = None
+        with self._lock:
+            self._conn.close()
+        return written
+
+    def _write_records(self, enriched: List[Dict[str, Any]]) -> None:
+        lines = [
+            (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+            for entry in enriched
+        ]
+        # The exclusive lock keeps other worker processes from interleaving
+        # partial lines and makes the end offset exact.
+        with self._lock, self._locked_log(rotate_at=self.max_segment_bytes) as stream:
+            offset = stream.seek(0, os.SEEK_END)
+            stream.write(b"".join(lines))
+            stream.flush()
+            if self.fsync:
+                os.fsync(stream.fileno())
+            with self._conn:
+                # Lines of a writer that died before indexing them come
+                # first; a torn last line of theirs is skipped.
+                rows, _ = self._unindexed_rows(offset)
+                for entry, line in zip(enriched, lines):
+                    rows.append(_index_row(entry, self.active_segment, offset, len(line)))
+                    offset += len(line)
+                self._insert_rows(rows)
+                self._set_indexed_bytes(self.active_segment, offset)
+
+    @contextmanager
+    def _locked_log(self, rotate_at: int = 0) -> Iterator[BinaryIO]:
+        """Open the active log with its flock held.
+
+        Another process may rename the log between our open and our lock,
+        so the locked file is checked against the active path and reopened
+        until they match. With ``rotate_at``, a log already that large is
+        sealed under the same lock first; size checks and renames therefore
+        never race a writer in another process.
+        """
+        while True:
+            stream = self.history_path.open("ab")
+            _lock_file(stream)
+            try:
+                active = _is_same_file(stream, self.history_path)
+                if active and rotate_at and os.fstat(stream.fileno()).st_size >= rotate_at:
+                    self._seal()
+                    active = False
+                if active:
+                    yield stream
+                    return
+            finally:
+                _unlock_file(stream)
+                stream.close()
+
+    def _seal(self) -> Path:
+        """Rename the active log aside; the caller holds its flock."""
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        sealed_path = self.history_path.with_name(
+            f"{self.history_path.stem}.{stamp}{self.history_path.suffix}",
+        )
+        with self._conn:
+            rows, indexed_bytes = self._unindexed_rows(self.history_path.stat().st_size)
+            self._insert_rows(rows)
+            self._set_indexed_bytes(self.active_segment, indexed_bytes)
+            self.history_path.rename(sealed_path)
+            self.history_path.touch()
+            self._conn.execute(
+                "UPDATE records SET segment = ? WHERE segment = ?",
+                (sealed_path.name, self.active_segment),
+            )
+            self._conn.execute(
+                "UPDATE segments SET name = ?, sealed = 1 WHERE name = ?",
+                (sealed_path.name, self.active_segment),
+            )
+            self._set_indexed_bytes(self.active_segment, 0)
+        return sealed_path
+
+    def _insert_rows(self, rows: List[tuple]) -> None:
+        self._conn.executemany(
+            "INSERT INTO records (id, segment, offset, length, device_id, capture_source, logged_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def _unindexed_rows(self, end: int) -> Tuple[List[tuple], int]:
+        """Index rows for the whole lines between the high-water mark and ``end``.
+
+        Returns them with the offset just past the last whole line. A mark
+        beyond ``end`` means the log was truncated or replaced, so the
+        segment's rows are dropped and it is indexed from the start. The
+        caller holds the log's flock and an open transaction.
+        """
+        segment = self.active_segment
+        row = self._conn.execute(
+            "SELECT indexed_bytes FROM segments WHERE name = ?",
+            (segment,),
+        ).fetchone()
+        offset = row[0] if row else 0
+        if offset > end:
+            self._conn.execute("DELETE FROM records WHERE segment = ?", (segment,))
+            offset = 0
+        rows: List[tuple] = []
+        if offset == end:
+            return rows, offset
+        with self.history_path.open("rb") as stream:
+            stream.seek(offset)
+            pending = stream.read(end - offset)
+        # A trailing piece without a newline is a torn write; it stays past the mark.
+        for line in pending.split(b"\n")[:-1]:
+            line += b"\n"
+            stripped = line.strip()
+            if stripped:
+                try:
+                    entry = json.loads(stripped)
+                except ValueError:
+                    entry = None
+                if isinstance(entry, dict):
+                    rows.append(_index_row(entry, segment, offset, len(line)))
+            offset += len(line)
+        return rows, offset
+
+    def _set_indexed_bytes(self, segment: str, indexed_bytes: int) -> None:
+        self._conn.execute(
+            "INSERT INTO segments (name, indexed_bytes) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET indexed_bytes = excluded.indexed_bytes",
+            (segment, indexed_bytes),
+        )
+
+    def _read_rows(self, rows: List[tuple]) -> List[Dict[str, Any]]:
+        records: List[Dict[str, Any]] = []
+        streams: Dict[str, Any] = {}
+        try:
+            for _seq, segment, offset, length in rows:
+                stream = streams.get(segment)
+                if stream is None:
+                    stream = streams[segment] = (self.base_upload_dir / segment).open("rb")
+                stream.seek(offset)
+                records.append(json.loads(stream.read(length)))
+        finally:
+            for stream in streams.values():
+                stream.close()
+        return records
+
+
+class _GroupCommitWriter:
+    """Background thread that batches queued records into a single write."""
+
+    def __init__(
+        self,
+        write: Callable[[List[Dict[str, Any]]], None],
+        flush_interval: float,
+        flush_max_records: int,
+        max_pending_records: int,
+    ):
+        self._write = write
+        self.flush_interval = max(0.0, flush_interval)
+        self.flush_max_records = max(1, flush_max_records)
+        self.max_pending_records = max(self.flush_max_records, max_pending_records)
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._submitted = 0
+        self._written = 0
+        self._closing = False
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_error: Optional[str] = None
+        self.max_queue_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, records: List[Dict[str, Any]]) -> None:
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("History writer sudah ditutup.")
+            self._cond.wait_for(
+                lambda: len(self._pending) < self.max_pending_records or self._closing,
+            )
+            self._pending.extend(records)
+            self._submitted += len(records)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            if len(self._pending) >= self.flush_max_records:
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            target = self._submitted
+            failures = self.failed_flushes
+            self._cond.notify_all()
+            self._cond.wait_for(
+                lambda: self._written >= target or self.failed_flushes > failures,
+                timeout=timeout,
+            )
+            return self._written >= target
+
+    def close(self) -> bool:
+        """Stop after one last write of the queue; False when records were dropped."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            if self._pending:
+                print(f"[ERROR] {len(self._pending)} record riwayat tidak tertulis saat ditutup: {self.last_error}")
+            return not self._pending
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queue_depth": len(self._pending),
+                "max_queue_depth": self.max_queue_depth,
+                "records_written": self._written,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "last_error": self.last_error,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+                "max_flush_ms": round(self.max_flush_ms, 3),
+                "avg_batch_size": round(self._written / self.flushes, 2) if self.flushes else 0.0,
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closing or len(self._pending) >= self.flush_max_records,
+                    timeout=self.flush_interval,
+                )
+                if not self._pending:
+                    if self._closing:
+                        return
                     continue
-                lines.append(json.loads(line))
-        return lines[-limit:]
+                batch = list(self._pending)
+                self._pending.clear()
+                self._cond.notify_all()
+            started = time.perf_counter()
+            try:
+                self._write(batch)
+            except Exception as exc:
+                print(f"[ERROR] Gagal menulis riwayat pengenalan: {exc}")
+                with self._cond:
+                    # Back at the front, in order, for the next attempt.
+                    self._pending.extendleft(reversed(batch))
+                    self.failed_flushes += 1
+                    self.last_error = str(exc)
+                    self._cond.notify_all()
+                    if self._closing:
+                        return
+                    self._cond.wait_for(lambda: self._closing, timeout=_WRITE_RETRY_DELAY)
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            with self._cond:
+                self._written += len(batch)
+                self.flushes += 1
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+                self._cond.notify_all()
+
+
+def _lock_file(stream) -> None:
+    if fcntl is not None:
+        fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(stream) -> None:
+    if fcntl is not None:
+        fcntl.flock(stream.fileno(), fcntl.LOCK_UN)
+
+
+def _is_same_file(stream, path: Path) -> bool:
+    try:
+        return os.path.samestat(os.fstat(stream.fileno()), path.stat())
+    except FileNotFoundError:
+        # Renamed away and not recreated yet.
+        return False
+
+
+def _index_row(entry: Dict[str, Any], segment: str, offset: int, length: int) -> tuple:
+    metadata = entry.get("metadata") or {}
+    return (
+        entry.get("id"),
+        segment,
+        offset,
+        length,
+        metadata.get("device_id"),
+        metadata.get("capture_source"),
+        entry.get("logged_at"),
+    )
+
+
+class PipelineDebugStore:
+    """Bounded in-memory store of pipeline intermediates keyed by recognition id."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max(0, int(max_entries))
+        self._entries: "OrderedDict[str, PipelineDebug]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, recognition_id: str, debug: PipelineDebug) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[recognition_id] = debug
+            self._entries.move_to_end(recognition_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, recognition_id: str) -> Optional[PipelineDebug]:
+        with self._lock:
+            return self._entries.get(recognition_id)
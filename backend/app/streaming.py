@@ -0,0 +1,273 @@
+"""Live recognition of camera-preview frames streamed over a WebSocket."""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .metrics import timed
+from .recognizer import (
+    CropBox,
+    DigitRecognizer,
+    RecognitionError,
+    _accepts,
+    _build_records,
+    _build_result,
+    _classify_crops,
+    _ingest_image,
+    _run_prediction_pipeline,
+    _score_candidate,
+    _segment_image,
+    _valid_segments,
+)
+
+# Difference hash of a (HASH_SIZE + 1) x HASH_SIZE thumbnail: two bits
+# (rising, falling) per horizontal step.
+HASH_SIZE = 32
+HASH_MIN_STEP = 4
+# Frames within this many differing bits of the last processed frame show
+# the same view and are skipped; one changed digit flips well over this.
+SKIP_DISTANCE = 6
+# Up to this distance the previous segmentation boxes are reused, shifted
+# by the camera motion that phase correlation measures between frames.
+REUSE_DISTANCE = 160
+MIN_SHIFT_RESPONSE = 0.3
+# A skipped view is processed again after this many skips, so slow changes
+# the hash cannot see (a meter digit rolling over) still get through.
+MAX_CONSECUTIVE_SKIPS = 15
+# Consecutive frames with the same reading before it is reported stable.
+STABLE_FRAMES = 3
+
+
+class StreamSession:
+    """Recognition state carried across the frames of one stream.
+
+    Each frame is decoded and hashed first. Frames close to the last
+    processed one are skipped and count towards the stability of the
+    current reading; small changes reuse the previous segmentation boxes
+    and only re-run preprocessing and classification; anything else, or a
+    reused result that is no longer confident, runs the full pipeline.
+    """
+
+    def __init__(
+        self,
+        recognizer: DigitRecognizer,
+        expected_digits: Optional[int] = None,
+        crop_box: Optional[CropBox] = None,
+        skip_distance: int = SKIP_DISTANCE,
+        reuse_distance: int = REUSE_DISTANCE,
+        stable_frames: int = STABLE_FRAMES,
+    ):
+        self.recognizer = recognizer
+        self.skip_distance = int(skip_distance)
+        self.reuse_distance = int(reuse_distance)
+        self.stable_frames = max(1, int(stable_frames))
+        self.counts: Dict[str, int] = {"full": 0, "reused": 0, "skipped": 0, "error": 0}
+        self._lock = threading.Lock()
+        # Phase-correlation window, rebuilt only when the frame size changes.
+        self._window: Optional[np.ndarray] = None
+        self.configure(expected_digits, crop_box)
+
+    def configure(self, expected_digits: Optional[int], crop_box: Optional[CropBox]) -> None:
+        """Change the stream settings; the next frame starts from scratch."""
+        with self._lock:
+            self.expected_digits = expected_digits
+            self.crop_box = crop_box
+            self._reset()
+
+    def process(self, frame: bytes, sequence: int) -> Tuple[str, Optional[dict]]:
+        """Recognize one frame and return ``(outcome, message)``.
+
+        ``message`` is None when there is nothing new to tell the client.
+        """
+        with self._lock:
+            outcome, message = self._process(frame, sequence)
+        self.counts[outcome] += 1
+        return outcome, message
+
+    def stats(self) -> dict:
+        return dict(self.counts)
+
+    def _reset(self) -> None:
+        self._hash: Optional[int] = None
+        self._shape: Optional[Tuple[int, ...]] = None
+        self._gray: Optional[np.ndarray] = None
+        self._boxes: Optional[List[Tuple[int, int, int, int]]] = None
+        self._last: Optional[dict] = None
+        self._skips = 0
+        self._streak = 0
+
+    def _process(self, frame: bytes, sequence: int) -> Tuple[str, Optional[dict]]:
+        loaded = self.recognizer.ensure_ready()
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        try:
+            with timed(timings, "decode"):
+                ingested = _ingest_image(frame, self.expected_digits, crop_box=self.crop_box)
+        except RecognitionError as exc:
+            self._reset()
+            return "error", {"type": "error", "sequence": sequence, "detail": str(exc)}
+        # The retry budget starts after decode, as in DigitRecognizer.predict.
+        deadline = time.perf_counter() + self.recognizer.retry_budget_ms / 1000.0
+        with timed(timings, "hash"):
+            frame_hash = _difference_hash(ingested["gray"])
+        distance = None
+        if self._hash is not None and ingested["gray"].shape == self._shape:
+            distance = _hamming(frame_hash, self._hash)
+
+        if (
+            distance is not None
+            and distance <= self.skip_distance
+            and self._last is not None
+            and self._skips < MAX_CONSECUTIVE_SKIPS
+        ):
+            self._skips += 1
+            self._streak += 1
+            # Only the frame that makes the reading stable is worth a message.
+            if self._streak != self.stable_frames:
+                return "skipped", None
+            return "skipped", {**self._last, "sequence": sequence, "mode": "skipped", "stable": True}
+
+        outcome = "full"
+        output = None
+        if self._boxes and distance is not None and distance <= self.reuse_distance:
+            output = self._reuse(ingested, loaded, timings)
+            if output is not None:
+                outcome = "reused"
+        if output is None:
+            output = _run_prediction_pipeline(
+                ingested=ingested,
+                expected_digits=self.expected_digits,
+                model=loaded.scoring_model,
+                scaler=loaded.scoring_scaler,
+                hog_params=loaded.hog_params,
+                hog_extractor=loaded.hog_extractor,
+                timings=timings,
+                retry_confidence=self.recognizer.retry_confidence,
+                deadline=deadline,
+            )
+        processing_time_ms = int((time.perf_counter() - start) * 1000)
+        try:
+            result = _build_result(output, processing_time_ms, "none", False, timings, loaded)
+        except RecognitionError as exc:
+            self._reset()
+            return "error", {"type": "error", "sequence": sequence, "detail": str(exc)}
+
+        self._hash = frame_hash
+        self._shape = ingested["gray"].shape
+        self._gray = ingested["gray"].astype(np.float32)
+        self._boxes = [entry["bbox"] for entry in output["segments"]]
+        self._skips = 0
+        previous = self._last["prediction"] if self._last is not None else None
+        self._streak = self._streak + 1 if result.prediction == previous else 1
+        self._last = {
+            "type": "prediction",
+            "prediction": result.prediction,
+            "accuracy": result.accuracy,
+            "digits": [digit.to_dict() for digit in result.digits],
+            "segmentation": output["segmentation"]["strategy"],
+            "model_version": result.model_version,
+        }
+        return outcome, {
+            **self._last,
+            "sequence": sequence,
+            "mode": outcome,
+            "changed": result.prediction != previous,
+            "stable": self._streak >= self.stable_frames,
+            "processing_time_ms": processing_time_ms,
+            "stage_ms": {stage: round(value, 3) for stage, value in timings.items()},
+        }
+
+    def _reuse(self, ingested: dict, loaded, timings: Dict[str, float]) -> Optional[dict]:
+        """Classify crops at the previous boxes; None when no longer confident."""
+        with timed(timings, "track"):
+            gray = ingested["gray"].astype(np.float32)
+            if self._window is None or self._window.shape != gray.shape:
+                self._window = cv2.createHanningWindow((gray.shape[1], gray.shape[0]), cv2.CV_32F)
+            (shift_x, shift_y), response = cv2.phaseCorrelate(self._gray, gray, self._window)
+        if response < MIN_SHIFT_RESPONSE:
+            return None
+        dx, dy = int(round(shift_x)), int(round(shift_y))
+        boxes = [(x + dx, y + dy, w, h) for x, y, w, h in self._boxes]
+        output = _segment_image(ingested, timings=timings, boxes=boxes)
+        valid = _valid_segments(output["segments"])
+        predictions = _classify_crops(
+            output.pop("crop_stack"),
+            model=loaded.scoring_model,
+            scaler=loaded.scoring_scaler,
+            hog_params=loaded.hog_params,
+            hog_extractor=loaded.hog_extractor,
+            timings=timings,
+        )
+        candidate = _score_candidate("reused", valid, predictions, self.expected_digits)
+        if not _accepts(candidate, self.recognizer.retry_confidence):
+            return None
+        output["records"] = _build_records(valid, predictions, output["bbox_scale"], output["bbox_offset"])
+        output["segmentation"] = {
+            "strategy": "reused",
+            "attempts": 1,
+            "accepted": True,
+            "budget_exhausted": False,
+            "candidates": [candidate.summary()],
+        }
+        return output
+
+
+class LatestFrame:
+    """Single-slot mailbox between the socket reader and the recognizer.
+
+    A frame that arrives while the previous one still waits replaces it,
+    so a slow pipeline always works on the newest view instead of a queue
+    of stale ones.
+    """
+
+    def __init__(self):
+        self.dropped = 0
+        self._frame: Optional[Tuple[int, bytes]] = None
+        self._closed = False
+        self._event = asyncio.Event()
+
+    def put(self, sequence: int, frame: bytes) -> bool:
+        """Store ``frame``; True when it replaced an unprocessed frame."""
+        replaced = self._frame is not None
+        if replaced:
+            self.dropped += 1
+        self._frame = (sequence, frame)
+        self._event.set()
+        return replaced
+
+    async def get(self) -> Optional[Tuple[int, bytes]]:
+        """Wait for the newest frame; None once closed and drained."""
+        while self._frame is None:
+            if self._closed:
+                return None
+            await self._event.wait()
+            self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+    def close(self) -> None:
+        self._closed = True
+        self._event.set()
+
+
+def _difference_hash(gray: np.ndarray, size: int = HASH_SIZE) -> int:
+    """Signs of horizontal gradients on a thumbnail, ignoring flat cells.
+
+    Plain dHash flips at random on blank paper, where neighbouring cells
+    differ only by sensor noise; a gradient must exceed ``HASH_MIN_STEP``
+    grey levels to set its rising or falling bit.
+    """
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    steps = small[:, 1:] - small[:, :-1]
+    bits = np.packbits(np.concatenate([steps > HASH_MIN_STEP, steps < -HASH_MIN_STEP]))
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def _hamming(left: int, right: int) -> int:
+    return bin(left ^ right).count("1")
+
@@ -0,0 +1,481 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+import cv2
+import numpy as np
+
+from .recognizer import _COLOR_DECODE_FLAGS, _probe_dimensions, _reduction_factor
+
+PERSIST_MODES = ("stream", "deferred", "off")
+DEFAULT_CHUNK_BYTES = 256 * 1024
+THUMBNAIL_MAX_SIDE = 256
+THUMBNAIL_QUALITY = 80
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF8", ".gif"),
+    (b"BM", ".bmp"),
+)
+_FALLBACK_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".heic"})
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+def read_upload(
+    source: BinaryIO,
+    max_bytes: int,
+    sink_path: Optional[str] = None,
+    size_hint: Optional[int] = None,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> Tuple[bytearray, str]:
+    """Copy ``source`` into one buffer in chunks, teeing each chunk to ``sink_path``.
+
+    Returns the bytes and their SHA-256 hex digest, hashed chunk by chunk
+    while they are still in cache, so the store and the result cache never
+    hash the upload again. With ``size_hint`` (the size of the spooled
+    upload) the buffer is allocated once and filled in place; it only
+    grows, chunk by chunk, past the hint or without one. The size limit is
+    checked after every chunk, so an oversized upload is rejected without
+    ever being held in full. A partially written sink is removed on failure.
+    """
+    if size_hint is not None and size_hint > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+    buffer = bytearray(size_hint or 0)
+    filled = 0
+    hasher = hashlib.sha256()
+    sink = open(sink_path, "wb") if sink_path else None
+    try:
+        while True:
+            if filled == len(buffer):
+                # Past the hint: anything left is read (and checked) as it comes.
+                extra = source.read(chunk_bytes)
+                if not extra:
+                    break
+                if filled + len(extra) > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                buffer += extra
+                count = len(extra)
+            else:
+                with memoryview(buffer) as view:
+                    count = _read_into(source, view[filled : filled + chunk_bytes])
+                if not count:
+                    break
+            with memoryview(buffer) as view, view[filled : filled + count] as chunk:
+                hasher.update(chunk)
+                if sink is not None:
+                    sink.write(chunk)
+            filled += count
+    except BaseException:
+        if sink is not None:
+            sink.close()
+            sink = None
+            _remove_quietly(sink_path)
+        raise
+    finally:
+        if sink is not None:
+            sink.close()
+    # A hint larger than the upload leaves unused space at the end.
+    del buffer[filled:]
+    return buffer, hasher.hexdigest()
+
+
+def _read_into(source: BinaryIO, target: memoryview) -> int:
+    readinto = getattr(source, "readinto", None)
+    if readinto is not None:
+        return readinto(target) or 0
+    chunk = source.read(len(target))
+    target[: len(chunk)] = chunk
+    return len(chunk)
+
+
+def write_upload(disk_path: str, contents) -> None:
+    with open(disk_path, "wb") as buffer:
+        buffer.write(contents)
+
+
+def discard_upload(part_path: str) -> None:
+    _remove_quietly(part_path)
+
+
+def _remove_quietly(path: Optional[str]) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    """Where one upload lives in the :class:`UploadStore`."""
+
+    digest: str
+    path: Path
+    thumbnail_path: Path
+    url: str
+    thumbnail_url: str
+
+
+class UploadStore:
+    """Content-addressed store for uploaded images and their thumbnails.
+
+    Originals live at ``objects/<aa>/<sha256><ext>``, so identical bytes
+    are written once however often they are uploaded; a repeat only
+    refreshes the file's mtime, which retention treats as its last use.
+    Thumbnails are rendered by a background thread once the original is in
+    place. A periodic collector removes originals, with their thumbnails,
+    that were last used more than ``max_age_days`` ago and then, oldest
+    first, those that keep the store above ``max_total_bytes``.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        url_prefix: str = "/uploads",
+        thumbnail_max_side: int = THUMBNAIL_MAX_SIDE,
+        thumbnail_quality: int = THUMBNAIL_QUALITY,
+        max_age_days: float = 0,
+        max_total_bytes: int = 0,
+        gc_interval: float = 3600.0,
+    ):
+        self.base_dir = Path(base_dir)
+        self.objects_dir = self.base_dir / "objects"
+        self.thumbnails_dir = self.base_dir / "thumbs"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.thumbnails_dir.mkdir(parents=True, exist_ok=True)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.thumbnail_max_side = max(16, int(thumbnail_max_side))
+        self.thumbnail_quality = int(thumbnail_quality)
+        self.max_age_days = max(0.0, float(max_age_days))
+        self.max_total_bytes = max(0, int(max_total_bytes))
+        self.gc_interval = max(0.0, float(gc_interval))
+        self.stored = 0
+        self.deduplicated = 0
+        self.thumbnails = 0
+        self.thumbnail_failures = 0
+        self.gc_runs = 0
+        self.gc_removed = 0
+        self.gc_removed_bytes = 0
+        self.last_gc: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._pending_thumbnails: Set[str] = set()
+        self._thumbnailer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-thumbnails")
+        self._stop = threading.Event()
+        self._collector: Optional[threading.Thread] = None
+
+    def locate(self, contents, filename: Optional[str] = None, digest: Optional[str] = None) -> StoredUpload:
+        """Content address of ``contents``; nothing is written yet.
+
+        ``digest`` is the SHA-256 hex digest when the caller already has it.
+        """
+        digest = digest or hashlib.sha256(contents).hexdigest()
+        shard = digest[:2]
+        name = f"{digest}{_image_suffix(contents, filename)}"
+        return StoredUpload(
+            digest=digest,
+            path=self.objects_dir / shard / name,
+            thumbnail_path=self.thumbnails_dir / shard / f"{digest}.jpg",
+            url=f"{self.url_prefix}/objects/{shard}/{name}",
+            thumbnail_url=f"{self.url_prefix}/thumbs/{shard}/{digest}.jpg",
+        )
+
+    def save(self, stored: StoredUpload, contents=None, part_path: Optional[str] = None) -> bool:
+        """Put an upload in place from ``part_path`` or ``contents``.
+
+        Returns False when the same bytes were already stored; the streamed
+        part file is then dropped and the original only marked as used.
+        """
+        try:
+            os.utime(stored.path)
+        except FileNotFoundError:
+            stored.path.parent.mkdir(exist_ok=True)
+            if part_path is not None:
+                os.replace(part_path, stored.path)
+            else:
+                temporary = stored.path.with_name(f".{stored.path.name}.{os.getpid()}.{threading.get_ident()}.part")
+                write_upload(str(temporary), contents)
+                os.replace(temporary, stored.path)
+            with self._lock:
+                self.stored += 1
+            created = True
+        else:
+            discard_upload(part_path)
+            with self._lock:
+                self.deduplicated += 1
+            created = False
+        if created or not stored.thumbnail_path.exists():
+            self._schedule_thumbnail(stored)
+        return created
+
+    def start(self) -> None:
+        if self.gc_interval <= 0 or not (self.max_age_days or self.max_total_bytes) or self._collector is not None:
+            return
+        self._stop.clear()
+        self._collector = threading.Thread(target=self._collect_periodically, name="upload-gc", daemon=True)
+        self._collector.start()
+
+    def shutdown(self) -> None:
+        if self._collector is not None:
+            self._stop.set()
+            self._collector.join()
+            self._collector = None
+        self._thumbnailer.shutdown(wait=True)
+
+    def collect_garbage(self, now: Optional[float] = None) -> Optional[dict]:
+        """Apply the age and size limits once; None when another process is collecting."""
+        now = time.time() if now is None else now
+        with _GcLock(self.base_dir / ".gc.lock") as acquired:
+            if not acquired:
+                return None
+            started = time.perf_counter()
+            objects = self._scan_objects()
+            total_bytes = sum(size for _, size, _ in objects)
+            cutoff = now - self.max_age_days * 86400.0 if self.max_age_days else None
+            removed = 0
+            removed_bytes = 0
+            # Oldest first, so the size limit evicts the least recently used.
+            for path, size, used_at in sorted(objects, key=lambda entry: entry[2]):
+                expired = cutoff is not None and used_at < cutoff
+                oversized = self.max_total_bytes and total_bytes > self.max_total_bytes
+                if not expired and not oversized:
+                    break
+                self._remove_object(path)
+                total_bytes -= size
+                removed += 1
+                removed_bytes += size
+            summary = {
+                "at": now,
+                "objects": len(objects) - removed,
+                "total_bytes": total_bytes,
+                "removed": removed,
+                "removed_bytes": removed_bytes,
+                "duration_ms": round((time.perf_counter() - started) * 1000.0, 3),
+            }
+        with self._lock:
+            self.gc_runs += 1
+            self.gc_removed += removed
+            self.gc_removed_bytes += removed_bytes
+            self.last_gc = summary
+        return summary
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "thumbnails": self.thumbnails,
+                "thumbnail_failures": self.thumbnail_failures,
+                "thumbnails_pending": len(self._pending_thumbnails),
+                "gc_runs": self.gc_runs,
+                "gc_removed": self.gc_removed,
+                "gc_removed_bytes": self.gc_removed_bytes,
+                "objects": self.last_gc["objects"] if self.last_gc else None,
+                "total_bytes": self.last_gc["total_bytes"] if self.last_gc else None,
+                "max_age_days": self.max_age_days,
+                "max_total_bytes": self.max_total_bytes,
+            }
+
+    def _schedule_thumbnail(self, stored: StoredUpload) -> None:
+        with self._lock:
+            if stored.digest in self._pending_thumbnails:
+                return
+            self._pending_thumbnails.add(stored.digest)
+        try:
+            self._thumbnailer.submit(self._write_thumbnail, stored)
+        except RuntimeError:  # pragma: no cover - store already shut down
+            with self._lock:
+                self._pending_thumbnails.discard(stored.digest)
+
+    def _write_thumbnail(self, stored: StoredUpload) -> None:
+        try:
+            thumbnail = render_thumbnail(stored.path.read_bytes(), self.thumbnail_max_side, self.thumbnail_quality)
+            stored.thumbnail_path.parent.mkdir(exist_ok=True)
+            temporary = stored.thumbnail_path.with_name(f".{stored.thumbnail_path.name}.{os.getpid()}.part")
+            write_upload(str(temporary), thumbnail)
+            os.replace(temporary, stored.thumbnail_path)
+        except Exception as exc:
+            with self._lock:
+                self.thumbnail_failures += 1
+            print(f"[WARN] Gagal membuat thumbnail {stored.digest}: {exc}")
+        else:
+            with self._lock:
+                self.thumbnails += 1
+        finally:
+            with self._lock:
+                self._pending_thumbnails.discard(stored.digest)
+
+    def _scan_objects(self) -> List[Tuple[Path, int, float]]:
+        objects = []
+        for shard in os.scandir(self.objects_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    info = entry.stat()
+                except FileNotFoundError:
+                    continue
+                objects.append((Path(entry.path), info.st_size, info.st_mtime))
+        return objects
+
+    def _remove_object(self, path: Path) -> None:
+        digest = path.name.split(".", 1)[0]
+        _remove_quietly(str(path))
+        _remove_quietly(str(self.thumbnails_dir / path.parent.name / f"{digest}.jpg"))
+
+    def _collect_periodically(self) -> None:
+        while True:
+            try:
+                self.collect_garbage()
+            except Exception as exc:  # pragma: no cover - diagnostic only
+                print(f"[ERROR] Garbage collection upload gagal: {exc}")
+            if self._stop.wait(self.gc_interval):
+                return
+
+
+class _GcLock:
+    """Non-blocking ``flock`` so one worker process collects at a time."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._stream = None
+
+    def __enter__(self) -> bool:
+        if fcntl is None:
+            return True
+        self._stream = open(self.path, "a")
+        try:
+            fcntl.flock(self._stream.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._stream.close()
+            self._stream = None
+            return False
+        return True
+
+    def __exit__(self, *exc_info) -> None:
+        if self._stream is not None:
+            fcntl.flock(self._stream.fileno(), fcntl.LOCK_UN)
+            self._stream.close()
+            self._stream = None
+
+
+def render_thumbnail(contents: bytes, max_side: int = THUMBNAIL_MAX_SIDE, quality: int = THUMBNAIL_QUALITY) -> bytes:
+    """JPEG preview whose longer side is at most ``max_side`` pixels.
+
+    Large JPEGs are decoded at a reduced DCT scale, so a preview of a
+    12 MP photo never materialises the full frame.
+    """
+    buffer = np.frombuffer(contents, dtype=np.uint8)
+    header = _probe_dimensions(contents)
+    reduction = _reduction_factor(max_side / max(header)) if header else 1
+    image = cv2.imdecode(buffer, _COLOR_DECODE_FLAGS[reduction])
+    if image is None or image.size == 0:
+        raise ValueError("Berkas gambar tidak dapat dibaca.")
+    height, width = image.shape[:2]
+    scale = max_side / float(max(height, width))
+    if scale < 1.0:
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    success, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("Thumbnail tidak dapat di-encode.")
+    return encoded.tobytes()
+
+
+def _image_suffix(contents, filename: Optional[str]) -> str:
+    head = bytes(contents[:12])
+    for signature, suffix in _SIGNATURES:
+        if head.startswith(signature):
+            return suffix
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    suffix = Path(filename or "").suffix.lower()
+    return suffix if suffix in _FALLBACK_SUFFIXES else ".bin"
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI guard that rejects request bodies above a per-route byte limit.
+
+    ``Content-Length`` is checked up front; chunked bodies are counted while
+    they stream in, so the multipart parser never spools more than the limit.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await _send_too_large(send, limit)
+                return
+
+        received = 0
+        exceeded = False
+        replaced = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLargeError(limit)
+            return message
+
+        async def guarded_send(message):
+            # Form parsing turns our error into a generic 400; answer 413 instead.
+            nonlocal replaced
+            if exceeded:
+                if message["type"] == "http.response.start" and not replaced:
+                    replaced = True
+                    await _send_too_large(send, limit)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLargeError:
+            if not replaced:
+                replaced = True
+                await _send_too_large(send, limit)
+
+
+async def _send_too_large(send, limit: int) -> None:
+    body = f'{{"detail":"Request body exceeds the {limit} byte limit"}}'.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
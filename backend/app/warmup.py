@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from .metrics import timed
+from .recognizer import DigitRecognizer, validate_model
+from .streaming import StreamSession
+
+_WARMUP_DIGITS = "2053"
+# Large enough that _ingest_image takes the reduced JPEG decode path.
+_WARMUP_UPSCALE = 12
+
+
+class Readiness:
+    """Cold-start phase durations and whether the worker may take traffic."""
+
+    def __init__(self):
+        self.ready = False
+        self.error: Optional[str] = None
+        self.phases_ms: Dict[str, float] = {}
+        self.warmup_paths_ms: Dict[str, float] = {}
+        self._created_at = time.time()
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.error = None
+
+    def fail(self, error: str) -> None:
+        self.ready = False
+        self.error = error
+
+    def to_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "phases_ms": {phase: round(value, 3) for phase, value in self.phases_ms.items()},
+            "warmup_paths_ms": dict(self.warmup_paths_ms),
+            "uptime_s": round(time.time() - self._created_at, 3),
+        }
+
+
+def run_warmup(recognizer: DigitRecognizer) -> Dict[str, float]:
+    """Drive a synthetic image through every pipeline path once.
+
+    Covers the color and reduced-grayscale decodes, contour segmentation
+    with the ownership map, the projection split, vectorized HOG, scoring,
+    PNG encoding of the debug payload, the batch path and a short preview
+    stream (full, reused and skipped frames), so OpenCV, CLAHE, the FFT
+    plans, the crop scratch and the scoring buffers are initialised before
+    the first real request.
+    Returns the milliseconds spent on each path.
+    """
+    loaded = recognizer.ensure_ready()
+    image = _render_warmup_image(_WARMUP_DIGITS)
+    small = _encode(".png", image)
+    large = _encode(
+        ".jpg",
+        cv2.resize(image, None, fx=_WARMUP_UPSCALE, fy=_WARMUP_UPSCALE, interpolation=cv2.INTER_LINEAR),
+    )
+    timings: Dict[str, float] = {}
+    with timed(timings, "validate"):
+        validate_model(loaded)
+    with timed(timings, "contour_full"):
+        recognizer.predict(small, detail="full", retain_debug=True)
+    with timed(timings, "projection_split"):
+        recognizer.predict(small, expected_digits=len(_WARMUP_DIGITS) + 1, detail="none")
+    with timed(timings, "reduced_decode"):
+        recognizer.predict(large, expected_digits=len(_WARMUP_DIGITS), detail="summary")
+    with timed(timings, "batch"):
+        recognizer.predict_batch([(small, None), (large, len(_WARMUP_DIGITS))], detail="none")
+    with timed(timings, "stream"):
+        session = StreamSession(recognizer)
+        shifted = _encode(".png", np.roll(image, 1, axis=1))
+        for sequence, frame in enumerate((small, shifted, shifted)):
+            session.process(frame, sequence)
+    return {path: round(value, 3) for path, value in timings.items()}
+
+
+def _render_warmup_image(digits: str) -> np.ndarray:
+    rng = np.random.default_rng(7)
+    height, width = 80, 50 * len(digits) + 40
+    gradient = np.linspace(-20, 20, width)[None, :, None]
+    image = np.clip(210 + gradient + rng.normal(0, 6, (height, width, 3)), 0, 255).astype(np.uint8)
+    for index, digit in enumerate(digits):
+        cv2.putText(image, digit, (20 + 50 * index, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (30, 30, 30), 3, cv2.LINE_AA)
+    return image
+
+
+def _encode(extension: str, image: np.ndarray) -> bytes:
+    success, buffer = cv2.imencode(extension, image)
+    if not success:
+        raise RuntimeError("Gagal membuat gambar warm-up")
+    return buffer.tobytes()
@@ -1,18 +1,92 @@
+import time
+
+# Measured from here so /health/ready can report how long imports took.
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import json
 import os
-from datetime import datetime
+from dataclasses import replace
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 from uuid import uuid4
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import (
+    BackgroundTasks,
+    FastAPI,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.requests import HTTPConnection
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 
-from app import DigitRecognizer, RecognitionStorage
-from app.recognizer import RecognitionError
+from app import (
+    AdmissionController,
+    AdmissionRejectedError,
+    CachedRecognition,
+    DigitRecognizer,
+    ExecutorSaturatedError,
+    ModelReloader,
+    ModelReloadError,
+    PipelineDebugStore,
+    RateLimitedError,
+    RateLimiter,
+    RecognitionCache,
+    RecognitionExecutor,
+    RecognitionStorage,
+)
+from app.metrics import (
+    DIGIT_COUNT_BUCKETS,
+    MEMORY_BUCKETS_BYTES,
+    PAYLOAD_BUCKETS_BYTES,
+    MetricsRegistry,
+    gauge_values,
+    timed,
+)
+from app.recognizer import DETAIL_LEVELS, CropBox, ImageEncoding, RecognitionError
+from app.responses import dump_json, negotiate_format, serialize_payload
+from app.streaming import LatestFrame, StreamSession
+from app.warmup import Readiness, run_warmup
+from app.uploads import (
+    PERSIST_MODES,
+    StoredUpload,
+    UploadSizeLimitMiddleware,
+    UploadStore,
+    UploadTooLargeError,
+    discard_upload,
+    read_upload,
+)
 
 app = FastAPI(title="MultiDigit Recognition Backend")
 
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "50"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# "stream" menulis file sambil dibaca, "deferred" setelah respons dikirim,
+# "off" tidak menyimpan file upload sama sekali.
+UPLOAD_PERSIST = os.getenv("UPLOAD_PERSIST", "stream")
+if UPLOAD_PERSIST not in PERSIST_MODES:
+    raise ValueError(f"UPLOAD_PERSIST must be one of {', '.join(PERSIST_MODES)}")
+_FORM_OVERHEAD_BYTES = 64 * 1024
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/recognitions": MAX_UPLOAD_BYTES + _FORM_OVERHEAD_BYTES,
+        "/recognitions/batch": (MAX_UPLOAD_BYTES + _FORM_OVERHEAD_BYTES) * BATCH_MAX_IMAGES,
+    },
+)
+
 # Konfigurasi CORS untuk akses dari mobile device (Local & Cloud)
 app.add_middleware(
     CORSMiddleware,
@@ -26,88 +100,973 @@ UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
+# Upload asli disimpan sekali per isi (SHA-256) beserta thumbnail; GC
+# menghapus yang terakhir dipakai lebih dari UPLOAD_RETENTION_DAYS hari
+# lalu, atau yang terlama bila total melebihi UPLOAD_MAX_TOTAL_BYTES.
+upload_store = UploadStore(
+    Path(UPLOAD_DIR),
+    thumbnail_max_side=int(os.getenv("THUMBNAIL_MAX_SIDE", "256")),
+    max_age_days=float(os.getenv("UPLOAD_RETENTION_DAYS", "0")),
+    max_total_bytes=int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", "0")),
+    gc_interval=float(os.getenv("UPLOAD_GC_INTERVAL", "3600")),
+)
+
 recognizer = DigitRecognizer(model_path=os.getenv("MODEL_PATH"), eager=False)
-storage = RecognitionStorage(Path(UPLOAD_DIR))
+storage = RecognitionStorage(
+    Path(UPLOAD_DIR),
+    max_segment_bytes=int(os.getenv("HISTORY_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+    buffered=os.getenv("HISTORY_BUFFERED", "1") == "1",
+    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.2")),
+    flush_max_records=int(os.getenv("HISTORY_FLUSH_MAX_RECORDS", "256")),
+    fsync=os.getenv("HISTORY_FSYNC", "0") == "1",
+)
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+result_cache = RecognitionCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "256")),
+    disk_dir=os.getenv("RESULT_CACHE_DIR") or None,
+)
+# Bound before any model serves, so no result of an older artifact is returned.
+recognizer.add_load_listener(lambda loaded: result_cache.bind_artifact(loaded.artifact_id))
+debug_store = PipelineDebugStore(max_entries=int(os.getenv("PIPELINE_DEBUG_STORE_SIZE", "64")))
 
+# Mode "thread" berbagi model dengan proses utama (OpenCV melepas GIL),
+# mode "process" memuat model sekali di setiap worker.
+executor = RecognitionExecutor(
+    recognizer,
+    mode=os.getenv("RECOGNITION_EXECUTOR", "thread"),
+    max_workers=int(os.getenv("RECOGNITION_WORKERS", "0")) or None,
+    max_queue_depth=int(os.getenv("RECOGNITION_MAX_QUEUE", "32")),
+    retry_after=int(os.getenv("RECOGNITION_RETRY_AFTER", "1")),
+)
 
-@app.on_event("startup")
-async def startup_event() -> None:
+# Token bucket per device_id (atau per IP klien bila device_id tidak dikirim);
+# RATE_LIMIT_PER_MINUTE=0 mematikannya. Batch memakai satu token per gambar.
+rate_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_PER_MINUTE", "120")) / 60.0,
+    burst=float(os.getenv("RATE_LIMIT_BURST", "20")),
+    max_keys=int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000")),
+)
+# Batas global pengenalan yang berjalan bersamaan (default: jumlah worker
+# executor). Request interaktif selalu didahulukan, lalu frame preview
+# stream, lalu batch; yang tidak bisa mulai dalam batas tunggu lane-nya
+# langsung ditolak 503 (frame stream cukup dilewati).
+admission = AdmissionController(
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "0")) or executor.max_workers,
+    max_queue={
+        "interactive": int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "32")),
+        "stream": int(os.getenv("ADMISSION_STREAM_QUEUE", "4")),
+        "bulk": int(os.getenv("ADMISSION_BULK_QUEUE", "8")),
+    },
+    max_wait_s={
+        "interactive": float(os.getenv("ADMISSION_INTERACTIVE_MAX_WAIT_MS", "2000")) / 1000.0,
+        "stream": float(os.getenv("ADMISSION_STREAM_MAX_WAIT_MS", "250")) / 1000.0,
+        "bulk": float(os.getenv("ADMISSION_BULK_MAX_WAIT_MS", "30000")) / 1000.0,
+    },
+)
+# Lane yang boleh dipilih lewat field priority POST /recognitions.
+_REQUEST_LANES = ("interactive", "bulk")
+_DEFAULT_DEVICE_ID = "unknown-device"
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def _on_model_swap(current, previous) -> None:
+    executor.reload_workers()
+
+
+# MODEL_WATCH_INTERVAL > 0 polls MODEL_PATH (a file or a symlink to a
+# versioned artifact) and reloads every worker when it changes.
+reloader = ModelReloader(
+    recognizer,
+    min_warmup_accuracy=float(os.getenv("MODEL_RELOAD_MIN_ACCURACY", "0")),
+    watch_interval=float(os.getenv("MODEL_WATCH_INTERVAL", "0")),
+    on_swap=_on_model_swap,
+)
+
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "16"))
+STREAM_MAX_FRAME_BYTES = int(os.getenv("STREAM_MAX_FRAME_BYTES", str(512 * 1024)))
+_stream_sessions = 0
+readiness = Readiness()
+
+metrics = MetricsRegistry()
+metrics.counter("http_requests_total", "HTTP requests by route, method and status code.")
+metrics.histogram("http_request_duration_ms", "End-to-end HTTP request latency in milliseconds.")
+metrics.counter("recognition_errors_total", "Recognition failures by error class.")
+metrics.histogram("recognition_stage_duration_ms", "Recognition latency per pipeline stage in milliseconds.")
+metrics.histogram("recognition_digit_count", "Digits recognised per image.", DIGIT_COUNT_BUCKETS)
+metrics.counter(
+    "stream_frames_total",
+    "Streamed preview frames by outcome (full, reused, skipped, dropped, shed, error).",
+)
+metrics.gauge("stream_sessions", "Open preview streams.", lambda: gauge_values({"open": _stream_sessions}, "state"))
+metrics.histogram(
+    "recognition_peak_memory_bytes",
+    "Estimated peak memory held by one recognition request.",
+    MEMORY_BUCKETS_BYTES,
+)
+metrics.histogram(
+    "response_payload_bytes",
+    "Serialized recognition and pipeline response size by format.",
+    PAYLOAD_BUCKETS_BYTES,
+)
+metrics.histogram("response_serialization_ms", "Time to serialize a recognition or pipeline response by format.")
+metrics.gauge(
+    "executor_jobs",
+    "Recognition jobs held by the executor.",
+    lambda: gauge_values({"in_flight": executor.in_flight, "queued": executor.queued}, "state"),
+)
+metrics.histogram("admission_wait_ms", "Time a recognition waited for an in-flight slot, by lane.")
+metrics.counter("rate_limited_total", "Recognition requests rejected by the per-client rate limit, by endpoint.")
+metrics.gauge(
+    "admission",
+    "In-flight recognitions, per-lane queue depth and admitted, enqueued, rejected and timed-out counts.",
+    lambda: _admission_series(),
+)
+metrics.gauge(
+    "result_cache",
+    "Result cache size and lookup counters.",
+    lambda: gauge_values(
+        {key: value for key, value in result_cache.stats().items() if isinstance(value, (int, float))},
+        "field",
+    ),
+)
+metrics.gauge(
+    "upload_store",
+    "Upload store writes, deduplicated uploads, thumbnails and garbage collection.",
+    lambda: gauge_values(
+        {key: value for key, value in upload_store.stats().items() if isinstance(value, (int, float))},
+        "field",
+    ),
+)
+metrics.gauge(
+    "history_writer",
+    "History writer queue depth and flush statistics.",
+    lambda: gauge_values(
+        {key: value for key, value in storage.stats().items() if not isinstance(value, bool)},
+        "field",
+    ),
+)
+
+readiness.phases_ms["import"] = (time.perf_counter() - _IMPORT_STARTED) * 1000.0
+
+
+def _record_error(exc: Exception, endpoint: str) -> None:
+    metrics.inc("recognition_errors_total", endpoint=endpoint, error=type(exc).__name__)
+
+
+def _observe_recognition(
+    timings: dict,
+    digit_count: int,
+    peak_memory_bytes: int = 0,
+    skip: Tuple[str, ...] = (),
+) -> None:
+    metrics.observe_stages("recognition_stage_duration_ms", timings, skip=skip)
+    metrics.observe("recognition_digit_count", digit_count)
+    if peak_memory_bytes:
+        metrics.observe("recognition_peak_memory_bytes", peak_memory_bytes)
+
+
+def _admission_series() -> dict:
+    stats = admission.stats()
+    series = {(("field", "in_flight"),): float(stats["in_flight"])}
+    for lane, counts in stats["lanes"].items():
+        for field, value in counts.items():
+            series[(("field", field), ("lane", lane))] = float(value)
+    return series
+
+
+def _check_rate_limit(request: HTTPConnection, device_id: str, endpoint: str, cost: int = 1) -> None:
+    """Spend ``cost`` tokens of the client's bucket, answering 429 when it is empty."""
+    if device_id and device_id != _DEFAULT_DEVICE_ID:
+        key = f"device:{device_id}"
+    else:
+        key = f"ip:{request.client.host if request.client else 'unknown'}"
     try:
-        recognizer.ensure_ready()
-        print("Model loaded successfully")
+        rate_limiter.acquire(key, cost)
+    except RateLimitedError as exc:
+        metrics.inc("rate_limited_total", endpoint=endpoint)
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+
+
+def _write_uploads(uploads: List[Tuple[StoredUpload, bytes]]) -> None:
+    for stored, contents in uploads:
+        upload_store.save(stored, contents=contents)
+
+
+def _move_uploads(uploads: List[Tuple[Optional[str], StoredUpload]]) -> None:
+    for part_path, stored in uploads:
+        upload_store.save(stored, part_path=part_path)
+
+
+def _part_path(recognition_id: str) -> Optional[str]:
+    """Temporary file an upload streams into; the store names it by digest later."""
+    return os.path.join(UPLOAD_DIR, f".{recognition_id}.part") if UPLOAD_PERSIST == "stream" else None
+
+
+async def _receive_upload(upload: UploadFile, part_path: Optional[str]) -> Tuple[bytearray, str]:
+    """Stream an upload into memory, teeing it to ``part_path`` when persisting.
+
+    Returns the bytes and their SHA-256 digest, which names the stored
+    upload and keys the result cache.
+    """
+    return await run_in_threadpool(
+        read_upload,
+        upload.file,
+        MAX_UPLOAD_BYTES,
+        part_path,
+        upload.size,
+    )
+
+
+async def _persist_upload(
+    background_tasks: BackgroundTasks,
+    uploads: List[Tuple[Optional[str], StoredUpload, bytes]],
+) -> None:
+    """Move streamed ``.part`` files into the store, or schedule deferred writes.
+
+    Streamed uploads are moved on the threadpool before the response, so
+    the returned ``image_url`` already resolves. Bytes that are already
+    stored are not written again; the part file is dropped and the
+    original only marked as used.
+    """
+    if UPLOAD_PERSIST == "stream":
+        if uploads:
+            await run_in_threadpool(_move_uploads, [(part_path, stored) for part_path, stored, _ in uploads])
+    elif UPLOAD_PERSIST == "deferred":
+        background_tasks.add_task(
+            _write_uploads,
+            [(stored, contents) for _, stored, contents in uploads],
+        )
+
+
+def _locate_upload(contents: bytes, filename: Optional[str], digest: str) -> Optional[StoredUpload]:
+    if UPLOAD_PERSIST == "off":
+        return None
+    return upload_store.locate(contents, filename, digest)
+
+
+async def _cache_lookup(
+    digest: str,
+    expected_digits: Optional[int],
+    detail: str,
+    crop_box: Optional[CropBox] = None,
+    image_encoding: Optional[ImageEncoding] = None,
+) -> Tuple[Optional[str], Optional[CachedRecognition]]:
+    if not result_cache.enabled or recognizer.artifact_id is None:
+        return None, None
+    # Only payloads with images depend on how they are encoded.
+    encoding_token = None
+    if image_encoding is not None and detail in ("stages", "full") and image_encoding != ImageEncoding():
+        encoding_token = image_encoding.cache_token()
+    cache_key = result_cache.make_key(
+        digest,
+        expected_digits,
+        recognizer.artifact_id,
+        detail,
+        crop_box,
+        encoding_token,
+    )
+    return cache_key, await run_in_threadpool(result_cache.get, cache_key)
+
+
+def _negotiate_response(accept: Optional[str]) -> str:
+    response_format = negotiate_format(accept)
+    if response_format is None:
+        raise HTTPException(
+            status_code=406,
+            detail="Accept must allow application/json, multipart/mixed or application/msgpack",
+        )
+    return response_format
+
+
+def _parse_image_encoding(image_format: str, max_side: Optional[int], quality: int) -> ImageEncoding:
+    try:
+        return ImageEncoding(image_format, max_side, quality)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _serialized_response(
+    payload: dict,
+    response_format: str,
+    image_encoding: ImageEncoding,
+    pipeline_key: Optional[str] = "pipeline",
+) -> Response:
+    """Encode a recognition payload in the negotiated format and record its cost."""
+    body, media_type, serialization_ms = serialize_payload(
+        payload,
+        response_format,
+        image_encoding.content_type,
+        pipeline_key,
+    )
+    metrics.observe("response_payload_bytes", len(body), format=response_format)
+    metrics.observe("response_serialization_ms", serialization_ms, format=response_format)
+    return Response(
+        content=body,
+        media_type=media_type,
+        headers={"Vary": "Accept", "X-Serialization-Ms": f"{serialization_ms:.3f}"},
+    )
+
+
+def _parse_crop_box(raw) -> Optional[CropBox]:
+    """Validate a ``{"x", "y", "width", "height"}`` box (JSON text or object)."""
+    if raw is None or raw == "":
+        return None
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail="crop_box must be a JSON object") from exc
+    if not isinstance(raw, dict):
+        raise HTTPException(status_code=400, detail="crop_box must be a JSON object")
+    values = [raw.get(key) for key in ("x", "y", "width", "height")]
+    if any(not isinstance(value, int) or isinstance(value, bool) for value in values):
+        raise HTTPException(status_code=400, detail="crop_box needs integer x, y, width and height")
+    x, y, width, height = values
+    if x < 0 or y < 0 or width <= 0 or height <= 0:
+        raise HTTPException(status_code=400, detail="crop_box needs x, y >= 0 and width, height > 0")
+    return x, y, width, height
+
+
+def _parse_batch_items(raw_items: Optional[str], count: int) -> List[dict]:
+    if not raw_items:
+        return [{} for _ in range(count)]
+    try:
+        parsed = json.loads(raw_items)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="items must be a JSON array") from exc
+    if not isinstance(parsed, list) or len(parsed) != count:
+        raise HTTPException(status_code=400, detail="items must be a JSON array with one entry per image")
+    items = []
+    for entry in parsed:
+        if entry is None:
+            entry = {}
+        if not isinstance(entry, dict):
+            raise HTTPException(status_code=400, detail="Each item must be a JSON object")
+        expected = entry.get("expected_digits")
+        if expected is not None and not isinstance(expected, int):
+            raise HTTPException(status_code=400, detail="expected_digits must be an integer")
+        entry["roi"] = None
+        if entry.get("apply_crop_box"):
+            entry["roi"] = _parse_crop_box(entry.get("crop_box"))
+            if entry["roi"] is None:
+                raise HTTPException(status_code=400, detail="apply_crop_box requires crop_box")
+        items.append(entry)
+    return items
+
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.inc("http_requests_total", route=path, method=request.method, status=str(status_code))
+        metrics.observe("http_request_duration_ms", (time.perf_counter() - start) * 1000.0, route=path)
+
+
+def _warm_start() -> None:
+    """Load and warm the model off the event loop so liveness answers meanwhile."""
+    try:
+        with timed(readiness.phases_ms, "load"):
+            recognizer.ensure_ready()
+        print(f"Model loaded successfully: {recognizer.model_version} ({recognizer.loaded_model.load_source})")
+        executor.start()
+        reloader.start()
+        if WARMUP_ON_START:
+            with timed(readiness.phases_ms, "warmup"):
+                readiness.warmup_paths_ms = run_warmup(recognizer)
+        readiness.mark_ready()
     except FileNotFoundError as exc:
+        readiness.fail(str(exc))
         print(f"[WARN] {exc}")
     except Exception as exc:  # pragma: no cover - diagnostic only
+        readiness.fail(str(exc))
         print(f"[ERROR] Gagal memuat model: {exc}")
 
 
+@app.on_event("startup")
+async def startup_event() -> None:
+    if HISTORY_RETENTION_DAYS > 0:
+        storage.prune(datetime.utcnow() - timedelta(days=HISTORY_RETENTION_DAYS))
+    upload_store.start()
+    app.state.warm_start = asyncio.create_task(run_in_threadpool(_warm_start))
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    reloader.shutdown()
+    executor.shutdown()
+    upload_store.shutdown()
+    storage.close()
+
+
 @app.get("/")
 def read_root():
     return {"message": "Multidigit backend aktif"}
 
 
+@app.get("/health/live")
+def liveness():
+    return {"status": "alive", "pid": os.getpid()}
+
+
+@app.get("/health/ready")
+def readiness_check():
+    return JSONResponse(readiness.to_dict(), status_code=200 if readiness.ready else 503)
+
+
 @app.get("/health/model")
 def model_health():
     return {
         "model_path": str(recognizer.model_path),
         "ready": recognizer.is_ready,
         "last_loaded_at": recognizer.last_loaded_at,
+        "artifact_id": recognizer.artifact_id,
+        "model_version": recognizer.model_version,
+        "versions": reloader.stats(),
+        "scoring_backend": recognizer.scoring_backend,
+        "hog_backend": recognizer.hog_backend,
+        "memory_sharing": recognizer.memory_sharing,
+        "pid": os.getpid(),
+        "executor": executor.stats(),
+        "cache": result_cache.stats(),
+        "history_writer": storage.stats(),
+        "upload_store": upload_store.stats(),
+        "admission": admission.stats(),
+        "rate_limiter": rate_limiter.stats(),
     }
 
 
+@app.post("/admin/model/reload")
+async def reload_model(
+    artifact: Optional[str] = Form(None),
+    x_admin_token: Optional[str] = Header(None),
+):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoint admin nonaktif. Set ADMIN_TOKEN.")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Token admin tidak valid")
+    model_path = None
+    if artifact is not None:
+        # Only artifacts next to the current one may be loaded.
+        if Path(artifact).name != artifact or artifact.startswith("."):
+            raise HTTPException(status_code=400, detail="artifact harus nama file di folder model")
+        model_path = recognizer.model_path.parent / artifact
+    try:
+        return await run_in_threadpool(reloader.reload, model_path)
+    except ModelReloadError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
 @app.post("/recognitions")
 async def create_recognition(
+    request: Request,
+    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
-    device_id: str = Form("unknown-device"),
+    device_id: str = Form(_DEFAULT_DEVICE_ID),
     capture_source: str = Form("unknown"),
     timestamp: Optional[str] = Form(None),
     crop_box: Optional[str] = Form(None),
+    apply_crop_box: bool = Form(False),
     expected_digits: Optional[int] = Form(None),
+    detail: str = Form("summary"),
+    store_debug: bool = Form(False),
+    image_format: str = Form("png"),
+    image_max_side: Optional[int] = Form(None),
+    image_quality: int = Form(80),
+    priority: str = Form("interactive"),
+    accept: Optional[str] = Header(None),
 ):
     if not image:
         raise HTTPException(status_code=400, detail="Image file is required")
+    if detail not in DETAIL_LEVELS:
+        raise HTTPException(status_code=400, detail=f"detail must be one of {', '.join(DETAIL_LEVELS)}")
+    if priority not in _REQUEST_LANES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(_REQUEST_LANES)}")
+    response_format = _negotiate_response(accept)
+    image_encoding = _parse_image_encoding(image_format, image_max_side, image_quality)
+    # Without apply_crop_box the upload is already the client-side crop and
+    # crop_box is only metadata.
+    roi = _parse_crop_box(crop_box) if apply_crop_box else None
+    if apply_crop_box and roi is None:
+        raise HTTPException(status_code=400, detail="apply_crop_box requires crop_box")
+    _check_rate_limit(request, device_id, "recognitions")
 
-    contents = await image.read()
+    request_timings: dict = {}
+    recognition_id = uuid4().hex
+    part_path = _part_path(recognition_id)
+    try:
+        with timed(request_timings, "upload_read"):
+            contents, digest = await _receive_upload(image, part_path)
+    except UploadTooLargeError as exc:
+        _record_error(exc, "recognitions")
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+    except OSError as exc:
+        _record_error(exc, "recognitions")
+        raise HTTPException(status_code=400, detail=f"Upload could not be read: {exc.strerror or exc}") from exc
     if not contents:
+        discard_upload(part_path)
         raise HTTPException(status_code=400, detail="Image file is empty")
 
-    safe_name = image.filename or "capture.jpg"
-    unique_filename = f"{uuid4().hex}_{safe_name}"
-    disk_path = os.path.join(UPLOAD_DIR, unique_filename)
+    cache_key, cached = await _cache_lookup(digest, expected_digits, detail, roi, image_encoding)
+    # A repeat of stored bytes, cache hit or not, reuses the stored original.
+    stored = _locate_upload(contents, image.filename, digest)
+    await _persist_upload(background_tasks, [(part_path, stored, contents)] if stored is not None else [])
+    image_url = stored.url if stored is not None else None
+    thumbnail_url = stored.thumbnail_url if stored is not None else None
 
-    with open(disk_path, "wb") as buffer:
-        buffer.write(contents)
+    if cached is not None:
+        recognition = cached.result
+        debug_id = cached.recognition_id
+        timings = {
+            "admission_wait_ms": 0,
+            "queue_wait_ms": 0,
+            "execute_ms": 0,
+            "cache_hit": True,
+            "peak_memory_bytes": len(contents),
+        }
+    else:
+        debug_id = recognition_id
 
-    try:
-        recognition = recognizer.predict(contents, expected_digits=expected_digits)
-    except FileNotFoundError as exc:
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
-    except RecognitionError as exc:
-        raise HTTPException(status_code=422, detail=str(exc)) from exc
-    except Exception as exc:  # pragma: no cover - unexpected failure
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+        try:
+            async with admission.slot(priority) as admission_wait:
+                recognition, timings = await executor.predict(
+                    contents,
+                    expected_digits=expected_digits,
+                    detail=detail,
+                    retain_debug=store_debug,
+                    crop_box=roi,
+                    image_encoding=image_encoding,
+                )
+        except (AdmissionRejectedError, ExecutorSaturatedError) as exc:
+            _record_error(exc, "recognitions")
+            raise HTTPException(
+                status_code=503,
+                detail=str(exc),
+                headers={"Retry-After": str(exc.retry_after)},
+            ) from exc
+        except FileNotFoundError as exc:
+            _record_error(exc, "recognitions")
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
+        except RecognitionError as exc:
+            _record_error(exc, "recognitions")
+            raise HTTPException(status_code=422, detail=str(exc)) from exc
+        except Exception as exc:  # pragma: no cover - unexpected failure
+            _record_error(exc, "recognitions")
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+        metrics.observe("admission_wait_ms", admission_wait * 1000.0, lane=priority)
+        timings = {"admission_wait_ms": int(admission_wait * 1000), **timings}
+        request_timings["admission_wait"] = admission_wait * 1000.0
+        request_timings["queue_wait"] = float(timings["queue_wait_ms"])
+        request_timings.update(recognition.stage_timings)
+        timings["cache_hit"] = False
+        timings["peak_memory_bytes"] = recognition.peak_memory_bytes
+        if recognition.debug is not None:
+            recognition.debug.summary.update(timings)
+            debug_store.put(recognition_id, recognition.debug)
+        if cache_key is not None:
+            entry = CachedRecognition(
+                result=replace(recognition, debug=None),
+                recognition_id=recognition_id,
+                image_url=image_url,
+            )
+            await run_in_threadpool(result_cache.put, cache_key, entry)
 
     metadata = {
         "device_id": device_id,
         "capture_source": capture_source,
         "timestamp": timestamp or datetime.utcnow().isoformat(),
         "crop_box": crop_box,
+        "crop_applied": roi is not None,
+        "expected_digits": expected_digits,
     }
 
     response_payload = {
+        "id": recognition_id,
         **recognition.to_dict(),
-        "image_url": f"/uploads/{unique_filename}",
+        "image_url": image_url,
+        "thumbnail_url": thumbnail_url,
         "metadata": metadata,
     }
+    timings["upload_bytes"] = len(contents)
+    if "pipeline" in response_payload:
+        pipeline = response_payload["pipeline"]
+        response_payload["pipeline"] = {**pipeline, "summary": {**pipeline["summary"], **timings}}
+    if store_debug and debug_store.get(debug_id) is not None:
+        response_payload["pipeline_url"] = f"/recognitions/{debug_id}/pipeline"
 
-    storage.append_record({
-        "file_path": disk_path,
-        "prediction": response_payload["prediction"],
-        "accuracy": response_payload["accuracy"],
-        "processing_time_ms": response_payload["processing_time_ms"],
-        "metadata": metadata,
-        "digits": response_payload["digits"],
+    with timed(request_timings, "storage"):
+        await run_in_threadpool(storage.append_record, {
+            "id": recognition_id,
+            "cached_from": debug_id if cached is not None else None,
+            "file_path": str(stored.path) if stored is not None else None,
+            "image_url": image_url,
+            "thumbnail_url": thumbnail_url,
+            "prediction": response_payload["prediction"],
+            "accuracy": response_payload["accuracy"],
+            "processing_time_ms": response_payload["processing_time_ms"],
+            "model_version": response_payload["model_version"],
+            "artifact_id": response_payload["artifact_id"],
+            "metadata": metadata,
+            "digits": response_payload["digits"],
+        })
+    _observe_recognition(request_timings, len(recognition.digits), timings["peak_memory_bytes"])
+
+    print(f"Recognition request processed: {response_payload['prediction']} ({recognition_id})")
+    return _serialized_response(response_payload, response_format, image_encoding)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return metrics.render()
+
+
+@app.get("/recognitions")
+def list_recognitions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[int] = Query(None, ge=1),
+    device_id: Optional[str] = None,
+    capture_source: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    records, next_cursor = storage.query_records(
+        limit=limit,
+        cursor=cursor,
+        device_id=device_id,
+        capture_source=capture_source,
+        since=since,
+        until=until,
+    )
+    return {"items": records, "next_cursor": next_cursor}
+
+
+@app.get("/recognitions/{recognition_id}")
+def get_recognition(recognition_id: str):
+    record = storage.get_record(recognition_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Recognition not found")
+    return record
+
+
+@app.get("/recognitions/{recognition_id}/pipeline")
+def recognition_pipeline(
+    recognition_id: str,
+    detail: str = "full",
+    image_format: str = "png",
+    image_max_side: Optional[int] = None,
+    image_quality: int = 80,
+    accept: Optional[str] = Header(None),
+):
+    if detail not in DETAIL_LEVELS:
+        raise HTTPException(status_code=400, detail=f"detail must be one of {', '.join(DETAIL_LEVELS)}")
+    response_format = _negotiate_response(accept)
+    image_encoding = _parse_image_encoding(image_format, image_max_side, image_quality)
+    debug = debug_store.get(recognition_id)
+    if debug is None:
+        raise HTTPException(status_code=404, detail="Pipeline debug data not found or expired")
+    # detail=none keeps the shape of the other levels, with nothing in it.
+    pipeline = debug.render(detail, image_encoding) or {"stages": [], "digit_crops": [], "summary": {}}
+    return _serialized_response(pipeline, response_format, image_encoding, pipeline_key=None)
+
+
+@app.post("/recognitions/batch")
+async def create_recognition_batch(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    images: List[UploadFile] = File(...),
+    items: Optional[str] = Form(None),
+    device_id: str = Form(_DEFAULT_DEVICE_ID),
+    capture_source: str = Form("unknown"),
+    timestamp: Optional[str] = Form(None),
+    detail: str = Form("summary"),
+):
+    if not images:
+        raise HTTPException(status_code=400, detail="At least one image is required")
+    if len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_IMAGES} images")
+    if detail not in DETAIL_LEVELS:
+        raise HTTPException(status_code=400, detail=f"detail must be one of {', '.join(DETAIL_LEVELS)}")
+    item_meta = _parse_batch_items(items, len(images))
+    _check_rate_limit(request, device_id, "recognitions_batch", cost=len(images))
+
+    entries: List[dict] = []
+    for index, (upload, meta) in enumerate(zip(images, item_meta)):
+        recognition_id = uuid4().hex
+        part_path = _part_path(recognition_id)
+        entry = {
+            "index": index,
+            "id": recognition_id,
+            "filename": upload.filename,
+            "part_path": part_path,
+            "stored": None,
+            "image_url": None,
+            "thumbnail_url": None,
+            "contents": b"",
+            "digest": None,
+            "expected_digits": meta.get("expected_digits"),
+            "crop_box": meta.get("roi"),
+            "metadata": {
+                "device_id": device_id,
+                "capture_source": capture_source,
+                "timestamp": meta.get("timestamp") or timestamp or datetime.utcnow().isoformat(),
+                "crop_box": meta.get("crop_box"),
+                "crop_applied": meta.get("roi") is not None,
+                "expected_digits": meta.get("expected_digits"),
+            },
+            "recognition": None,
+            "error": None,
+            "cached_from": None,
+        }
+        try:
+            entry["contents"], entry["digest"] = await _receive_upload(upload, part_path)
+        except UploadTooLargeError as exc:
+            _record_error(exc, "recognitions_batch")
+            entry["error"] = str(exc)
+        except OSError as exc:
+            _record_error(exc, "recognitions_batch")
+            entry["error"] = f"Upload could not be read: {exc.strerror or exc}"
+        if entry["error"] is None and not entry["contents"]:
+            entry["error"] = "Image file is empty"
+        if entry["error"] is None:
+            entry["cache_key"], cached = await _cache_lookup(
+                entry["digest"],
+                entry["expected_digits"],
+                detail,
+                entry["crop_box"],
+            )
+            if cached is not None:
+                entry["recognition"] = cached.result
+                entry["cached_from"] = cached.recognition_id
+            entry["stored"] = stored = _locate_upload(entry["contents"], entry["filename"], entry["digest"])
+            if stored is not None:
+                entry["image_url"], entry["thumbnail_url"] = stored.url, stored.thumbnail_url
+        entries.append(entry)
+
+    pending = [entry for entry in entries if entry["error"] is None and entry["recognition"] is None]
+    for entry in entries:
+        if entry["stored"] is None:
+            discard_upload(entry["part_path"])
+    # Duplicates within the batch and of earlier uploads are stored once.
+    await _persist_upload(
+        background_tasks,
+        [(entry["part_path"], entry["stored"], entry["contents"]) for entry in entries if entry["stored"] is not None],
+    )
+
+    timings = {"admission_wait_ms": 0, "queue_wait_ms": 0, "execute_ms": 0}
+    if pending:
+        try:
+            async with admission.slot("bulk") as admission_wait:
+                outcomes, timings = await executor.predict_batch(
+                    [(entry["contents"], entry["expected_digits"], entry["crop_box"]) for entry in pending],
+                    detail=detail,
+                )
+        except (AdmissionRejectedError, ExecutorSaturatedError) as exc:
+            _record_error(exc, "recognitions_batch")
+            raise HTTPException(
+                status_code=503,
+                detail=str(exc),
+                headers={"Retry-After": str(exc.retry_after)},
+            ) from exc
+        except FileNotFoundError as exc:
+            _record_error(exc, "recognitions_batch")
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
+        except Exception as exc:  # pragma: no cover - unexpected failure
+            _record_error(exc, "recognitions_batch")
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+        metrics.observe("admission_wait_ms", admission_wait * 1000.0, lane="bulk")
+        timings = {"admission_wait_ms": int(admission_wait * 1000), **timings}
+        new_cache_entries = []
+        batch_stages_observed = False
+        for entry, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                _record_error(outcome, "recognitions_batch")
+                entry["error"] = str(outcome)
+                continue
+            entry["recognition"] = outcome
+            # HOG and scoring ran once for the whole batch, so count them once.
+            _observe_recognition(
+                outcome.stage_timings,
+                len(outcome.digits),
+                outcome.peak_memory_bytes,
+                skip=("hog", "score") if batch_stages_observed else (),
+            )
+            batch_stages_observed = True
+            if entry["cache_key"] is not None:
+                new_cache_entries.append((
+                    entry["cache_key"],
+                    CachedRecognition(result=outcome, recognition_id=entry["id"], image_url=entry["image_url"]),
+                ))
+        for cache_key, cache_entry in new_cache_entries:
+            await run_in_threadpool(result_cache.put, cache_key, cache_entry)
+
+    results: List[dict] = []
+    log_records: List[dict] = []
+    for entry in entries:
+        if entry["error"] is not None:
+            results.append({
+                "index": entry["index"],
+                "status": "error",
+                "error": entry["error"],
+                "image_url": entry["image_url"],
+                "thumbnail_url": entry["thumbnail_url"],
+                "metadata": entry["metadata"],
+            })
+            continue
+        payload = entry["recognition"].to_dict()
+        results.append({
+            "index": entry["index"],
+            "status": "ok",
+            "id": entry["id"],
+            **payload,
+            "image_url": entry["image_url"],
+            "thumbnail_url": entry["thumbnail_url"],
+            "metadata": entry["metadata"],
+            "cache_hit": entry["cached_from"] is not None,
+        })
+        log_records.append({
+            "id": entry["id"],
+            "cached_from": entry["cached_from"],
+            "file_path": str(entry["stored"].path) if entry["stored"] is not None else None,
+            "image_url": entry["image_url"],
+            "thumbnail_url": entry["thumbnail_url"],
+            "prediction": payload["prediction"],
+            "accuracy": payload["accuracy"],
+            "processing_time_ms": payload["processing_time_ms"],
+            "model_version": payload["model_version"],
+            "artifact_id": payload["artifact_id"],
+            "metadata": entry["metadata"],
+            "digits": payload["digits"],
+        })
+
+    await run_in_threadpool(storage.append_records, log_records)
+
+    succeeded = len(log_records)
+    print(f"Batch recognition processed: {succeeded}/{len(entries)} succeeded")
+    # Pipeline images are raw bytes; dump_json writes them as base64.
+    body = dump_json({
+        "items": results,
+        "summary": {
+            "count": len(entries),
+            "succeeded": succeeded,
+            "failed": len(entries) - succeeded,
+            **timings,
+        },
     })
+    return Response(content=body, media_type="application/json")
+
+
+def _parse_stream_config(raw: str) -> Tuple[Optional[int], Optional[CropBox]]:
+    try:
+        config = json.loads(raw)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="stream config must be a JSON object") from exc
+    if not isinstance(config, dict):
+        raise HTTPException(status_code=400, detail="stream config must be a JSON object")
+    expected = config.get("expected_digits")
+    if expected is not None and (not isinstance(expected, int) or isinstance(expected, bool)):
+        raise HTTPException(status_code=400, detail="expected_digits must be an integer")
+    return expected, _parse_crop_box(config.get("crop_box"))
 
-    print(f"Recognition request processed: {response_payload}")
-    return response_payload
\ No newline at end of file
+
+@app.websocket("/recognitions/stream")
+async def recognition_stream(
+    websocket: WebSocket,
+    expected_digits: Optional[int] = None,
+    device_id: str = _DEFAULT_DEVICE_ID,
+):
+    """Live readings for camera-preview frames.
+
+    Binary messages are encoded frames (JPEG/PNG); a text message with
+    ``{"expected_digits", "crop_box"}`` changes the settings. Predictions
+    are pushed as JSON when a processed frame yields a reading or when the
+    reading becomes stable. Frames that arrive while one is being
+    recognized replace each other, so only the newest is processed.
+
+    Opening a stream spends one rate-limit token, and every frame runs on
+    the recognition executor in the ``stream`` admission lane; a frame that
+    cannot get a slot in time is shed and the next one tries again.
+    """
+    global _stream_sessions
+    if not readiness.ready or _stream_sessions >= STREAM_MAX_SESSIONS:
+        # 1013: try again later.
+        await websocket.close(code=1013)
+        return
+    try:
+        _check_rate_limit(websocket, device_id, "recognitions_stream")
+    except HTTPException:
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    _stream_sessions += 1
+    session = StreamSession(recognizer, expected_digits=expected_digits)
+    mailbox = LatestFrame()
+
+    async def _receive() -> None:
+        sequence = 0
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame is not None:
+                    if len(frame) > STREAM_MAX_FRAME_BYTES:
+                        # 1009: message too big.
+                        await websocket.close(code=1009)
+                        break
+                    sequence += 1
+                    if mailbox.put(sequence, frame):
+                        metrics.inc("stream_frames_total", outcome="dropped")
+                elif message.get("text") is not None:
+                    try:
+                        config = _parse_stream_config(message["text"])
+                    except HTTPException:
+                        # 1007: invalid payload data.
+                        await websocket.close(code=1007)
+                        break
+                    session.configure(*config)
+        finally:
+            mailbox.close()
+
+    receiver = asyncio.create_task(_receive())
+    try:
+        while True:
+            item = await mailbox.get()
+            if item is None:
+                break
+            sequence, frame = item
+            try:
+                async with admission.slot("stream") as admission_wait:
+                    outcome, message = await executor.process_frame(session, frame, sequence)
+                metrics.observe("admission_wait_ms", admission_wait * 1000.0, lane="stream")
+            except (AdmissionRejectedError, ExecutorSaturatedError):
+                outcome, message = "shed", None
+            except Exception as exc:  # pragma: no cover - unexpected failure
+                _record_error(exc, "recognitions_stream")
+                outcome, message = "error", {"type": "error", "sequence": sequence, "detail": str(exc)}
+            metrics.inc("stream_frames_total", outcome=outcome)
+            if message is None:
+                continue
+            try:
+                await websocket.send_json({**message, "dropped": mailbox.dropped})
+            except (WebSocketDisconnect, RuntimeError):
+                # The client went away while the result was being sent.
+                break
+    finally:
+        receiver.cancel()
+        _stream_sessions -= 1
+        print(f"Preview stream closed: {session.stats()} dropped={mailbox.dropped}")
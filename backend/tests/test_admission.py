@@ -0,0 +1,134 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import admission as admission_module
+from app.admission import AdmissionController, AdmissionRejectedError, RateLimitedError, RateLimiter
+
+
+def _controller(max_in_flight=1, max_queue=8, max_wait_s=5.0):
+    lanes = ("interactive", "stream", "bulk")
+    return AdmissionController(
+        max_in_flight,
+        max_queue={lane: max_queue for lane in lanes},
+        max_wait_s={lane: max_wait_s for lane in lanes},
+    )
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    # Only the limiter's clock is replaced; the event loop keeps real time.
+    monkeypatch.setattr(admission_module, "time", SimpleNamespace(monotonic=clock, perf_counter=time.perf_counter))
+    return clock
+
+
+def test_free_slot_goes_to_highest_lane_then_oldest_waiter():
+    async def scenario():
+        controller = _controller()
+        order = []
+
+        async def job(lane, name):
+            async with controller.slot(lane):
+                order.append(name)
+
+        await controller.acquire("bulk")
+        tasks = []
+        for lane, name in [("bulk", "bulk-1"), ("stream", "stream-1"), ("interactive", "interactive-1"),
+                           ("bulk", "bulk-2"), ("interactive", "interactive-2")]:
+            tasks.append(asyncio.create_task(job(lane, name)))
+            await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*tasks)
+        return order, controller.in_flight
+
+    order, in_flight = asyncio.run(scenario())
+    assert order == ["interactive-1", "interactive-2", "stream-1", "bulk-1", "bulk-2"]
+    assert in_flight == 0
+
+
+def test_full_lane_rejects_without_queueing():
+    async def scenario():
+        controller = _controller(max_queue=1)
+        await controller.acquire("interactive")
+        queued = asyncio.create_task(controller.acquire("bulk"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            await controller.acquire("bulk")
+        # Other lanes keep their own queues.
+        interactive = asyncio.create_task(controller.acquire("interactive"))
+        await asyncio.sleep(0)
+        controller.release()
+        await interactive
+        controller.release()
+        await queued
+        controller.release()
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.lane == "bulk" and rejected.retry_after >= 1
+    assert stats["lanes"]["bulk"]["rejected"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_waiter_that_times_out_gives_up_its_place():
+    async def scenario():
+        controller = _controller(max_wait_s=0.05)
+        await controller.acquire("interactive")
+        with pytest.raises(AdmissionRejectedError):
+            await controller.acquire("bulk")
+        controller.release()
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["lanes"]["bulk"]["timed_out"] == 1
+    assert stats["lanes"]["bulk"]["queued"] == 0
+    assert stats["in_flight"] == 0
+
+
+def test_bucket_allows_burst_then_limits_until_refilled(clock):
+    limiter = RateLimiter(rate=2.0, burst=3)
+    for _ in range(3):
+        limiter.acquire("device-a")
+    with pytest.raises(RateLimitedError) as limited:
+        limiter.acquire("device-a")
+    assert limited.value.retry_after == 1
+    # Other clients have their own bucket.
+    limiter.acquire("device-b")
+
+    clock.now += 0.5
+    limiter.acquire("device-a")
+    with pytest.raises(RateLimitedError):
+        limiter.acquire("device-a")
+    assert limiter.stats()["limited"] == 2
+
+
+def test_batch_cost_is_capped_at_the_burst(clock):
+    limiter = RateLimiter(rate=1.0, burst=4)
+    limiter.acquire("device", cost=10)
+    with pytest.raises(RateLimitedError) as limited:
+        limiter.acquire("device", cost=2)
+    assert limited.value.retry_after == 2
+
+
+def test_disabled_limiter_and_forgotten_keys(clock):
+    disabled = RateLimiter(rate=0, burst=1)
+    for _ in range(5):
+        disabled.acquire("device")
+
+    limiter = RateLimiter(rate=1.0, burst=1, max_keys=1)
+    limiter.acquire("device-a")
+    limiter.acquire("device-b")
+    # device-a was evicted, so it starts again with a full bucket.
+    limiter.acquire("device-a")
+    assert limiter.stats()["tracked_keys"] == 1
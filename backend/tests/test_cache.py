@@ -0,0 +1,90 @@
+import dataclasses
+from pathlib import Path
+
+import pytest
+
+from app.cache import CachedRecognition, RecognitionCache
+from app.recognizer import DigitRecognizer, RecognitionResult, load_model
+
+MODEL_PATH = Path(__file__).resolve().parent.parent / "models" / "svm_digit_classifier.joblib"
+DIGEST = "0" * 64
+
+
+@pytest.fixture(scope="module")
+def loaded():
+    return load_model(MODEL_PATH)
+
+
+def _entry(artifact_id: str) -> CachedRecognition:
+    result = RecognitionResult(
+        prediction="42",
+        accuracy=99.0,
+        processing_time_ms=3,
+        digits=[],
+        artifact_id=artifact_id,
+    )
+    return CachedRecognition(result=result, recognition_id="r1", image_url=None)
+
+
+def _bound(tmp_path, eager: bool = False):
+    recognizer = DigitRecognizer(model_path=str(MODEL_PATH), eager=eager)
+    cache = RecognitionCache(max_entries=8, disk_dir=tmp_path)
+    recognizer.add_load_listener(lambda model: cache.bind_artifact(model.artifact_id))
+    return recognizer, cache
+
+
+def test_key_depends_on_artifact_and_request():
+    base = RecognitionCache.make_key(DIGEST, 4, "a" * 64, "summary")
+    assert base == RecognitionCache.make_key(DIGEST, 4, "a" * 64, "summary")
+    assert base != RecognitionCache.make_key(DIGEST, 4, "b" * 64, "summary")
+    assert base != RecognitionCache.make_key(DIGEST, 3, "a" * 64, "summary")
+    assert base != RecognitionCache.make_key(DIGEST, 4, "a" * 64, "full")
+    assert base != RecognitionCache.make_key(DIGEST, 4, "a" * 64, "summary", crop_box=(0, 0, 10, 10))
+
+
+def test_first_load_binds_the_cache(tmp_path, loaded):
+    recognizer, cache = _bound(tmp_path)
+    key = RecognitionCache.make_key(DIGEST, None, loaded.artifact_id, "summary")
+    # Nothing is cached for a model that is not serving yet.
+    cache.put(key, _entry(loaded.artifact_id))
+    assert cache.get(key) is None
+
+    recognizer.ensure_ready()
+    cache.put(key, _entry(loaded.artifact_id))
+    assert cache.get(key).result.prediction == "42"
+    assert (tmp_path / loaded.artifact_id / f"{key}.json").exists()
+
+
+def test_listener_added_after_an_eager_load_binds_at_once(tmp_path, loaded):
+    recognizer, cache = _bound(tmp_path, eager=True)
+    key = RecognitionCache.make_key(DIGEST, None, recognizer.artifact_id, "summary")
+    cache.put(key, _entry(recognizer.artifact_id))
+    assert cache.get(key) is not None
+
+
+def test_swap_drops_results_of_the_previous_model(tmp_path, loaded):
+    recognizer, cache = _bound(tmp_path)
+    recognizer.ensure_ready()
+    key = RecognitionCache.make_key(DIGEST, None, loaded.artifact_id, "summary")
+    cache.put(key, _entry(loaded.artifact_id))
+
+    replacement = dataclasses.replace(loaded, artifact_id="f" * 64)
+    recognizer.swap_model(replacement)
+    assert cache.get(key) is None
+    assert not (tmp_path / loaded.artifact_id).exists()
+    assert cache.stats()["invalidations"] == 1
+    # A request that started on the old model cannot repopulate the cache.
+    cache.put(key, _entry(loaded.artifact_id))
+    assert cache.get(key) is None
+
+
+def test_disk_tier_serves_a_fresh_process(tmp_path, loaded):
+    recognizer, cache = _bound(tmp_path)
+    recognizer.ensure_ready()
+    key = RecognitionCache.make_key(DIGEST, None, loaded.artifact_id, "summary")
+    cache.put(key, _entry(loaded.artifact_id))
+
+    _, restarted = _bound(tmp_path, eager=True)
+    entry = restarted.get(key)
+    assert entry is not None and entry.recognition_id == "r1"
+    assert restarted.stats()["disk_hits"] == 1
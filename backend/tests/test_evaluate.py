@@ -0,0 +1,105 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from app.benchmark import generate_corpus
+from app.evaluate import _parse_args, run_evaluation
+from app.recognizer import DigitRecognizer, RecognitionError
+
+MODEL_PATH = Path(__file__).resolve().parent.parent / "models" / "svm_digit_classifier.joblib"
+LOG_NAME = "recognitions_log.jsonl"
+
+
+@pytest.fixture(scope="module")
+def recognizer():
+    return DigitRecognizer(model_path=str(MODEL_PATH))
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    upload_dir = tmp_path / "uploads"
+    (upload_dir / "objects").mkdir(parents=True)
+    lines = []
+    for index, item in enumerate(generate_corpus(scales=(1.0,), digit_counts=(1, 3), per_cell=3)):
+        (upload_dir / "objects" / f"{item.name}.png").write_bytes(item.image_bytes)
+        lines.append({"id": f"r{index}", "file_path": f"uploads/objects/{item.name}.png", "prediction": item.digits})
+    lines.insert(2, {"id": "gone", "file_path": "uploads/objects/gone.png", "prediction": "1"})
+    lines.insert(4, {"id": "no-file"})
+    with (upload_dir / LOG_NAME).open("w", encoding="utf-8") as stream:
+        for index, line in enumerate(lines):
+            stream.write(json.dumps(line) + "\n")
+            if index == 5:
+                stream.write("{not json\n")
+    return upload_dir
+
+
+def _run(recognizer, upload_dir, output, *extra):
+    args = _parse_args([
+        "--upload-dir", str(upload_dir),
+        "--output", str(output),
+        "--workers", "1",
+        "--chunk-size", "2",
+        "--batch-size", "2",
+        *extra,
+    ])
+    return run_evaluation(recognizer, args)
+
+
+def _rows(output: Path):
+    return [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+
+
+def _outcomes(output: Path):
+    return [(row["id"], row["status"], row.get("prediction")) for row in _rows(output)]
+
+
+def _rotate(upload_dir: Path) -> None:
+    # The server seals the active log under a timestamped name and starts a new one.
+    (upload_dir / LOG_NAME).rename(upload_dir / "recognitions_log.20240101T000000000000.jsonl")
+    (upload_dir / LOG_NAME).touch()
+
+
+def test_resumed_run_matches_an_uninterrupted_one(recognizer, upload_dir, tmp_path):
+    full = _run(recognizer, upload_dir, tmp_path / "full.jsonl")
+    assert full["totals"]["records"] == 8 and full["totals"]["evaluated"] == 6
+    assert full["totals"]["invalid"] == 1
+    assert full["totals"]["missing"] == 1 and full["totals"]["no_file"] == 1
+
+    output = tmp_path / "resumed.jsonl"
+    first = _run(recognizer, upload_dir, output, "--limit", "5")
+    assert first["resumed_from"] == 0
+    checkpoint = json.loads(Path(f"{output}.checkpoint.json").read_text(encoding="utf-8"))
+    assert checkpoint["totals"]["records"] + checkpoint["totals"]["invalid"] == 5
+    # Rows written after the last checkpoint of a crashed run are dropped.
+    with output.open("ab") as stream:
+        stream.write(b'{"id": "half-written"')
+    _rotate(upload_dir)
+
+    resumed = _run(recognizer, upload_dir, output)
+    assert resumed["resumed_from"] == checkpoint["totals"]["records"]
+    assert resumed["totals"] == full["totals"]
+    assert _outcomes(output) == _outcomes(tmp_path / "full.jsonl")
+
+
+def test_completed_run_resumes_with_nothing_left(recognizer, upload_dir, tmp_path):
+    output = tmp_path / "out.jsonl"
+    done = _run(recognizer, upload_dir, output)
+    again = _run(recognizer, upload_dir, output)
+    assert again["resumed_from"] == done["totals"]["records"]
+    assert again["totals"] == done["totals"]
+    assert again["throughput"]["images"] == 0
+    assert len(_rows(output)) == done["totals"]["records"]
+
+
+def test_checkpoint_of_another_artifact_is_refused(recognizer, upload_dir, tmp_path):
+    output = tmp_path / "out.jsonl"
+    _run(recognizer, upload_dir, output, "--limit", "3")
+    checkpoint_path = Path(f"{output}.checkpoint.json")
+    state = json.loads(checkpoint_path.read_text(encoding="utf-8"))
+    state["artifact_id"] = "0" * 64
+    checkpoint_path.write_text(json.dumps(state), encoding="utf-8")
+    with pytest.raises(RecognitionError):
+        _run(recognizer, upload_dir, output)
+    restarted = _run(recognizer, upload_dir, output, "--restart")
+    assert restarted["resumed_from"] == 0
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from skimage.feature import hog
+
+from app.hog import FixedHogExtractor
+from app.recognizer import _DEFAULT_HOG_PARAMS
+
+SIZE = 28
+
+
+def _canvases(seed: int, count: int = 32) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    stack = rng.integers(0, 256, size=(count, SIZE, SIZE), dtype=np.uint8)
+    # Flat and hard-edged canvases hit the zero-gradient and 180-degree wrap cases.
+    stack[0] = 0
+    stack[1, :, SIZE // 2 :] = 255
+    stack[2, SIZE // 2 :, :] = 255
+    return stack
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        _DEFAULT_HOG_PARAMS,
+        {**_DEFAULT_HOG_PARAMS, "transform_sqrt": False},
+        {**_DEFAULT_HOG_PARAMS, "block_norm": "L1"},
+        {**_DEFAULT_HOG_PARAMS, "block_norm": "L1-sqrt"},
+        {**_DEFAULT_HOG_PARAMS, "block_norm": "L2"},
+        {"pixels_per_cell": (7, 7), "cells_per_block": (3, 3), "orientations": 12, "block_norm": "L2-Hys"},
+    ],
+)
+def test_vectorized_hog_matches_skimage(params):
+    extractor = FixedHogExtractor(size=SIZE, **params)
+    stack = _canvases(seed=11)
+    expected = np.vstack([hog(image, feature_vector=True, **params) for image in stack])
+    actual = extractor.extract(stack)
+    assert actual.shape == expected.shape == (len(stack), extractor.n_features)
+    np.testing.assert_allclose(actual, expected, rtol=0.0, atol=1e-6)
+
+
+def test_single_canvas_extracts_one_row():
+    image = _canvases(seed=7, count=3)[2]
+    features = FixedHogExtractor(size=SIZE, **_DEFAULT_HOG_PARAMS).extract(image)
+    np.testing.assert_allclose(features[0], hog(image, feature_vector=True, **_DEFAULT_HOG_PARAMS), rtol=0.0, atol=1e-6)
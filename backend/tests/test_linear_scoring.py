@@ -0,0 +1,110 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC, LinearSVC
+from sklearn.utils.multiclass import _ovr_decision_function
+
+from app.linear_scoring import _ovr_from_ovo, compile_linear_model, load_compiled, save_compiled
+
+ARTIFACT_ID = "a" * 64
+
+
+def _fitted(model, n_classes: int):
+    rng = np.random.default_rng(5)
+    centers = rng.normal(scale=4.0, size=(n_classes, 12))
+    labels = np.repeat(np.arange(n_classes), 40)
+    features = centers[labels] + rng.normal(size=(len(labels), 12)) * 3.0 + 50.0
+    scaler = StandardScaler().fit(features)
+    model.fit(scaler.transform(features), labels)
+    return model, scaler, features
+
+
+@pytest.mark.parametrize(
+    "model, n_classes",
+    [
+        (SVC(kernel="linear"), 4),
+        (SVC(kernel="linear"), 2),
+        (LinearSVC(), 4),
+        (LogisticRegression(), 3),
+    ],
+)
+def test_compiled_decision_function_matches_sklearn(model, n_classes):
+    model, scaler, features = _fitted(model, n_classes)
+    compiled, reason = compile_linear_model(model, scaler)
+    assert reason == "ok"
+    expected = model.decision_function(scaler.transform(features))
+    np.testing.assert_allclose(compiled.decision_function(features), expected, rtol=1e-9, atol=1e-9)
+
+
+def test_ovr_from_ovo_matches_sklearn():
+    rng = np.random.default_rng(9)
+    n_classes = 5
+    pairwise = rng.normal(size=(64, n_classes * (n_classes - 1) // 2))
+    pairwise[0] = 0.0
+    expected = _ovr_decision_function(pairwise < 0, -pairwise, n_classes)
+    np.testing.assert_allclose(_ovr_from_ovo(pairwise, n_classes), expected, rtol=0.0, atol=1e-12)
+
+
+def test_rbf_model_is_not_compiled():
+    model, scaler, _ = _fitted(SVC(kernel="rbf"), 3)
+    compiled, reason = compile_linear_model(model, scaler)
+    assert compiled is None
+    assert reason == "model tidak linear"
+
+
+@pytest.fixture
+def saved(tmp_path):
+    model, scaler, features = _fitted(SVC(kernel="linear"), 4)
+    compiled, _ = compile_linear_model(model, scaler)
+    path = tmp_path / f"{ARTIFACT_ID}.npz"
+    assert save_compiled(compiled, path, ARTIFACT_ID, {"version": "test"})
+    return path, model, scaler, features
+
+
+def test_saved_model_round_trips(saved):
+    path, model, scaler, features = saved
+    compiled, extra = load_compiled(path, ARTIFACT_ID)
+    assert extra == {"version": "test"}
+    expected = model.decision_function(scaler.transform(features))
+    np.testing.assert_allclose(compiled.decision_function(features), expected, rtol=1e-9, atol=1e-9)
+
+
+def test_saved_model_for_another_artifact_is_rejected(saved):
+    path = saved[0]
+    assert load_compiled(path, "b" * 64) is None
+
+
+def test_saved_model_with_changed_weights_is_rejected(saved):
+    path = saved[0]
+    with np.load(path) as data:
+        arrays = dict(data)
+    arrays["weights_t"] = arrays["weights_t"] * 1.01
+    with path.open("wb") as stream:
+        np.savez(stream, **arrays)
+    assert load_compiled(path, ARTIFACT_ID) is None
+
+
+def test_model_load_recompiles_a_cache_that_fails_verification(tmp_path, monkeypatch):
+    from app.recognizer import load_model
+
+    # A private copy, so no model loaded by another test is reused.
+    model_path = tmp_path / "model.joblib"
+    shutil.copyfile(Path(__file__).resolve().parent.parent / "models" / "svm_digit_classifier.joblib", model_path)
+    monkeypatch.setenv("MODEL_COMPILED_DIR", str(tmp_path / "compiled"))
+    first = load_model(model_path, shared=False)
+    assert first.load_source == "joblib"
+    cached = load_model(model_path, shared=False)
+    assert cached.load_source == "compiled-cache"
+
+    path = tmp_path / "compiled" / f"{first.artifact_id}.npz"
+    with np.load(path) as data:
+        arrays = dict(data)
+    arrays["bias"] = arrays["bias"] + 1.0
+    with path.open("wb") as stream:
+        np.savez(stream, **arrays)
+    assert load_model(model_path, shared=False).load_source == "joblib"
+    assert load_model(model_path, shared=False).load_source == "compiled-cache"
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from app.benchmark import CROP_ALLOCATION_LIMIT_BYTES, check_crop_allocations, generate_corpus
+from app.recognizer import _ingest_image, _robust_preprocessing, _segment_digits
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return generate_corpus()
+
+
+def _preprocessed(item):
+    preprocessed, _ = _robust_preprocessing(_ingest_image(item.image_bytes)["gray"])
+    return preprocessed
+
+
+def test_crop_path_stays_within_allocation_bound(corpus):
+    report = check_crop_allocations(corpus)
+    assert report["crops"] > 0
+    assert report["over_limit"] == 0
+    assert report["max_bytes"] <= CROP_ALLOCATION_LIMIT_BYTES
+
+
+def test_crop_stack_rows_are_the_segment_crops(corpus):
+    for item in corpus:
+        segments, _, stack = _segment_digits(_preprocessed(item))
+        assert stack.shape == (len(segments), 28, 28)
+        for row, entry in zip(stack, segments):
+            assert np.shares_memory(row, entry["crop"])
+            assert np.array_equal(row, entry["crop"])
+
+
+def test_ownership_map_matches_reference_masks(corpus):
+    for item in corpus:
+        preprocessed = _preprocessed(item)
+        fast, _, fast_stack = _segment_digits(preprocessed)
+        reference, _, reference_stack = _segment_digits(preprocessed, ownership="reference")
+        assert [entry["bbox"] for entry in fast] == [entry["bbox"] for entry in reference], item.name
+        assert np.array_equal(fast_stack, reference_stack), item.name
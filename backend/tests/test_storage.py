@@ -0,0 +1,115 @@
+import json
+import threading
+
+from app.storage import RecognitionStorage, _GroupCommitWriter
+
+
+def _flaky_writer(failures: int):
+    written = []
+    remaining = {"failures": failures}
+    lock = threading.Lock()
+
+    def write(batch):
+        with lock:
+            if remaining["failures"]:
+                remaining["failures"] -= 1
+                raise OSError("disk full")
+            written.extend(batch)
+
+    return write, written, remaining
+
+
+def test_failed_group_commit_keeps_records_and_retries_in_order():
+    write, written, _ = _flaky_writer(failures=1)
+    writer = _GroupCommitWriter(write, flush_interval=0.01, flush_max_records=4, max_pending_records=100)
+    try:
+        writer.submit([{"i": i} for i in range(3)])
+        # The first attempt fails: flush reports it instead of claiming success.
+        assert writer.flush(timeout=5) is False
+        writer.submit([{"i": 3}])
+        assert writer.flush(timeout=5) is True
+        assert [record["i"] for record in written] == [0, 1, 2, 3]
+        stats = writer.stats()
+        assert stats["records_written"] == 4
+        assert stats["failed_flushes"] == 1
+        assert stats["last_error"] == "disk full"
+    finally:
+        writer.close()
+
+
+def test_close_reports_records_it_could_not_write():
+    write, written, _ = _flaky_writer(failures=10**6)
+    writer = _GroupCommitWriter(write, flush_interval=0.01, flush_max_records=4, max_pending_records=100)
+    writer.submit([{"i": 0}, {"i": 1}])
+    assert writer.close() is False
+    assert written == []
+    assert writer.stats()["records_written"] == 0
+
+
+def _crashed_append(storage: RecognitionStorage, text: str) -> None:
+    # A writer that appended to the log and died before indexing it.
+    with storage.history_path.open("ab") as stream:
+        stream.write(text.encode("utf-8"))
+
+
+def _ids(storage: RecognitionStorage):
+    records, _ = storage.query_records(limit=100)
+    return [record["id"] for record in reversed(records)]
+
+
+def test_startup_indexes_lines_a_crashed_writer_left_unindexed(tmp_path):
+    storage = RecognitionStorage(tmp_path)
+    storage.append_records([{"id": "a"}])
+    _crashed_append(storage, json.dumps({"id": "lost"}) + "\n")
+    storage.close()
+
+    reopened = RecognitionStorage(tmp_path)
+    try:
+        assert _ids(reopened) == ["a", "lost"]
+        assert reopened.get_record("lost") == {"id": "lost"}
+    finally:
+        reopened.close()
+
+
+def test_write_after_a_crashed_writer_indexes_its_lines_first(tmp_path):
+    storage = RecognitionStorage(tmp_path)
+    try:
+        storage.append_records([{"id": "a"}])
+        # Another process appended and died; this process writes next.
+        _crashed_append(storage, json.dumps({"id": "lost"}) + "\n")
+        storage.append_records([{"id": "b"}])
+        assert _ids(storage) == ["a", "lost", "b"]
+    finally:
+        storage.close()
+
+    reopened = RecognitionStorage(tmp_path)
+    try:
+        assert _ids(reopened) == ["a", "lost", "b"]
+    finally:
+        reopened.close()
+
+
+def test_torn_line_is_skipped_and_later_records_stay_indexed(tmp_path):
+    storage = RecognitionStorage(tmp_path)
+    try:
+        storage.append_records([{"id": "a"}])
+        _crashed_append(storage, '{"id": "to')
+        storage.sync_index()
+        storage.append_records([{"id": "b"}])
+        assert _ids(storage) == ["a", "b"]
+        assert storage.get_record("b")["id"] == "b"
+    finally:
+        storage.close()
+
+
+def test_rotation_indexes_the_unindexed_tail_before_sealing(tmp_path):
+    storage = RecognitionStorage(tmp_path)
+    try:
+        storage.append_records([{"id": "a"}])
+        _crashed_append(storage, json.dumps({"id": "lost"}) + "\n")
+        sealed = storage.rotate()
+        storage.append_records([{"id": "b"}])
+        assert sealed is not None
+        assert _ids(storage) == ["a", "lost", "b"]
+    finally:
+        storage.close()
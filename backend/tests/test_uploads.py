@@ -0,0 +1,105 @@
+import hashlib
+import io
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app.uploads import UploadStore, UploadTooLargeError, _GcLock, read_upload
+
+DAY = 86400.0
+
+
+def _png(value: int, size: int = 64) -> bytes:
+    image = np.full((size, size), value, dtype=np.uint8)
+    cv2.putText(image, str(value % 10), (8, size - 8), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 255 - value, 3)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UploadStore(tmp_path / "uploads")
+    yield store
+    store.shutdown()
+
+
+def _save(store, contents: bytes, used_at: float):
+    stored = store.locate(contents, "photo.png")
+    store.save(stored, contents=contents)
+    os.utime(stored.path, (used_at, used_at))
+    return stored
+
+
+@pytest.mark.parametrize("size_hint", [None, 10, 5000, 1 << 20])
+def test_read_upload_returns_bytes_and_digest(tmp_path, size_hint):
+    contents = os.urandom(5000)
+    sink = tmp_path / "upload.part"
+    buffer, digest = read_upload(io.BytesIO(contents), 1 << 20, str(sink), size_hint, chunk_bytes=1024)
+    assert bytes(buffer) == contents
+    assert digest == hashlib.sha256(contents).hexdigest()
+    assert sink.read_bytes() == contents
+
+
+def test_oversized_upload_is_rejected_and_its_sink_removed(tmp_path):
+    sink = tmp_path / "upload.part"
+    with pytest.raises(UploadTooLargeError):
+        read_upload(io.BytesIO(os.urandom(5000)), 4096, str(sink), chunk_bytes=1024)
+    assert not sink.exists()
+
+
+def test_identical_bytes_share_one_address(store):
+    contents = _png(10)
+    first = store.locate(contents, "a.jpg")
+    again = store.locate(contents, "b.jpeg", hashlib.sha256(contents).hexdigest())
+    other = store.locate(_png(20), "a.png")
+    assert first == again
+    # The suffix comes from the bytes, not from the client's file name.
+    assert first.path.suffix == ".png"
+    assert first.path.parent.name == first.digest[:2]
+    assert first.url == f"/uploads/objects/{first.digest[:2]}/{first.path.name}"
+    assert other.digest != first.digest
+
+
+def test_repeat_upload_is_stored_once_and_marked_used(store, tmp_path):
+    contents = _png(30)
+    stored = _save(store, contents, used_at=1000.0)
+    part = tmp_path / "repeat.part"
+    part.write_bytes(contents)
+    assert store.save(stored, part_path=str(part)) is False
+    assert not part.exists()
+    assert stored.path.stat().st_mtime > 1000.0
+    assert store.stats()["stored"] == 1 and store.stats()["deduplicated"] == 1
+    store.shutdown()
+    assert stored.thumbnail_path.exists()
+
+
+def test_gc_removes_objects_unused_past_the_age_limit(store):
+    store.max_age_days = 7
+    now = 100 * DAY
+    old = _save(store, _png(40), used_at=now - 8 * DAY)
+    recent = _save(store, _png(50), used_at=now - 1 * DAY)
+    store.shutdown()
+    summary = store.collect_garbage(now=now)
+    assert summary["removed"] == 1
+    assert not old.path.exists() and not old.thumbnail_path.exists()
+    assert recent.path.exists() and recent.thumbnail_path.exists()
+
+
+def test_gc_evicts_least_recently_used_over_the_size_limit(store):
+    now = 100 * DAY
+    uploads = [_save(store, _png(60 + index), used_at=now - (3 - index) * DAY) for index in range(3)]
+    store.max_total_bytes = sum(stored.path.stat().st_size for stored in uploads[1:])
+    store.shutdown()
+    summary = store.collect_garbage(now=now)
+    assert summary["removed"] == 1
+    assert [stored.path.exists() for stored in uploads] == [False, True, True]
+    assert summary["total_bytes"] <= store.max_total_bytes
+
+
+def test_gc_skips_while_another_process_collects(store):
+    store.max_age_days = 1
+    with _GcLock(store.base_dir / ".gc.lock") as acquired:
+        assert acquired
+        assert store.collect_garbage() is None
+    assert store.collect_garbage() is not None
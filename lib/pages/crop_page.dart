@@ -41,6 +41,7 @@ class _CropPageState extends State<CropPage> {
       ..setError(null)
       ..setUploading(true)
       ..setPipeline(null)
+      ..setRecognitionId(null)
       ..setCaptureSource('Galeri - Penyimpanan');
 
     try {
@@ -51,6 +52,7 @@ class _CropPageState extends State<CropPage> {
 
       capture.setPrediction(response.prediction, response.accuracy);
       capture.setPipeline(response.pipeline);
+      capture.setRecognitionId(response.recognitionId);
 
       if (!mounted) return;
       await Navigator.pushReplacement(
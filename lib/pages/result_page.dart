@@ -28,8 +28,10 @@ class ResultPage extends StatefulWidget {
 }
 
 class _ResultPageState extends State<ResultPage> {
+  final RecognitionService _recognitionService = RecognitionService();
   bool _isSaving = false;
   bool _showPipeline = false;
+  bool _isLoadingPipeline = false;
 
   @override
   Widget build(BuildContext context) {
@@ -177,8 +179,9 @@ class _ResultPageState extends State<ResultPage> {
 
               const SizedBox(height: 16),
 
-              if (pipeline != null && pipeline.hasVisuals) ...[
-                _buildPipelineToggleCard(),
+              if (pipeline != null &&
+                  (pipeline.hasVisuals || capture.recognitionId != null)) ...[
+                _buildPipelineToggleCard(capture),
                 const SizedBox(height: 16),
                 AnimatedSwitcher(
                   duration: const Duration(milliseconds: 350),
@@ -342,7 +345,36 @@ class _ResultPageState extends State<ResultPage> {
     );
   }
 
-  Widget _buildPipelineToggleCard() {
+  Future<void> _togglePipeline(CaptureProvider capture) async {
+    final pipeline = capture.pipeline;
+    final recognitionId = capture.recognitionId;
+    if (_showPipeline ||
+        pipeline == null ||
+        pipeline.hasVisuals ||
+        recognitionId == null) {
+      setState(() => _showPipeline = !_showPipeline);
+      return;
+    }
+
+    setState(() => _isLoadingPipeline = true);
+    try {
+      final detailed = await _recognitionService.fetchPipeline(recognitionId);
+      capture.setPipeline(detailed);
+      if (!mounted) return;
+      setState(() => _showPipeline = true);
+    } on RecognitionException catch (error) {
+      if (!mounted) return;
+      ScaffoldMessenger.of(
+        context,
+      ).showSnackBar(SnackBar(content: Text(error.message)));
+    } finally {
+      if (mounted) {
+        setState(() => _isLoadingPipeline = false);
+      }
+    }
+  }
+
+  Widget _buildPipelineToggleCard(CaptureProvider capture) {
     const accent = Color(0xFF0D47A1);
     return Container(
       width: double.infinity,
@@ -354,7 +386,9 @@ class _ResultPageState extends State<ResultPage> {
       ),
       child: Center(
         child: TextButton.icon(
-          onPressed: () => setState(() => _showPipeline = !_showPipeline),
+          onPressed: _isLoadingPipeline
+              ? null
+              : () => _togglePipeline(capture),
           style: TextButton.styleFrom(
             foregroundColor: accent,
             padding: const EdgeInsets.symmetric(horizontal: 18, vertical: 12),
@@ -363,7 +397,13 @@ class _ResultPageState extends State<ResultPage> {
               borderRadius: BorderRadius.circular(24),
             ),
           ),
-          icon: Icon(_showPipeline ? Icons.visibility_off : Icons.visibility),
+          icon: _isLoadingPipeline
+              ? const SizedBox(
+                  width: 18,
+                  height: 18,
+                  child: CircularProgressIndicator(strokeWidth: 2),
+                )
+              : Icon(_showPipeline ? Icons.visibility_off : Icons.visibility),
           label: const Text('Lihat Selengkapnya'),
         ),
       ),
@@ -148,6 +148,7 @@ class _ScanPageState extends State<ScanPage> {
     final Uint8List payloadBytes = autoResult?.bytes ?? originalBytes;
     capture.setCropped(payloadBytes);
     capture.setPipeline(null);
+    capture.setRecognitionId(null);
     capture.setUploading(true);
 
     try {
@@ -158,6 +159,7 @@ class _ScanPageState extends State<ScanPage> {
       );
       capture.setPrediction(response.prediction, response.accuracy);
       capture.setPipeline(response.pipeline);
+      capture.setRecognitionId(response.recognitionId);
 
       if (!mounted) return;
       await Navigator.push(
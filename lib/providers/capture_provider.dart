@@ -12,6 +12,7 @@ class CaptureProvider extends ChangeNotifier {
   String? _captureSource;
   DateTime? _predictionTimestamp;
   RecognitionPipeline? _pipeline;
+  String? _recognitionId;
 
   Uint8List? get originalBytes => _originalBytes;
   Uint8List? get croppedBytes => _croppedBytes;
@@ -22,6 +23,7 @@ class CaptureProvider extends ChangeNotifier {
   String? get captureSource => _captureSource;
   DateTime? get predictionTimestamp => _predictionTimestamp;
   RecognitionPipeline? get pipeline => _pipeline;
+  String? get recognitionId => _recognitionId;
 
   void setOriginal(Uint8List bytes) {
     _originalBytes = bytes;
@@ -50,6 +52,11 @@ class CaptureProvider extends ChangeNotifier {
     notifyListeners();
   }
 
+  void setRecognitionId(String? value) {
+    _recognitionId = value;
+    notifyListeners();
+  }
+
   void setUploading(bool value) {
     _isUploading = value;
     notifyListeners();
@@ -70,6 +77,7 @@ class CaptureProvider extends ChangeNotifier {
     _captureSource = null;
     _predictionTimestamp = null;
     _pipeline = null;
+    _recognitionId = null;
     notifyListeners();
   }
 }
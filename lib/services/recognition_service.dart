@@ -13,14 +13,20 @@ class RecognitionResponse {
     required this.prediction,
     required this.accuracy,
     required this.processingTimeMs,
+    this.recognitionId,
     this.imageUrl,
+    this.thumbnailUrl,
+    this.pipelineUrl,
     this.pipeline,
   });
 
   final String prediction;
   final double accuracy;
   final int processingTimeMs;
+  final String? recognitionId;
   final String? imageUrl;
+  final String? thumbnailUrl;
+  final String? pipelineUrl;
   final RecognitionPipeline? pipeline;
 
   factory RecognitionResponse.fromJson(Map<String, dynamic> json) {
@@ -28,7 +34,10 @@ class RecognitionResponse {
       prediction: json['prediction']?.toString() ?? '---',
       accuracy: (json['accuracy'] ?? 0).toDouble(),
       processingTimeMs: json['processing_time_ms'] ?? 0,
+      recognitionId: json['id']?.toString(),
       imageUrl: json['image_url']?.toString(),
+      thumbnailUrl: json['thumbnail_url']?.toString(),
+      pipelineUrl: json['pipeline_url']?.toString(),
       pipeline: json['pipeline'] is Map<String, dynamic>
           ? RecognitionPipeline.fromJson(
               json['pipeline'] as Map<String, dynamic>,
@@ -222,7 +231,10 @@ class RecognitionService {
     required Uint8List imageBytes,
     required String captureSource,
     Map<String, dynamic>? cropBox,
+    bool applyCropBox = false,
     String? deviceId,
+    String detail = 'summary',
+    bool storeDebug = true,
   }) async {
     _validateFileSize(imageBytes.lengthInBytes);
 
@@ -234,6 +246,9 @@ class RecognitionService {
         'capture_source': captureSource,
         'timestamp': DateTime.now().toIso8601String(),
         if (cropBox != null) 'crop_box': jsonEncode(cropBox),
+        if (cropBox != null && applyCropBox) 'apply_crop_box': 'true',
+        'detail': detail,
+        'store_debug': storeDebug.toString(),
         'image': MultipartFile.fromBytes(
           imageBytes,
           filename: fileName,
@@ -252,6 +267,36 @@ class RecognitionService {
     }
   }
 
+  /// Mengambil visualisasi pipeline yang disimpan server secara on-demand.
+  ///
+  /// Gambar tahap dikirim sebagai JPEG dengan sisi terpanjang
+  /// [imageMaxSide] agar payload kecil; pakai `imageFormat: 'png'` untuk
+  /// kualitas penuh.
+  Future<RecognitionPipeline> fetchPipeline(
+    String recognitionId, {
+    String detail = 'full',
+    String imageFormat = 'jpeg',
+    int? imageMaxSide = 720,
+  }) async {
+    try {
+      final response = await _dio.get(
+        '/recognitions/$recognitionId/pipeline',
+        queryParameters: {
+          'detail': detail,
+          'image_format': imageFormat,
+          if (imageMaxSide != null) 'image_max_side': imageMaxSide,
+        },
+      );
+      return RecognitionPipeline.fromJson(
+        response.data as Map<String, dynamic>,
+      );
+    } on DioException catch (error) {
+      throw RecognitionException(_mapDioError(error));
+    } catch (error) {
+      throw RecognitionException(error.toString());
+    }
+  }
+
   String _mapDioError(DioException error) {
     switch (error.type) {
       case DioExceptionType.connectionTimeout: